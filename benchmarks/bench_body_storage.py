@@ -0,0 +1,87 @@
+"""
+Benchmark index size and per-hit excerpt latency for each index.body_storage mode, on large documents.
+Also times the previous excerpt approach (re-analyzing each hit's stored body with the classic Highlighter) as a baseline.
+Requires PyLucene.
+
+Usage: python benchmarks/bench_body_storage.py [--docs 500] [--words 50000] [--queries 100]
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from sift.config import load_config
+from sift.lucene_manager import LuceneManager, make_document, BODY_STORAGE_MODES
+from org.apache.lucene.queryparser.classic import MultiFieldQueryParser
+from org.apache.lucene.search.highlight import SimpleHTMLFormatter, QueryScorer, Highlighter
+
+N_HITS = 10
+
+def make_vocabulary(size=20000, seed=0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def directory_size(path):
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+def reanalysis_excerpts(index_manager, terms):
+    """
+    Excerpts the way sift made them before offsets were indexed.
+    """
+    parser = MultiFieldQueryParser(['fullpath', 'body'], index_manager.analyzer)
+    query = MultiFieldQueryParser.parse(parser, terms)
+    highlighter = Highlighter(SimpleHTMLFormatter('*', '*'), QueryScorer(query))
+    excerpts = []
+    for result in index_manager.searcher.search(query, N_HITS).scoreDocs:
+        contents = index_manager.searcher.doc(result.doc)['body']
+        token_stream = index_manager.analyzer.tokenStream('body', contents)
+        excerpts.append(highlighter.getBestFragments(token_stream, contents, 3, '...'))
+    return excerpts
+
+def time_per_hit(search, queries):
+    latencies = []
+    for terms in queries:
+        start = time.perf_counter()
+        n_results = len(search(terms))
+        if n_results:
+            latencies.append((time.perf_counter() - start) * 1000 / n_results)
+    return statistics.median(latencies)
+
+def run(body_storage, n_docs, n_words, queries, vocabulary):
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as root:
+        config = load_config(root, ['index.body_storage=%s' % body_storage])
+        with LuceneManager(root, config=config) as index_manager:
+            for i in range(n_docs):
+                body = ' '.join(rng.choice(vocabulary) for _ in range(n_words))
+                index_manager.insert(make_document('docs/%05d.txt' % i, time.time(), body, store_body=body_storage != 'none'))
+            index_manager.commit()
+        size_mb = directory_size(Path(root).joinpath('.siftindex', 'index')) / 1024 / 1024
+        with LuceneManager(root, read_only=True, config=config) as index_manager:
+            ms_per_hit = time_per_hit(lambda terms: index_manager.search(terms, N_HITS), queries)
+            baseline_ms_per_hit = None
+            if body_storage != 'none':
+                baseline_ms_per_hit = time_per_hit(lambda terms: reanalysis_excerpts(index_manager, terms), queries)
+    return size_mb, ms_per_hit, baseline_ms_per_hit
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=500)
+    parser.add_argument('--words', type=int, default=50000, help='Words per document')
+    parser.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+
+    vocabulary = make_vocabulary()
+    rng = random.Random(2)
+    queries = [' '.join(rng.choice(vocabulary) for _ in range(2)) for _ in range(args.queries)]
+    print('%12s %10s %16s %22s' % ('body_storage', 'index MB', 'ms/hit (offsets)', 'ms/hit (re-analysis)'))
+    for body_storage in BODY_STORAGE_MODES:
+        size_mb, ms_per_hit, baseline_ms_per_hit = run(body_storage, args.docs, args.words, queries, vocabulary)
+        print('%12s %10.1f %16.3f %22s' % (body_storage, size_mb, ms_per_hit,
+                                           '-' if baseline_ms_per_hit is None else '%.3f' % baseline_ms_per_hit))
+
+if __name__ == '__main__':
+    main()
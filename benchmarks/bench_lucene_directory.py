@@ -0,0 +1,64 @@
+"""
+Benchmark indexing throughput and query latency across Lucene Directory implementations and writer settings.
+Requires PyLucene.
+
+Usage: python benchmarks/bench_lucene_directory.py [--docs 20000] [--queries 500] [--directories mmap nio simple]
+                                                   [-c index.ram_buffer_mb=256 ...]
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from sift.config import load_config
+from sift.lucene_manager import LuceneManager, make_document, DIRECTORY_TYPES
+
+WORDS_PER_DOC = 500
+
+def make_vocabulary(size=20000, seed=0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(directory_type, overrides, n_docs, n_queries, vocabulary):
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as root:
+        config = load_config(root, ['index.directory=%s' % directory_type] + overrides)
+        with LuceneManager(root, config=config) as index_manager:
+            start = time.perf_counter()
+            for i in range(n_docs):
+                body = ' '.join(rng.choice(vocabulary) for _ in range(WORDS_PER_DOC))
+                index_manager.insert(make_document('docs/%07d.txt' % i, time.time(), body))
+            index_manager.commit()
+            index_seconds = time.perf_counter() - start
+
+        with LuceneManager(root, read_only=True, config=config) as index_manager:
+            latencies = []
+            for _ in range(n_queries):
+                terms = ' '.join(rng.choice(vocabulary) for _ in range(2))
+                start = time.perf_counter()
+                index_manager.search(terms)
+                latencies.append((time.perf_counter() - start) * 1000)
+    return n_docs / index_seconds, statistics.median(latencies), percentile(latencies, 0.95)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--directories', nargs='+', default=['mmap', 'nio', 'simple'], choices=list(DIRECTORY_TYPES))
+    parser.add_argument('-c', dest='overrides', action='append', default=[], help='Writer settings, e.g. index.ram_buffer_mb=256')
+    args = parser.parse_args()
+
+    vocabulary = make_vocabulary()
+    print('%10s %12s %14s %14s' % ('directory', 'docs/s', 'query p50 ms', 'query p95 ms'))
+    for directory_type in args.directories:
+        docs_per_second, p50, p95 = run(directory_type, args.overrides, args.docs, args.queries, vocabulary)
+        print('%10s %12.0f %14.2f %14.2f' % (directory_type, docs_per_second, p50, p95))
+
+if __name__ == '__main__':
+    main()
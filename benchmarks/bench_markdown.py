@@ -0,0 +1,72 @@
+"""
+Benchmark Markdown importer throughput: in-process MarkdownImporter against PandocImporter
+(one pandoc per file, and batches through pandoc-server if it is installed).
+Runs over the notes in a directory, or over synthetic notes.
+
+Usage: python benchmarks/bench_markdown.py [--dir path/to/notes] [--notes 300]
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from sift.importers.markdown_importer import MarkdownImporter
+from sift.importers.pandoc_importer import PandocImporter, get_server_url
+
+NOTE = '''# Note {i}
+
+Some **bold** text, some _emphasis_, a [link](http://example.com/{i}) and `code`.
+
+* item one
+* item two with ![an image](image{i}.png)
+
+```
+code block {i}
+```
+
+> a quote about {word}
+'''
+
+def make_notes(root, n_notes):
+    rng = random.Random(0)
+    words = ['apple', 'banana', 'cherry', 'lucene', 'pandoc', 'sift']
+    files = []
+    for i in range(n_notes):
+        files.append(Path(root).joinpath('%05d.md' % i))
+        files[-1].write_text(NOTE.format(i=i, word=rng.choice(words)) * rng.randint(1, 10))
+    return files
+
+def run(convert, files):
+    start = time.perf_counter()
+    n_chars = sum(len(text) for text in convert([str(f) for f in files]))
+    return len(files) / (time.perf_counter() - start), n_chars
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', help='Directory of .md notes (searched recursively)')
+    parser.add_argument('--notes', type=int, default=300, help='Number of synthetic notes, if no --dir')
+    args = parser.parse_args()
+
+    importers = [('markdown', lambda paths: [MarkdownImporter().run(p) for p in paths])]
+    if shutil.which('pandoc'):
+        importers.append(('pandoc', lambda paths: [PandocImporter().run(p) for p in paths]))
+        if get_server_url() is not None:
+            batch_size = PandocImporter.batch_size
+            importers.append(('pandoc-server', lambda paths: [
+                text for i in range(0, len(paths), batch_size) for text in PandocImporter().run_batch(paths[i:i + batch_size])]))
+    else:
+        print('pandoc not found; only benchmarking MarkdownImporter')
+
+    with tempfile.TemporaryDirectory() as root:
+        files = sorted(Path(args.dir).rglob('*.md')) if args.dir else make_notes(root, args.notes)
+        print('%14s %12s %10s %14s' % ('importer', 'files/s', 'speedup', 'chars'))
+        baseline = None
+        for name, convert in reversed(importers):
+            files_per_second, n_chars = run(convert, files)
+            baseline = baseline or files_per_second
+            print('%14s %12.1f %9.1fx %14d' % (name, files_per_second, files_per_second / baseline, n_chars))
+
+if __name__ == '__main__':
+    main()
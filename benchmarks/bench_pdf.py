@@ -0,0 +1,57 @@
+"""
+Benchmark PDF import throughput through `sift update --jobs N`: PdfImporter (pypdf, in worker processes)
+against PdftotextImporter (one pdftotext process per file), with one job and with --jobs jobs.
+Runs over the PDFs in a directory, or over copies of the test PDF (many small files, the case where process starts dominate).
+Each run indexes a fresh copy of the files, so it includes index writes and commits. Requires PyLucene.
+
+Usage: python benchmarks/bench_pdf.py [--dir path/to/pdfs] [--copies 500] [--jobs 8]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SAMPLE_PDF = Path(__file__).parent.parent.joinpath('tests', 'test_importers', 'input2.pdf')
+
+def sift_command(root, *args):
+    return [sys.executable, '-m', 'sift.main', '--path', root] + list(args)
+
+def run(files, importer_name, jobs):
+    """
+    Files per second indexing a copy of [files] with sift update.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        for i, f in enumerate(files):
+            shutil.copy(str(f), os.path.join(root, '%05d.pdf' % i))
+        subprocess.run(sift_command(root, 'init'), check=True, stdout=subprocess.DEVNULL)
+        start = time.perf_counter()
+        subprocess.run(sift_command(root, '-c', 'importers.pdf=%s' % importer_name, 'update', '--jobs', str(jobs)),
+                       check=True, stdout=subprocess.DEVNULL)
+        return len(files) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', help='Directory of PDFs (searched recursively)')
+    parser.add_argument('--copies', type=int, default=500, help='Copies of the test PDF, if no --dir')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    importer_names = ['pdf']
+    if shutil.which('pdftotext'):
+        importer_names.append('pdftotext')
+    else:
+        print('pdftotext not found; only benchmarking PdfImporter')
+    files = sorted(Path(args.dir).rglob('*.pdf')) if args.dir else [SAMPLE_PDF] * args.copies
+
+    print('%12s %6s %12s' % ('importer', 'jobs', 'files/s'))
+    for importer_name in importer_names:
+        for jobs in sorted({1, args.jobs}):
+            print('%12s %6d %12.1f' % (importer_name, jobs, run(files, importer_name, jobs)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark work plan construction on a synthetic index, without touching the file system:
+turning scan results into records, diffing them against the last index details, and saving the new metadata.
+
+Usage: python benchmarks/bench_plan.py [--files 1000000] [--changed 0.01]
+"""
+
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from sift import metadata_manager
+from sift.importers.registry import IMPORTER_REGISTRY
+from sift.status import plan_records, diff_work_between_plans, pending_changes, FileRecord
+
+EXTENSIONS = ['txt', 'md', 'pdf']
+
+def make_scan(n_files, changed, rng):
+    """
+    Scan results for n_files files, and the last index details they are compared to:
+    a [changed] fraction of files is new, deleted or modified, in equal parts.
+    """
+    scan = []
+    last_details = []
+    for i in range(n_files):
+        extension = EXTENSIONS[i % len(EXTENSIONS)]
+        fname = 'd%03d/d%05d/f%07d.%s' % (i // 100000, i // 1000, i, extension)
+        strategy = IMPORTER_REGISTRY[extension]
+        roll = rng.random()
+        if roll < changed / 3:
+            scan.append((fname, extension, 2.0))  # new
+        elif roll < changed * 2 / 3:
+            last_details.append(FileRecord(fname, 1.0, strategy.__name__, strategy.version, extension))  # deleted
+        else:
+            scan.append((fname, extension, 2.0 if roll < changed else 1.0))
+            last_details.append(FileRecord(fname, 1.0, strategy.__name__, strategy.version, extension))
+    return scan, last_details
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print('%-22s %8.3f s' % (label, time.perf_counter() - start))
+    return result
+
+def count(iterable):
+    return sum(1 for _ in iterable)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--changed', type=float, default=0.01, help='Fraction of files new, deleted or modified')
+    args = parser.parse_args()
+
+    scan, last_details = make_scan(args.files, args.changed, random.Random(0))
+    print('%d files, %d last index details' % (len(scan), len(last_details)))
+    # streamed, like sift status and sift update consume them
+    timed('plan', lambda: count(plan_records(scan, IMPORTER_REGISTRY)))
+    n_changes = timed('plan + diff', lambda: count(pending_changes(diff_work_between_plans(last_details, plan_records(scan, IMPORTER_REGISTRY)))))
+    print('%d changes' % n_changes)
+    tracemalloc.start()
+    count(pending_changes(diff_work_between_plans(last_details, plan_records(scan, IMPORTER_REGISTRY))))
+    print('%-22s %8.1f MB' % ('peak memory of diff', tracemalloc.get_traced_memory()[1] / 1e6))
+    tracemalloc.stop()
+
+    changes = list(pending_changes(diff_work_between_plans(last_details, plan_records(scan, IMPORTER_REGISTRY))))
+    with tempfile.TemporaryDirectory() as root:
+        metadata_manager.create_index(root)
+        with metadata_manager.open_store(root) as store:
+            timed('save all metadata', lambda: (store.upsert(last_details), store.commit()))
+            timed('stream all metadata', lambda: count(store.iter_details()))
+            # what sift update writes: records of changed files, names of deleted ones
+            timed('save changes', lambda: (
+                store.upsert(change.new for change in changes if change.new is not None),
+                store.delete(change.fname for change in changes if change.new is None),
+                store.commit()))
+
+if __name__ == '__main__':
+    main()
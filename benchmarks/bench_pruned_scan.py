@@ -0,0 +1,52 @@
+"""
+Benchmark scans of a mostly unchanged tree: a full scan_tree() walk against scan_tree_pruned(),
+which only lists directories whose modified time changed since the last scan.
+
+Usage: python benchmarks/bench_pruned_scan.py [--sizes 10000 100000 1000000] [--changes 20]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from sift.scanner import scan_tree, scan_tree_pruned
+from sift.importers.registry import IMPORTER_REGISTRY
+from bench_scan import make_tree, FILES_PER_DIR
+
+def age_directories(root):
+    """Set directory modified times in the past, so the pruned scan trusts them."""
+    past = time.time() - 100
+    for directory, _, __ in os.walk(root):
+        os.utime(directory, (past, past))
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    results = list(fn(*args))
+    return time.perf_counter() - start, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--changes', type=int, default=20, help='New files added between scans, one per directory')
+    args = parser.parse_args()
+
+    extensions = IMPORTER_REGISTRY.keys()
+    print('%10s %12s %12s %10s' % ('files', 'full (s)', 'pruned (s)', 'speedup'))
+    for n_files in args.sizes:
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, n_files)
+            age_directories(root)
+            known_directories = {}
+            known_files = [(fname, last_mod) for fname, _, last_mod in scan_tree_pruned(root, extensions, {}, [], known_directories)]
+            directories = sorted(d for d in known_directories if d.count(os.sep) > root.count(os.sep) + 2)
+            for i, directory in enumerate(directories[:args.changes]):
+                Path(directory).joinpath('new%d.txt' % i).touch()
+
+            full_time, full_results = timed(scan_tree, root, extensions)
+            pruned_time, pruned_results = timed(scan_tree_pruned, root, extensions, known_directories, known_files, {})
+            assert [r[0] for r in pruned_results] == [r[0] for r in full_results]
+            print('%10d %12.3f %12.3f %9.1fx' % (n_files, full_time, pruned_time, full_time / pruned_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark the end-to-end latency of `sift query` as a command, the way a user or script runs it:
+searching in-process (JVM startup and opening the index each time), and answered by a running `sift serve`.
+Also times importing sift.main, the floor under both.
+Requires PyLucene.
+
+Usage: python benchmarks/bench_query_latency.py [--docs 2000] [--queries 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from sift.server import get_socket_path
+
+WORDS_PER_DOC = 200
+SERVER_START_SECONDS = 60
+
+def make_vocabulary(size=5000, seed=0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def sift_command(root, *args):
+    return [sys.executable, '-m', 'sift.main', '--path', root] + list(args)
+
+def time_commands(commands):
+    latencies = []
+    for command in commands:
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), percentile(latencies, 0.95)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    vocabulary = make_vocabulary()
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, 'docs'))
+        for i in range(args.docs):
+            with open(os.path.join(root, 'docs', '%05d.txt' % i), 'w') as f:
+                f.write(' '.join(rng.choice(vocabulary) for _ in range(WORDS_PER_DOC)))
+        subprocess.run(sift_command(root, 'init'), check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(sift_command(root, 'update'), check=True, stdout=subprocess.DEVNULL)
+        queries = [sift_command(root, 'query', rng.choice(vocabulary), rng.choice(vocabulary)) for _ in range(args.queries)]
+
+        print('%22s %12s %12s' % ('', 'p50 ms', 'p95 ms'))
+        print('%22s %12.1f %12.1f' % (('import sift.main',) + time_commands([[sys.executable, '-c', 'import sift.main']] * args.queries)))
+        print('%22s %12.1f %12.1f' % (('in-process',) + time_commands(queries)))
+
+        server = subprocess.Popen(sift_command(root, 'serve'), stdout=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + SERVER_START_SECONDS
+            while not get_socket_path(root).exists():
+                assert server.poll() is None and time.monotonic() < deadline, 'sift serve did not start'
+                time.sleep(0.1)
+            print('%22s %12.1f %12.1f' % (('sift serve',) + time_commands(queries)))
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark tree scanning on synthetic trees.
+Compares the single-pass os.scandir() walk in sift.scanner against the old per-extension Path.glob() approach.
+
+Usage: python benchmarks/bench_scan.py [--sizes 10000 100000 1000000] [--skip-glob]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from sift.scanner import scan_tree, IGNORE_PATHS
+from sift.importers.registry import IMPORTER_REGISTRY
+
+FILES_PER_DIR = 1000
+EXTENSIONS = ['txt', 'md', 'pdf', 'jpg']  # jpg is not whitelisted
+
+def make_tree(root, n_files):
+    """
+    Create n_files empty files, FILES_PER_DIR per directory, two directory levels deep.
+    """
+    for i in range(n_files):
+        if i % FILES_PER_DIR == 0:
+            directory = Path(root).joinpath('d%03d' % (i // (FILES_PER_DIR * 100)), 'd%05d' % (i // FILES_PER_DIR))
+            directory.mkdir(parents=True, exist_ok=True)
+        directory.joinpath('f%07d.%s' % (i, EXTENSIONS[i % len(EXTENSIONS)])).touch()
+    # an ignored index directory with content that should not be walked
+    ignored = Path(root).joinpath('.siftindex')
+    ignored.mkdir()
+    for i in range(FILES_PER_DIR):
+        ignored.joinpath('f%d.txt' % i).touch()
+
+def scan_with_glob(base_path, extensions, ignore_paths=IGNORE_PATHS):
+    """
+    The previous approach: one recursive glob per extension, then is_file() and stat() per hit.
+    """
+    results = []
+    for extension in extensions:
+        for path in Path(base_path).glob('**/*.%s' % extension):
+            if path.is_file() and not any(part in ignore_paths for part in path.parts):
+                results.append((str(path), extension, path.stat().st_mtime))
+    return results
+
+def scan_with_scandir(base_path, extensions):
+    return list(scan_tree(base_path, extensions))
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    n_results = len(fn(*args))
+    return time.perf_counter() - start, n_results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--skip-glob', dest='skip_glob', action='store_true', help='Only time the scandir walk')
+    args = parser.parse_args()
+
+    print('%10s %12s %12s %10s' % ('files', 'glob (s)', 'scandir (s)', 'speedup'))
+    for n_files in args.sizes:
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, n_files)
+            scandir_time, n_scandir = timed(scan_with_scandir, root, IMPORTER_REGISTRY.keys())
+            if args.skip_glob:
+                print('%10d %12s %12.3f %10s' % (n_files, '-', scandir_time, '-'))
+                continue
+            glob_time, n_glob = timed(scan_with_glob, root, IMPORTER_REGISTRY.keys())
+            assert n_glob == n_scandir, (n_glob, n_scandir)
+            print('%10d %12.3f %12.3f %9.1fx' % (n_files, glob_time, scandir_time, glob_time / scandir_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark query latency on an index with many segments: single-threaded search, segments searched in parallel
+(search.threads), and single-threaded search after `sift optimize` merged the segments.
+Requires PyLucene.
+
+Usage: python benchmarks/bench_search_threads.py [--docs 200000] [--segments 40] [--queries 500] [--threads 8]
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from sift.config import load_config
+from sift.lucene_manager import LuceneManager, make_document
+
+WORDS_PER_DOC = 200
+
+def make_vocabulary(size=20000, seed=0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def time_queries(root, overrides, queries):
+    with LuceneManager(root, read_only=True, config=load_config(root, overrides)) as index_manager:
+        latencies = []
+        for terms in queries:
+            start = time.perf_counter()
+            index_manager.search(terms, n_hits=10)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return index_manager.segment_count(), statistics.median(latencies), percentile(latencies, 0.99)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=200000)
+    parser.add_argument('--segments', type=int, default=40)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    vocabulary = make_vocabulary()
+    rng = random.Random(1)
+    queries = [' '.join(rng.choice(vocabulary) for _ in range(2)) for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory() as root:
+        # one flush per segment, and no merges, to get the requested number of segments
+        build_overrides = ['index.max_buffered_docs=%d' % max(2, args.docs // args.segments), 'index.merge_policy=log_doc',
+                           'index.ram_buffer_mb=1024']
+        with LuceneManager(root, config=load_config(root, build_overrides)) as index_manager:
+            index_manager.writer.getConfig().getMergePolicy().setMergeFactor(args.segments * 2)
+            for i in range(args.docs):
+                body = ' '.join(rng.choice(vocabulary) for _ in range(WORDS_PER_DOC))
+                index_manager.insert(make_document('docs/%07d.txt' % i, time.time(), body))
+            index_manager.commit()
+
+        print('%22s %9s %12s %12s' % ('', 'segments', 'p50 ms', 'p99 ms'))
+        for name, overrides in [('1 thread', []), ('%d threads' % args.threads, ['search.threads=%d' % args.threads])]:
+            print('%22s %9d %12.2f %12.2f' % ((name,) + time_queries(root, overrides, queries)))
+
+        with LuceneManager(root, config=load_config(root)) as index_manager:
+            start = time.perf_counter()
+            index_manager.optimize()
+            print('optimize took %.1f s' % (time.perf_counter() - start))
+        print('%22s %9d %12.2f %12.2f' % (('optimized, 1 thread',) + time_queries(root, [], queries)))
+
+if __name__ == '__main__':
+    main()
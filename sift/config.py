@@ -0,0 +1,112 @@
+import configparser
+from pathlib import Path
+
+"""
+Per-index settings, read from .siftindex/config (INI format).
+Any setting can be overridden for one command with `sift -c section.key=value ...`, and saved with `sift config section.key value`.
+"""
+
+DEFAULT_CONFIG_FILENAME = '.siftindex/config'
+
+DEFAULTS = {
+    'index': {
+        # Lucene Directory implementation: mmap, nio, simple, or fs (let Lucene pick for this platform)
+        'directory': 'mmap',
+        # IndexWriter flushes a new segment when buffered documents use this much RAM
+        'ram_buffer_mb': '64',
+        # ... or when this many documents are buffered (-1 to flush by RAM usage only)
+        'max_buffered_docs': '-1',
+        # tiered, log_byte_size, or log_doc
+        'merge_policy': 'tiered',
+        'use_compound_file': 'true',
+        # keep document text in the index for search excerpts: full, compressed (smaller index, slower excerpts), or none (no excerpts)
+        'body_storage': 'full',
+        # index at most this much text of each file; importers stop reading huge files there
+        'max_indexed_mb': '64',
+    },
+    'search': {
+        # search index segments in parallel on this many threads (0: one thread, searching segments in turn)
+        'threads': '0',
+    },
+    'importers': {
+        # importer per file extension. md: markdown (strips markup in process, fast) or pandoc (faithful rendering, slow)
+        'md': 'markdown',
+    },
+    'status': {
+        # fingerprint new and changed files, so files whose modified time changed but content didn't skip re-importing
+        'content_hash': 'false',
+        # only list directories whose modified time changed since the last update. Faster on large trees,
+        # but files rewritten in place (which don't touch their directory) go unnoticed until a --full scan
+        'prune_directories': 'false',
+    },
+    'cache': {
+        # cache importer output by content hash, so rebuilds and moved or copied files skip importers.
+        # auto: only with status.content_hash on, since otherwise every import reads its file twice, once just to hash it
+        'enabled': 'auto',
+        'max_mb': '1024',
+    },
+    'query_cache': {
+        # cache search results in .siftindex/query_cache.db until the index changes
+        'enabled': 'true',
+        'max_entries': '1000',
+    },
+    'update': {
+        # sift update commits (index and metadata together) after this many files, or this many seconds, whichever comes first
+        'commit_every_docs': '1000',
+        'commit_every_seconds': '60',
+    },
+    'watch': {
+        # sift watch applies changes once files have been quiet for this long
+        'debounce_seconds': '1',
+        # ... and checks the whole tree for changes it missed this often (and on start)
+        'reconcile_seconds': '3600',
+    },
+}
+
+def get_config_path(index_loc, config_filename=DEFAULT_CONFIG_FILENAME):
+    return Path(index_loc).joinpath(config_filename)
+
+def parse_override(override):
+    """
+    Parse "section.key=value" into (section, key, value).
+    """
+    name, separator, value = override.partition('=')
+    section, dot, key = name.strip().partition('.')
+    if not separator or not dot or not section or not key:
+        raise ValueError('Expected section.key=value, got: %s' % override)
+    return section, key, value.strip()
+
+def load_config(index_loc, overrides=(), config_filename=DEFAULT_CONFIG_FILENAME):
+    """
+    Returns a ConfigParser with defaults, then the index's config file, then overrides ("section.key=value" strings) applied.
+    """
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULTS)
+    config.read(str(get_config_path(index_loc, config_filename)))
+    for override in overrides:
+        section, key, value = parse_override(override)
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, key, value)
+    return config
+
+def save_setting(index_loc, name, value, config_filename=DEFAULT_CONFIG_FILENAME):
+    """
+    Write "section.key" = value to the index's config file, keeping its other settings.
+    """
+    section, key, value = parse_override('%s=%s' % (name, value))
+    path = get_config_path(index_loc, config_filename)
+    config = configparser.ConfigParser()
+    config.read(str(path))
+    if not config.has_section(section):
+        config.add_section(section)
+    config.set(section, key, value)
+    with open(str(path), 'w') as f:
+        config.write(f)
+
+def format_config(config):
+    return '\n'.join(
+        '%s.%s=%s' % (section, key, value)
+        for section in config.sections()
+        for key, value in config.items(section)
+    )
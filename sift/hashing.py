@@ -0,0 +1,30 @@
+import hashlib
+
+"""
+Content fingerprints, to tell files whose bytes changed from files that were only touched.
+Uses xxhash (XXH3-128) if it is installed, otherwise BLAKE2b from the standard library.
+Fingerprints are prefixed with the algorithm name, so fingerprints from different algorithms never match.
+"""
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+CHUNK_SIZE = 1024 * 1024
+
+def _new_hasher():
+    if xxhash is not None:
+        return 'xxh3_128', xxhash.xxh3_128()
+    return 'blake2b', hashlib.blake2b(digest_size=16)
+
+def file_hash(full_path):
+    """
+    Fingerprint of the file's contents, e.g. "blake2b:<hex digest>".
+    Reads in large chunks, so hashing threads mostly run outside the GIL (hashlib releases it for large inputs).
+    """
+    name, hasher = _new_hasher()
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return '%s:%s' % (name, hasher.hexdigest())
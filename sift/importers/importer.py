@@ -1,6 +1,13 @@
+# characters per chunk when streaming text files
+CHUNK_CHARS = 1024 * 1024
+
 class Importer(object):
     # semver
     version = 0.
+    # number of files update() passes to run_batch() at once; 1 to call run() on each file
+    batch_size = 1
+    # keep at most this much text (UTF-8) of each file; update() sets it from index.max_indexed_mb, None for no limit
+    max_bytes = None
 
     def read_file(self, full_path):
         """
@@ -11,8 +18,56 @@ class Importer(object):
         with open(full_path, 'r', encoding="ascii", errors="surrogateescape") as f:
             return f.read()
 
+    def read_file_chunks(self, full_path, chunk_chars=CHUNK_CHARS):
+        """
+        Generator over the contents of file at [full_path], [chunk_chars] characters at a time. Decoded like read_file().
+        """
+        with open(full_path, 'r', encoding="ascii", errors="surrogateescape") as f:
+            yield from iter(lambda: f.read(chunk_chars), '')
+
     def run(self, full_path):
         """
         Returns file contents ready for indexing. Not yet a packaged Lucene document.
         """
         pass
+
+    def run_stream(self, full_path):
+        """
+        Generator over chunks of file contents ready for indexing.
+        update() stops reading at max_bytes, so override to keep memory bounded for huge files.
+        Default: run() as one chunk.
+        """
+        yield self.run(full_path)
+
+    def run_batch(self, full_paths):
+        """
+        Returns a list with, for each of [full_paths], its contents ready for indexing, or the exception raised importing it.
+        Override (and raise batch_size) to share per-call costs, like starting a converter process, across many files.
+        """
+        results = []
+        for full_path in full_paths:
+            try:
+                results.append(self.run(full_path))
+            except Exception as error:
+                results.append(error)
+        return results
+
+def limit_text(chunks, max_bytes=None):
+    """
+    Concatenate text chunks, up to max_bytes (UTF-8) if given. Stops reading chunks at the limit and closes the chunk generator.
+    """
+    kept = []
+    remaining_bytes = max_bytes
+    try:
+        for chunk in chunks:
+            if remaining_bytes is not None:
+                encoded = chunk.encode('utf-8', errors='surrogateescape')
+                if len(encoded) >= remaining_bytes:
+                    kept.append(encoded[:remaining_bytes].decode('utf-8', errors='ignore'))
+                    break
+                remaining_bytes -= len(encoded)
+            kept.append(chunk)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return ''.join(kept)
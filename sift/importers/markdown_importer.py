@@ -0,0 +1,88 @@
+from .importer import Importer
+import re
+
+"""
+Strips Markdown markup in process, line by line, keeping the text: headings, emphasis, links and lists become plain words.
+Much faster than PandocImporter for notes, at the cost of pandoc's faithful parsing of every Markdown extension.
+Choose between them with the importers.md setting.
+
+Like https://github.com/remarkjs/strip-markdown, but a line-based tokenizer rather than a full parser:
+each input line becomes one output line, so memory use doesn't depend on file size.
+"""
+
+FENCE = re.compile(r'^\s{0,3}(`{3,}|~{3,})')
+# horizontal rules, and setext heading underlines
+RULE = re.compile(r'^\s{0,3}([-*_=])(\s*\1){2,}\s*$')
+LINK_DEFINITION = re.compile(r'^\s{0,3}\[[^\]]+\]:\s*\S+')
+TABLE_DELIMITER = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)+\|?\s*$')
+ATX_HEADING = re.compile(r'^\s{0,3}#{1,6}(\s+|$)')
+ATX_CLOSING = re.compile(r'\s+#+\s*$')
+BLOCKQUOTE = re.compile(r'^\s{0,3}(>\s?)+')
+LIST_MARKER = re.compile(r'^(\s*)([-*+]|\d{1,9}[.)])\s+(\[[ xX]\]\s+)?')
+
+# applied in order to the text of each line
+INLINE_RULES = [
+    (re.compile(r'(`+)(.+?)\1'), r'\2'), # code spans
+    (re.compile(r'!\[([^\]]*)\]\([^)]*\)'), r'\1'), # images: keep alt text
+    (re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'), # links: keep link text
+    (re.compile(r'\[([^\]]*)\]\[[^\]]*\]'), r'\1'), # reference links
+    (re.compile(r'<((?:https?|ftp|mailto):[^>\s]+)>'), r'\1'), # autolinks
+    (re.compile(r'</?[A-Za-z][^>]*>'), ''), # html tags
+    (re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1'), r'\2'), # strong
+    (re.compile(r'\*(?=\S)(.+?)(?<=\S)\*'), r'\1'), # emphasis
+    (re.compile(r'(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)'), r'\1'), # emphasis, not inside words like snake_case
+    (re.compile(r'~~(.+?)~~'), r'\1'), # strikethrough
+]
+
+# backslash-escaped characters are swapped for private use code points while markup is stripped, then restored
+ESCAPE = re.compile(r'\\([\\`*_{}\[\]()#+\-.!|>~])')
+ESCAPE_OFFSET = 0xE000
+ESCAPED = re.compile('[%s-%s]' % (chr(ESCAPE_OFFSET), chr(ESCAPE_OFFSET + 127)))
+
+def strip_line(line):
+    """
+    Text of one line outside code blocks.
+    """
+    if RULE.match(line) or LINK_DEFINITION.match(line) or TABLE_DELIMITER.match(line):
+        return ''
+    line = ESCAPE.sub(lambda match: chr(ESCAPE_OFFSET + ord(match.group(1))), line)
+    line = BLOCKQUOTE.sub('', line)
+    if ATX_HEADING.match(line):
+        line = ATX_CLOSING.sub('', ATX_HEADING.sub('', line))
+    line = LIST_MARKER.sub(r'\1', line)
+    if line.lstrip().startswith('|'):
+        # table row
+        line = line.replace('|', ' ').strip()
+    for pattern, replacement in INLINE_RULES:
+        line = pattern.sub(replacement, line)
+    return ESCAPED.sub(lambda match: chr(ord(match.group(0)) - ESCAPE_OFFSET), line)
+
+def strip_markdown(lines):
+    """
+    Generator over the text of each line in [lines]. Code block contents are kept as is, without the fences.
+    """
+    fence = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        match = FENCE.match(line)
+        if fence is None and match:
+            fence = match.group(1)
+            yield ''
+        elif fence is not None:
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence):
+                fence = None
+                yield ''
+            else:
+                yield line
+        else:
+            yield strip_line(line)
+
+class MarkdownImporter(Importer):
+    version = 1.
+    def run(self, full_path):
+        return ''.join(self.run_stream(full_path))
+
+    def run_stream(self, full_path):
+        with open(full_path, 'r', encoding="ascii", errors="surrogateescape") as f:
+            for line_number, line in enumerate(strip_markdown(f)):
+                yield line if line_number == 0 else '\n' + line
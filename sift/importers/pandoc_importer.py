@@ -1,5 +1,14 @@
 from .importer import Importer
-import pypandoc
+import atexit
+import base64
+import json
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import urllib.request
+from pathlib import Path
 
 """
 Runs pandoc on input file to convert to plain text.
@@ -17,13 +26,146 @@ Ref:
 * https://stackoverflow.com/a/34139581/130164
 
 In future consider https://github.com/remarkjs/strip-markdown
+
+Starting pandoc (a Haskell runtime) costs more than converting a typical small note.
+So if pandoc-server (pandoc >= 3) is installed, batches of files are converted by one long-lived pandoc-server process,
+started on first use on a local port and shared by all importer threads. Otherwise each file runs its own pandoc.
 """
 
+PANDOC_SERVER = 'pandoc-server'
+
+# pandoc reader for each extension converted through pandoc-server; other files are converted one by one
+READERS = {
+    'md': 'markdown',
+    'tex': 'latex',
+    'latex': 'latex',
+    'html': 'html',
+    'docx': 'docx',
+    'epub': 'epub',
+}
+# pandoc-server takes these formats base64-encoded
+BINARY_READERS = {'docx', 'epub'}
+
+SERVER_START_TIMEOUT_SECONDS = 10
+# the free port picked for pandoc-server can be taken before it binds it: then start again on another one
+SERVER_START_ATTEMPTS = 3
+REQUEST_TIMEOUT_SECONDS = 300
+
+_server_lock = threading.Lock()
+_server = None # (process, url) once started, (None, None) if pandoc-server is unavailable
+
+def _start_server():
+    executable = shutil.which(PANDOC_SERVER)
+    if executable is None:
+        return None, None
+    for _ in range(SERVER_START_ATTEMPTS):
+        process, url = _start_server_process(executable)
+        if process is not None:
+            return process, url
+    return None, None
+
+def _start_server_process(executable):
+    """
+    Start pandoc-server on a free local port and wait until it answers. Returns (process, url), or (None, None) if it didn't start.
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([executable, '--port', str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    atexit.register(process.terminate)
+    url = 'http://127.0.0.1:%d' % port
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            version = urllib.request.urlopen(url + '/version', timeout=1).read()
+        except OSError:
+            time.sleep(0.05)
+            continue
+        # pandoc-server exits if it can't bind the port: an answer while it still runs is its own, not another process's
+        if process.poll() is None and version.strip(b'" \n')[:1].isdigit():
+            return process, url
+        break
+    process.terminate()
+    return None, None
+
+def get_server_url():
+    """
+    URL of the shared pandoc-server, started (or restarted, if it died) as needed. None if pandoc-server is unavailable.
+    """
+    global _server
+    with _server_lock:
+        if _server is None or (_server[0] is not None and _server[0].poll() is not None):
+            _server = _start_server()
+        return _server[1]
+
+def _post(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json', 'Accept': 'application/json'})
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def _output(result):
+    if 'error' in result:
+        raise RuntimeError('pandoc-server: %s' % result['error'])
+    return result['output']
+
 class PandocImporter(Importer):
     version = 1.
+    batch_size = 32
+
     def run(self, full_path):
+        # imported here, not at module load, like pypdf in pdf_importer
+        import pypandoc
         return pypandoc.convert_file(
             full_path,
             'plain',
             extra_args=['--base-header-level=2'] # avoids level 1 headers becoming ALL CAPS
         )
+
+    def make_params(self, full_path):
+        """
+        pandoc-server conversion parameters equivalent to run(), or None if the file's format isn't converted through pandoc-server.
+        """
+        reader = READERS.get(Path(full_path).suffix.lower().lstrip('.'))
+        if reader is None:
+            return None
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        text = base64.b64encode(data).decode('ascii') if reader in BINARY_READERS else data.decode('utf-8', errors='replace')
+        return {'text': text, 'from': reader, 'to': 'plain', 'shift-heading-level-by': 1}
+
+    def run_batch(self, full_paths):
+        url = get_server_url()
+        if url is None:
+            return super().run_batch(full_paths)
+        results = [None] * len(full_paths)
+        params = {}
+        for i, full_path in enumerate(full_paths):
+            try:
+                file_params = self.make_params(full_path)
+                if file_params is None:
+                    results[i] = self.run(full_path)
+                else:
+                    params[i] = file_params
+            except Exception as error:
+                results[i] = error
+        if not params:
+            return results
+        try:
+            # assumes /batch answers with one result per document, in order, like the single-document endpoint's
+            outputs = _post(url + '/batch', list(params.values()))
+        except (OSError, ValueError):
+            # the batch request failed as a whole (e.g. an HTTP error): convert one by one to isolate the bad file
+            outputs = []
+            for file_params in params.values():
+                try:
+                    outputs.append(_post(url, file_params))
+                except (OSError, ValueError) as error:
+                    outputs.append({'error': str(error)})
+        for i, result in zip(params, outputs):
+            try:
+                results[i] = _output(result)
+            except Exception as error:
+                results[i] = error
+        return results
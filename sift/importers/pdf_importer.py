@@ -1,8 +1,88 @@
-from .importer import Importer
+from .importer import Importer, CHUNK_CHARS
+import multiprocessing
+import os
 import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+"""
+PdfImporter extracts text with pypdf, page by page, in a pool of worker processes: pypdf is pure Python,
+so on update's importer threads it would hold the GIL and import one PDF at a time however many jobs run.
+PdftotextImporter runs poppler's pdftotext on each file; it handles more unusual PDFs but pays a process start per file,
+which dominates the cost of indexing many small PDFs. See benchmarks/bench_pdf.py.
+"""
+
+# pages are separated by form feeds, like pdftotext output
+PAGE_SEPARATOR = '\n\f'
+
+_pool = None # ProcessPoolExecutor, once started
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    The worker processes, started on first use: one per CPU.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawned, not forked: the parent runs the JVM and other importer threads
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def extract_text(full_path, max_bytes=None):
+    """
+    Text of each page, joined by PAGE_SEPARATOR, up to max_bytes (UTF-8) if given: later pages aren't read.
+    Runs in the worker processes.
+    """
+    # imported here, not at module load: sift query imports the registry, and shouldn't pay for pypdf
+    from pypdf import PdfReader
+    pages = []
+    remaining_bytes = max_bytes
+    for page in PdfReader(full_path, strict=False).pages:
+        text = (PAGE_SEPARATOR if pages else '') + (page.extract_text() or '')
+        if remaining_bytes is not None:
+            encoded = text.encode('utf-8', errors='surrogateescape')
+            if len(encoded) >= remaining_bytes:
+                pages.append(encoded[:remaining_bytes].decode('utf-8', errors='ignore'))
+                break
+            remaining_bytes -= len(encoded)
+        pages.append(text)
+    return ''.join(pages)
 
 class PdfImporter(Importer):
+    version = 2.
+
+    def run(self, full_path):
+        global _pool
+        pool = get_pool()
+        try:
+            return pool.submit(extract_text, full_path, self.max_bytes).result()
+        except BrokenProcessPool:
+            # a worker died (e.g. killed on a pathological file): this file fails, the next one gets a new pool
+            with _pool_lock:
+                if _pool is pool:
+                    _pool = None
+            raise
+
+class PdftotextImporter(Importer):
     version = 1.
     def run(self, full_path):
         return subprocess.run(
             ['pdftotext', '-q', full_path, '-'], stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+
+    def run_stream(self, full_path):
+        """
+        Reads pdftotext's output as it is written. pdftotext is killed if the reader stops early.
+        """
+        command = ['pdftotext', '-q', full_path, '-']
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            yield from iter(lambda: process.stdout.read(CHUNK_CHARS), '')
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            return_code = process.wait()
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, command)
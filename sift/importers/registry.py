@@ -1,15 +1,17 @@
 from .text_importer import TextImporter
 from .pandoc_importer import PandocImporter
-from .pdf_importer import PdfImporter
+from .pdf_importer import PdfImporter, PdftotextImporter
+from .markdown_importer import MarkdownImporter
 
 """
 Whitelist of acceptable file extensions is maintained here.
 Each extension is mapped to the importer strategy to be executed.
+The importers section of the index config can map an extension to another importer, by its name in IMPORTERS.
 """
 
 IMPORTER_REGISTRY = {
     'txt': TextImporter,
-    'md': PandocImporter,
+    'md': MarkdownImporter,
     'pdf': PdfImporter,
     'doc': PandocImporter,
     'docx': PandocImporter,
@@ -18,3 +20,23 @@ IMPORTER_REGISTRY = {
     'html': PandocImporter,
     'epub': PandocImporter,
 }
+
+IMPORTERS = {
+    'text': TextImporter,
+    'markdown': MarkdownImporter,
+    'pandoc': PandocImporter,
+    'pdf': PdfImporter,
+    'pdftotext': PdftotextImporter,
+}
+
+def get_registry(config=None):
+    """
+    IMPORTER_REGISTRY with the extensions of the config's importers section remapped.
+    """
+    registry = dict(IMPORTER_REGISTRY)
+    if config is not None and config.has_section('importers'):
+        for extension, importer_name in config.items('importers'):
+            if importer_name not in IMPORTERS:
+                raise ValueError('Unknown importer for .%s: %s (choose from %s)' % (extension, importer_name, ', '.join(IMPORTERS)))
+            registry[extension] = IMPORTERS[importer_name]
+    return registry
@@ -2,4 +2,6 @@ from .importer import Importer
 class TextImporter(Importer):
     version = 1.
     def run(self, full_path):
-        return self.read_file(full_path)
\ No newline at end of file
+        return self.read_file(full_path)
+    def run_stream(self, full_path):
+        return self.read_file_chunks(full_path)
@@ -1,23 +1,71 @@
 # from pylucene samples
+import math
 import os
 import lucene
 from java.nio.file import Paths
+from java.util import HashMap, HashSet
+from java.util.concurrent import Executors
 from org.apache.lucene.analysis.standard import StandardAnalyzer
 from org.apache.lucene.document import Document, Field, FieldType, TextField, LongPoint, StoredField, StringField
-from org.apache.lucene.index import FieldInfo, IndexWriter, IndexReader, IndexWriterConfig, IndexOptions, DirectoryReader, Term
-from org.apache.lucene.store import SimpleFSDirectory
-from org.apache.lucene.search import IndexSearcher, TermQuery, BooleanQuery, BooleanClause, MatchAllDocsQuery
+from org.apache.lucene.index import FieldInfo, IndexWriter, IndexReader, IndexWriterConfig, IndexOptions, DirectoryReader, Term, TieredMergePolicy, LogByteSizeMergePolicy, LogDocMergePolicy, SegmentInfos
+from org.apache.lucene.store import FSDirectory, MMapDirectory, NIOFSDirectory, SimpleFSDirectory, RAMDirectory
+from org.apache.lucene.search import IndexSearcher, TermQuery, BooleanQuery, BooleanClause, MatchAllDocsQuery, PrefixQuery, TopDocs
 from org.apache.lucene.queryparser.classic import QueryParser, MultiFieldQueryParser
 from org.apache.lucene.analysis.tokenattributes import CharTermAttribute
-from org.apache.lucene.search.highlight import SimpleHTMLFormatter, QueryScorer, Highlighter
+from org.apache.lucene.search.uhighlight import UnifiedHighlighter, DefaultPassageFormatter
+from org.apache.lucene.codecs.lucene70 import Lucene70Codec
+from org.apache.lucene.codecs.lucene50 import Lucene50StoredFieldsFormat
 from pathlib import Path
-from datetime import datetime, timezone
+from . import config as sift_config
+
+# index.directory setting -> Lucene Directory factory
+DIRECTORY_TYPES = {
+    'fs': FSDirectory.open, # Lucene's pick for this platform (MMapDirectory on 64-bit Linux)
+    'mmap': MMapDirectory,
+    'nio': NIOFSDirectory,
+    'simple': SimpleFSDirectory,
+}
+
+# index.merge_policy setting -> Lucene MergePolicy
+MERGE_POLICIES = {
+    'tiered': TieredMergePolicy,
+    'log_byte_size': LogByteSizeMergePolicy,
+    'log_doc': LogDocMergePolicy,
+}
+
+# index.body_storage setting: keep document text in the index as fast-to-read stored fields, compressed harder, or not at all.
+# Snippets need the stored text; without it, search results have no excerpt.
+BODY_STORAGE_MODES = ['full', 'compressed', 'none']
+
+# fields of each search result, and the stored fields they are read from
+RESULT_FIELDS = ['fullpath', 'last_modified_time', 'score', 'excerpt']
+STORED_RESULT_FIELDS = ['fullpath', 'last_modified_time']
+# hits read per searchAfter call when paging through results
+PAGE_SIZE = 100
+
+# LongPoint range bounds
+MIN_LONG = -2 ** 63
+MAX_LONG = 2 ** 63 - 1
+
+# excerpt of each hit: up to this many passages around matches
+N_PASSAGES = 3
+# look for passages in the whole body, not just its first 10000 characters (UnifiedHighlighter's default)
+MAX_HIGHLIGHT_CHARS = 2 ** 31 - 2
+
+# version() of a read-only manager on an index without commits; reader versions of real commits are never negative
+EMPTY_INDEX_VERSION = -1
 
 class LuceneManager(object):
 
-    def __init__(self, index_root_loc, index_subdir_name='.siftindex/index'):
+    def __init__(self, index_root_loc, index_subdir_name='.siftindex/index', read_only=False, config=None):
+        """
+        read_only: open a reader on the last commit without an IndexWriter, so the Lucene write lock is not taken.
+        config: ConfigParser from sift.config.load_config(); defaults to the index's config file.
+        """
         self.index_root_loc = index_root_loc
         self.index_subdir_name = index_subdir_name
+        self.read_only = read_only
+        self.config = config if config is not None else sift_config.load_config(index_root_loc)
 
     def __enter__(self):
         """
@@ -27,28 +75,78 @@ class LuceneManager(object):
             lucene.initVM(vmargs=['-Djava.awt.headless=true'])
         index_path = Path(self.index_root_loc).joinpath('%s/' % self.index_subdir_name)
         index_path.mkdir(parents=True, exist_ok=True)
-        store = SimpleFSDirectory(Paths.get(str(index_path)))
+        store = self._open_directory(index_path)
+        self.directory = store
         self.analyzer = StandardAnalyzer()
-        config = IndexWriterConfig(self.analyzer)
-        config.setOpenMode(IndexWriterConfig.OpenMode.CREATE_OR_APPEND)
-        # IndexWriter
-        self.writer = IndexWriter(store, config)
-        # IndexReader
-        self.reader = DirectoryReader.open(self.writer)
+        search_threads = self.config.getint('search', 'threads')
+        # with an executor, IndexSearcher searches segments concurrently
+        self.executor = Executors.newFixedThreadPool(search_threads) if search_threads > 0 else None
+        if self.read_only:
+            self.writer = None
+            # IndexReader over the last commit. With nothing committed yet, an empty in-memory index until refresh() finds one:
+            # writing a first commit here would need the write lock, which sift update may hold
+            self.empty = not DirectoryReader.indexExists(store)
+            self.reader = self._open_empty_reader() if self.empty else DirectoryReader.open(store)
+        else:
+            self.empty = False
+            # IndexWriter
+            self.writer = self._open_writer(store)
+            # IndexReader
+            self.reader = DirectoryReader.open(self.writer)
         # IndexSearcher
-        self.searcher = IndexSearcher(self.reader)
+        self.searcher = self._make_searcher()
 
         return self
 
+    def _open_directory(self, index_path):
+        directory_type = self.config.get('index', 'directory')
+        if directory_type not in DIRECTORY_TYPES:
+            raise ValueError('Unknown index.directory %r, expected one of: %s' % (directory_type, ', '.join(DIRECTORY_TYPES)))
+        return DIRECTORY_TYPES[directory_type](Paths.get(str(index_path)))
+
+    def _open_empty_reader(self):
+        empty_store = RAMDirectory()
+        IndexWriter(empty_store, IndexWriterConfig(self.analyzer)).close()
+        return DirectoryReader.open(empty_store)
+
+    def _open_writer(self, store):
+        config = IndexWriterConfig(self.analyzer)
+        config.setOpenMode(IndexWriterConfig.OpenMode.CREATE_OR_APPEND)
+        # flush by RAM usage and/or document count. Setting max_buffered_docs first avoids disabling both at once
+        config.setMaxBufferedDocs(self.config.getint('index', 'max_buffered_docs'))
+        config.setRAMBufferSizeMB(self.config.getfloat('index', 'ram_buffer_mb'))
+        merge_policy_name = self.config.get('index', 'merge_policy')
+        if merge_policy_name not in MERGE_POLICIES:
+            raise ValueError('Unknown index.merge_policy %r, expected one of: %s' % (merge_policy_name, ', '.join(MERGE_POLICIES)))
+        merge_policy = MERGE_POLICIES[merge_policy_name]()
+        use_compound_file = self.config.getboolean('index', 'use_compound_file')
+        config.setUseCompoundFile(use_compound_file) # for newly flushed segments
+        if not use_compound_file:
+            merge_policy.setNoCFSRatio(0.0) # for merged segments
+        config.setMergePolicy(merge_policy)
+        body_storage = self.config.get('index', 'body_storage')
+        if body_storage not in BODY_STORAGE_MODES:
+            raise ValueError('Unknown index.body_storage %r, expected one of: %s' % (body_storage, ', '.join(BODY_STORAGE_MODES)))
+        if body_storage == 'compressed':
+            # DEFLATE instead of LZ4 for all stored fields of new segments
+            config.setCodec(Lucene70Codec(Lucene50StoredFieldsFormat.Mode.BEST_COMPRESSION))
+        return IndexWriter(store, config)
+
+    def _require_writer(self):
+        assert self.writer is not None, 'Index was opened read-only.'
+
     def insert(self, document):
+        self._require_writer()
         self.writer.addDocument(document)
         return document['key']
 
     def delete(self, key):
+        self._require_writer()
         self.writer.deleteDocuments(Term('key', key))
         return key
 
     def delete_all(self):
+        self._require_writer()
         self.writer.deleteAll()
 
     def num_docs(self):
@@ -56,6 +154,7 @@ class LuceneManager(object):
 
     def update(self, key, document):
         # atomic delete and add
+        self._require_writer()
         self.writer.updateDocument(Term('key', key), document)
         return key
 
@@ -66,64 +165,189 @@ class LuceneManager(object):
         results = self.searcher.search(boolean_query.build(), 1)
         return results.totalHits > 0
 
-    def commit(self):
+    def commit(self, user_data=None):
+        """
+        user_data: optional dict of strings stored with this commit, see last_commit_data().
+        """
+        self._require_writer()
+        if user_data is not None:
+            commit_data = HashMap()
+            for key, value in user_data.items():
+                commit_data.put(key, str(value))
+            self.writer.setLiveCommitData(commit_data.entrySet())
         self.writer.commit()
-        # make IndexReader reflect index updates
-        # TODO: try IndexReader.isCurrent()
-        new_reader = DirectoryReader.openIfChanged(self.reader)
-        if new_reader is not None:
-            self.reader.close() # note: not thread safe, may need to revisit
-            self.reader = new_reader
-            self.searcher = IndexSearcher(self.reader)
-
-    def _process_search_result(self, result, highlighter=None):
+        self.refresh()
+
+    def last_commit_data(self):
+        """
+        User data stored with the last commit, as a dict of strings. Empty if nothing was committed yet.
+        """
+        if not DirectoryReader.indexExists(self.directory):
+            return {}
+        user_data = SegmentInfos.readLatestCommit(self.directory).getUserData()
+        return {str(key): str(user_data.get(key)) for key in user_data.keySet().toArray()}
+
+    def refresh(self):
+        """
+        Make IndexReader reflect index updates: our own commits, or commits by another process if read-only.
+        Returns True if a new reader was opened.
+        """
+        if self.empty:
+            if not DirectoryReader.indexExists(self.directory):
+                return False
+            new_reader = DirectoryReader.open(self.directory)
+            self.empty = False
+        else:
+            new_reader = DirectoryReader.openIfChanged(self.reader)
+        if new_reader is None:
+            return False
+        self.reader.close() # note: not thread safe, may need to revisit
+        self.reader = new_reader
+        self.searcher = self._make_searcher()
+        return True
+
+    def _make_searcher(self):
+        if self.executor is None:
+            return IndexSearcher(self.reader)
+        return IndexSearcher(self.reader, self.executor)
+
+    def segment_count(self):
+        return self.reader.leaves().size()
+
+    def optimize(self, max_segments=1):
+        """
+        Merge the index down to at most max_segments segments, and commit.
+        Searches get faster, but the merge rewrites the whole index: run it after large updates, not routinely.
+        """
+        self._require_writer()
+        self.writer.forceMerge(max_segments)
+        self.commit()
+
+    def version(self):
+        """
+        Version of the open index reader; changes whenever refresh() picks up a new commit.
+        """
+        return EMPTY_INDEX_VERSION if self.empty else self.reader.getVersion()
+
+    def _process_search_result(self, result, excerpt='', fields=RESULT_FIELDS):
         docid = result.doc  # this is not a stable identifier
-        # obtain document through an IndexReader
-        doc = self.searcher.doc(docid)
+        # obtain document through an IndexReader, loading only the stored fields we need
+        fields_to_load = HashSet()
+        for field in STORED_RESULT_FIELDS:
+            if field in fields:
+                fields_to_load.add(field)
+        doc = self.searcher.doc(docid, fields_to_load)
         # doc.getFields() -> field.name(), field.stringValue()
-        # use highlighter to extract relevant part of body
-        highlighted_text = ''
-        if highlighter:
-            contents = doc['body']
-            token_stream = self.analyzer.tokenStream('body', contents)
-            n_fragments = 3
-            fragment_separator = '...'
-            highlighted_text = highlighter.getBestFragments(token_stream, contents, n_fragments, fragment_separator)
-        return {
+        values = {
             'fullpath': doc['fullpath'],
             'last_modified_time': doc['last_modified_time'],
             'score': result.score,
-            'excerpt': highlighted_text
+            'excerpt': excerpt or ''
         }
+        return {field: values[field] for field in fields}
 
+    def _highlight(self, query, hits):
+        """
+        Best passages of the body of each hit (ScoreDocs). Offsets come from the postings (documents indexed with them),
+        so matches are found without re-analyzing the text; older documents fall back to re-analysis.
+        """
+        highlighter = UnifiedHighlighter(self.searcher, self.analyzer)
+        highlighter.setFormatter(DefaultPassageFormatter('*', '*', '...', False))
+        highlighter.setMaxLength(MAX_HIGHLIGHT_CHARS)
+        return highlighter.highlight('body', query, TopDocs(len(hits), hits, hits[0].score), N_PASSAGES)
 
-    def search(self, terms, n_hits=5):
+    def _filter_queries(self, filters):
         """
-        Run search query.
+        Lucene queries for search filters, see search.make_filters().
         """
-        # TODO: support date range queries
+        after, before = filters.get('after'), filters.get('before')
+        if after is not None or before is not None:
+            # last modified times are indexed in whole seconds; after is inclusive, before exclusive
+            lower = MIN_LONG if after is None else int(math.ceil(after))
+            upper = MAX_LONG if before is None else int(math.ceil(before)) - 1
+            yield LongPoint.newRangeQuery('date_for_pointrangequery', lower, upper)
+        if filters.get('extensions'):
+            any_extension = BooleanQuery.Builder()
+            for extension in filters['extensions']:
+                any_extension.add(TermQuery(Term('extension', extension)), BooleanClause.Occur.SHOULD)
+            yield any_extension.build()
+        if filters.get('path_prefix'):
+            yield PrefixQuery(Term('key', filters['path_prefix']))
 
-        # build query
+    def make_query(self, terms, filters=None):
+        """
+        Parse query terms, and add filters: optional dict from search.make_filters(). Filters don't affect scores.
+        """
         parser = MultiFieldQueryParser(['fullpath', 'body'], self.analyzer)
         #parser.setDefaultOperator(QueryParser.Operator.AND) # defaults to OR unless terms have modifier
         query = MultiFieldQueryParser.parse(parser, terms) # https://stackoverflow.com/a/26853987/130164
-        # create a highlighter
-        highlighter = Highlighter(SimpleHTMLFormatter('*', '*'), QueryScorer(query))
-        # execute search for top N hits
-        return [self._process_search_result(result, highlighter) for result in self.searcher.search(query, n_hits).scoreDocs]
+        if filters:
+            # FILTER clauses must match but don't score, and are cached by the searcher's query cache
+            filtered_query = BooleanQuery.Builder()
+            filtered_query.add(query, BooleanClause.Occur.MUST)
+            for filter_query in self._filter_queries(filters):
+                filtered_query.add(filter_query, BooleanClause.Occur.FILTER)
+            query = filtered_query.build()
+        return query
+
+    def iter_hits(self, query, offset=0, limit=None, fields=RESULT_FIELDS, page_size=PAGE_SIZE):
+        """
+        Generator over results of a Lucene query, best first: skips the first [offset] hits and stops after [limit] (None for all).
+        Pages through hits with searchAfter, so only one page is held at a time, and skipped hits are never loaded.
+        fields: result fields to fill in; only the stored fields they need are loaded, and excerpts only if asked for.
+        """
+        fields = RESULT_FIELDS if fields is None else fields
+        last_hit = None
+        while limit is None or limit > 0:
+            n_hits = page_size if limit is None else min(page_size, offset + limit)
+            if last_hit is None:
+                page = list(self.searcher.search(query, n_hits).scoreDocs)
+            else:
+                page = list(self.searcher.searchAfter(last_hit, query, n_hits).scoreDocs)
+            if not page:
+                return
+            last_hit = page[-1]
+            hits = page[offset:]
+            offset = max(0, offset - len(page))
+            if limit is not None:
+                hits = hits[:limit]
+                limit -= len(hits)
+            excerpts = self._highlight(query, hits) if hits and 'excerpt' in fields else [''] * len(hits)
+            for hit, excerpt in zip(hits, excerpts):
+                yield self._process_search_result(hit, excerpt, fields)
+            if len(page) < n_hits:
+                return
+
+    def iter_search(self, terms, filters=None, offset=0, limit=None, fields=RESULT_FIELDS):
+        """
+        Run search query, yielding results as they are read. See make_query() and iter_hits().
+        """
+        return self.iter_hits(self.make_query(terms, filters), offset=offset, limit=limit, fields=fields)
+
+    def search(self, terms, n_hits=5, filters=None, offset=0, fields=RESULT_FIELDS):
+        """
+        Run search query. Returns a list of up to n_hits results, after the first [offset].
+        """
+        return list(self.iter_search(terms, filters=filters, offset=offset, limit=n_hits, fields=fields))
 
     def get_all_docs(self, n_hits=1000):
         # debug method
-        return [self._process_search_result(result) for result in self.searcher.search(MatchAllDocsQuery(), n_hits).scoreDocs]
+        return list(self.iter_hits(MatchAllDocsQuery(), limit=n_hits, fields=['fullpath', 'last_modified_time', 'score']))
 
 
     def __exit__(self, type, value, traceback):
         """
         Used by the "with" statement. Handles close.
-        TODO: error handling
+        On error, changes since the last commit are rolled back instead of committed by close().
         """
-        self.writer.close()
+        if self.writer is not None:
+            if type is None:
+                self.writer.close()
+            else:
+                self.writer.rollback()
         self.reader.close()
+        if self.executor is not None:
+            self.executor.shutdown()
 
 
     def debug_analyzer(self, text):
@@ -143,9 +367,29 @@ class LuceneManager(object):
         token_stream.close()
         return tokens
 
-def make_document(full_path, unix_timestamp, contents):
+def attach_current_thread():
+    """
+    Attach the calling thread to the JVM, if one is running.
+    Threads other than the one that started the JVM must do this before creating Lucene objects.
+    """
+    env = lucene.getVMEnv()
+    if env is not None:
+        env.attachCurrentThread()
+
+def make_body_field_type(store_body=True):
+    """
+    Tokenized text with offsets in the postings, for UnifiedHighlighter. Stored unless store_body is False.
+    """
+    field_type = FieldType(TextField.TYPE_STORED if store_body else TextField.TYPE_NOT_STORED)
+    field_type.setIndexOptions(IndexOptions.DOCS_AND_FREQS_AND_POSITIONS_AND_OFFSETS)
+    field_type.freeze()
+    return field_type
+
+def make_document(full_path, unix_timestamp, contents, store_body=True, extension=None):
     """
     Create Lucene document with specific content.
+    store_body: keep the contents in the index, for excerpts. See the index.body_storage setting.
+    extension: registry extension of the file, for extension filters.
     """
     doc = Document()
     # two separate date fields per recommendation
@@ -155,7 +399,7 @@ def make_document(full_path, unix_timestamp, contents):
     # https://lucene.apache.org/core/7_6_0/core/org/apache/lucene/document/TextField.html
     # indexed and tokenized
     doc.add(TextField('fullpath', full_path, Field.Store.YES)) # this is file key but tokenized
-    doc.add(TextField('body', contents, Field.Store.YES))
+    doc.add(Field('body', contents, make_body_field_type(store_body)))
     # It is also possible to add fields that are indexed but not tokenized.
     # See https://lucene.apache.org/core/7_6_0/core/org/apache/lucene/document/StringField.html
     # However there is a limitation: https://stackoverflow.com/a/32654329/130164
@@ -163,28 +407,10 @@ def make_document(full_path, unix_timestamp, contents):
     # , while StringField does not run the analyzer.
     # We deliberately store the key as untokenized so we can search by it directly with a TermQuery.
     doc.add(StringField('key', full_path, Field.Store.YES)) # this is file key
+    if extension is not None:
+        doc.add(StringField('extension', extension, Field.Store.NO))
     return doc
 
-def format_document(document_result):
-    """
-    pretty print
-    """
-    def pprint_unix_timestamp(ts):
-        """
-        returns e.g. 2019-02-28 22:17:55 EST
-        ref: https://stackoverflow.com/a/40769643/130164
-        """
-        utc_time = datetime.fromtimestamp(int(ts), timezone.utc)
-        local_time = utc_time.astimezone()
-        return local_time.strftime("%Y-%m-%d %H:%M:%S %Z")
-
-    return '=== {fullpath} ({last_modified_time}) ===\n{excerpt}'.format(
-        fullpath=document_result['fullpath'],
-        last_modified_time=pprint_unix_timestamp(document_result['last_modified_time']),
-        # score=document_result['score'],
-        excerpt=document_result['excerpt']
-    )
-
 def assert_document_equals(document1, document2):
     assert document1['last_modified_time'] == document2['last_modified_time']
     assert document1['fullpath'] == document2['fullpath']
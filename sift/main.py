@@ -1,9 +1,21 @@
 import argparse
-from . import status, metadata_manager, update, lucene_manager
+import contextlib
+import cProfile
+import itertools
+import os
+import sys
+# only what sift query needs: the other commands import indexing modules (pandas, Lucene, importers) when they run,
+# so a query answered by sift serve doesn't pay for them
+from . import server, config, text_cache, search, query_cache, profiling
 
 def main():
     parser = argparse.ArgumentParser(prog='sift', description="Index a file tree and search it.")
     parser.add_argument('--path', help='Index path', default='.')
+    parser.add_argument('-c', dest='config_overrides', metavar='SECTION.KEY=VALUE', action='append', default=[],
+                        help='Override a setting from .siftindex/config for this command; repeatable')
+    parser.add_argument('--profile', action='store_true', help='Print where the command spent its time (scan, diff, import per importer, index write, commit, metadata)')
+    parser.add_argument('--profile-trace', dest='profile_trace', metavar='PATH', help='Profile, and save the timeline as a Chrome trace (chrome://tracing, Perfetto)')
+    parser.add_argument('--profile-cprofile', dest='profile_cprofile', metavar='PATH', help='Profile, and save cProfile stats of the main thread (python -m pstats PATH)')
 
     subparsers = parser.add_subparsers()
 
@@ -11,54 +23,265 @@ def main():
     init_parser.set_defaults(func=init_index)
 
     status_parser = subparsers.add_parser('status', help='Status of index')
+    status_parser.add_argument('--full', action='store_true', help='Check every file, even with status.prune_directories on')
     status_parser.set_defaults(func=get_status)
 
     update_parser = subparsers.add_parser('update', help='Update index')
     update_parser.add_argument('--delete-missing', dest='delete_missing', help='Delete files that no longer exist', action='store_true')
+    update_parser.add_argument('--jobs', '-j', dest='jobs', type=int, default=os.cpu_count(), help='Number of files to import in parallel (default: number of CPUs)')
+    update_parser.add_argument('--full', action='store_true', help='Check every file, even with status.prune_directories on')
     update_parser.set_defaults(func=update_index)
 
+    watch_parser = subparsers.add_parser('watch', help='Keep updating the index as files change')
+    watch_parser.add_argument('--delete-missing', dest='delete_missing', help='Delete files that no longer exist', action='store_true')
+    watch_parser.add_argument('--jobs', '-j', dest='jobs', type=int, default=os.cpu_count(), help='Number of files to import in parallel (default: number of CPUs)')
+    watch_parser.set_defaults(func=watch_index)
+
     query_parser = subparsers.add_parser('query', aliases=['q'], help='Query index')
     query_parser.set_defaults(func=run_query)
     query_parser.add_argument('terms', metavar='term',
                               type=str, nargs='+', help='Search query terms')
+    query_parser.add_argument('--after', type=search.parse_date, help='Only files modified at or after this date (2019-02-28, 2019-02-28T22:17) or time ago (12h, 30d, 2w)')
+    query_parser.add_argument('--before', type=search.parse_date, help='Only files modified before this date or time ago')
+    query_parser.add_argument('--ext', dest='extensions', metavar='EXTENSION', action='append', default=[], help='Only files with this extension; repeatable')
+    query_parser.add_argument('--prefix', dest='path_prefix', help='Only files under this path, relative to the index root')
+    query_parser.add_argument('--limit', '-n', type=int, default=5, help='Number of results (default: 5)')
+    query_parser.add_argument('--offset', type=int, default=0, help='Skip this many results first')
+    query_parser.add_argument('--all', dest='all_results', action='store_true', help='All results, printed as they are found')
+    query_parser.add_argument('--format', dest='output_format', choices=search.OUTPUT_FORMATS, default='text',
+                              help='Output: text (default), ndjson, json, or paths0 (NUL-separated paths)')
+    query_parser.add_argument('--snippet', action='store_true', help='Include highlighted snippets in ndjson and json output')
+
+    serve_parser = subparsers.add_parser('serve', help='Keep the index open and answer queries from a background process')
+    serve_parser.set_defaults(func=serve_queries)
+
+    optimize_parser = subparsers.add_parser('optimize', help='Merge index segments for faster searches, e.g. after a large update')
+    optimize_parser.add_argument('--max-segments', dest='max_segments', type=int, default=1, help='Merge down to this many segments (default: 1)')
+    optimize_parser.set_defaults(func=optimize_index)
+
+    stats_parser = subparsers.add_parser('stats', help='Show query cache hit rate')
+    stats_parser.set_defaults(func=show_stats)
+
+    config_parser = subparsers.add_parser('config', help='Show settings, or save one to .siftindex/config')
+    config_parser.add_argument('name', metavar='section.key', nargs='?', help='Setting to save')
+    config_parser.add_argument('value', nargs='?', help='Value to save')
+    config_parser.set_defaults(func=configure)
 
     args = parser.parse_args()
     if 'func' not in args:
         # we fell through all the subparsers
         parser.print_help()
         return
-    args.func(args)
+    if not (args.profile or args.profile_trace or args.profile_cprofile):
+        args.func(args)
+        return
+    run_profiled(args)
+
+def run_profiled(args):
+    """
+    Run a command with profiling spans enabled, then print their summary to stderr.
+    """
+    profiler = profiling.enable(trace=args.profile_trace is not None)
+    code_profiler = cProfile.Profile() if args.profile_cprofile else None
+    try:
+        if code_profiler is None:
+            args.func(args)
+        else:
+            code_profiler.runcall(args.func, args)
+    finally:
+        profiling.disable()
+        print(profiling.format_summary(profiler), file=sys.stderr)
+        if args.profile_trace:
+            profiling.write_trace(profiler, args.profile_trace)
+        if code_profiler is not None:
+            code_profiler.dump_stats(args.profile_cprofile)
+
+def load_config(args):
+    return config.load_config(args.path, getattr(args, 'config_overrides', []))
+
+def compute_status(args, directories=None):
+    from . import status
+    from .importers.registry import get_registry
+    index_config = load_config(args)
+    return status.status(args.path, strategies=get_registry(index_config),
+                         content_hash=index_config.getboolean('status', 'content_hash'), jobs=getattr(args, 'jobs', None),
+                         prune_directories=index_config.getboolean('status', 'prune_directories') and not getattr(args, 'full', False),
+                         directories=directories)
+
+def configure(args):
+    if args.name is None:
+        print(config.format_config(load_config(args)))
+        return
+    assert args.value is not None, 'Usage: sift config section.key value'
+    config.save_setting(args.path, args.name, args.value)
+
+def optimize_index(args):
+    from . import metadata_manager, lucene_manager
+    assert metadata_manager.index_exists(args.path), "Index doesn't exist."
+    with lucene_manager.LuceneManager(args.path, config=load_config(args)) as index_manager:
+        segments_before = index_manager.segment_count()
+        index_manager.optimize(args.max_segments)
+        print('Merged %d segments into %d.' % (segments_before, index_manager.segment_count()))
+
+def show_stats(args):
+    with query_cache.open_cache(args.path, load_config(args).getint('query_cache', 'max_entries')) as cache:
+        stats = cache.stats()
+    hit_rate = 'n/a' if stats['hit_rate'] is None else '%.1f%%' % (stats['hit_rate'] * 100)
+    print('Query cache: %d hits, %d misses (hit rate %s), %d entries' % (stats['hits'], stats['misses'], hit_rate, stats['entries']))
+    return stats
 
 def init_index(args):
+    from . import metadata_manager
     metadata_manager.create_index(args.path)
     print("Index created")
 
 def get_status(args):
-    computed_status = status.status(args.path)
-    pretty_print_status = status.format_status(computed_status)
-    if pretty_print_status != '':
-        # be silent (not even a newline) unless we have status to report
-        print(pretty_print_status)
-    return computed_status
+    """
+    Print changes as they are found. Returns the printed status lines.
+    """
+    from . import status
+    status_lines = []
+    # be silent (not even a newline) unless we have status to report
+    for line in status.format_status(compute_status(args)):
+        print(line)
+        status_lines.append(line)
+    return status_lines
 
 def update_index(args):
+    from . import status, metadata_manager, lucene_manager, update
+    from .importers.registry import get_registry
     index_loc = args.path
-    work_plan = status.status(index_loc)
-    formatted_status = status.format_status(work_plan)
-    if formatted_status == '':
+    index_config = load_config(args)
+    # indexes written in an older format are rebuilt: all their files are forgotten, then imported again
+    rebuild = not metadata_manager.index_format_is_current(index_loc)
+    if rebuild:
+        print('Index was written by an older version of sift: re-importing all files.')
+        metadata_manager.forget_all_files(index_loc)
+    # directory modified times seen by the scan, saved with the changes
+    directories = {}
+    work_plan = status.pending_changes(compute_status(args, directories))
+    # don't start Lucene unless there is work to do
+    first_change = next(work_plan, None)
+    if first_change is None and not rebuild:
+        with metadata_manager.open_store(index_loc) as store:
+            update.save_directories(store, directories, get_registry(index_config), [])
         print('Nothing to update.')
         return
-    with lucene_manager.LuceneManager(index_loc) as index_manager:
-        update.update(index_loc, index_manager, work_plan, delete=args.delete_missing, verbose=True)
+    with lucene_manager.LuceneManager(index_loc, config=index_config) as index_manager, open_text_cache(index_loc, index_config) as cache:
+        if rebuild:
+            # committed with the first documents: an interrupted rebuild starts over
+            index_manager.delete_all()
+        failures = update.update(
+            index_loc,
+            index_manager,
+            itertools.chain([] if first_change is None else [first_change], work_plan),
+            delete=args.delete_missing,
+            strategies=get_registry(index_config),
+            verbose=True,
+            jobs=getattr(args, 'jobs', None),
+            text_cache=cache,
+            directories=directories,
+            **update_settings(index_config)
+        )
+    if rebuild:
+        metadata_manager.set_index_format(index_loc)
+    print_failures(failures)
+
+def open_text_cache(index_loc, index_config):
+    """
+    The index's text cache if the cache.enabled setting is on (or auto, with status.content_hash on), else a context manager yielding None.
+    """
+    if index_config.get('cache', 'enabled') == 'auto':
+        enabled = index_config.getboolean('status', 'content_hash')
+    else:
+        enabled = index_config.getboolean('cache', 'enabled')
+    if not enabled:
+        return contextlib.nullcontext()
+    return text_cache.open_cache(index_loc, int(index_config.getfloat('cache', 'max_mb') * 1024 * 1024))
+
+def update_settings(index_config):
+    """
+    Keyword arguments of update.update() from settings.
+    """
+    return {
+        'commit_every_docs': index_config.getint('update', 'commit_every_docs'),
+        'commit_every_seconds': index_config.getfloat('update', 'commit_every_seconds'),
+        'max_indexed_bytes': int(index_config.getfloat('index', 'max_indexed_mb') * 1024 * 1024),
+        'store_body': index_config.get('index', 'body_storage') != 'none',
+    }
+
+def print_failures(failures):
+    if len(failures) > 0:
+        print('%d file(s) failed to import and will be retried on the next update:' % len(failures))
+        print('\n'.join(failures.keys()))
+
+def watch_index(args):
+    from . import metadata_manager, lucene_manager, watch
+    from .importers.registry import get_registry
+    index_loc = args.path
+    assert metadata_manager.index_exists(index_loc), "Index doesn't exist."
+    assert metadata_manager.index_format_is_current(index_loc), 'Index was written by an older version of sift: run sift update first to rebuild it.'
+    index_config = load_config(args)
+    print('Watching %s for changes (Ctrl-C to stop)' % os.path.abspath(index_loc))
+    failures = {}
+    # Ctrl-C must propagate through the LuceneManager: its __exit__ then rolls back the interrupted batch instead of committing it
+    try:
+        with lucene_manager.LuceneManager(index_loc, config=index_config) as index_manager, open_text_cache(index_loc, index_config) as cache:
+            failures = watch.watch(
+                index_loc,
+                index_manager,
+                strategies=get_registry(index_config),
+                delete=args.delete_missing,
+                verbose=True,
+                jobs=getattr(args, 'jobs', None),
+                content_hash=index_config.getboolean('status', 'content_hash'),
+                debounce_seconds=index_config.getfloat('watch', 'debounce_seconds'),
+                reconcile_seconds=index_config.getfloat('watch', 'reconcile_seconds'),
+                text_cache=cache,
+                **update_settings(index_config)
+            )
+    except KeyboardInterrupt:
+        # every applied batch is committed; the interrupted one was rolled back, in the index and the metadata, so the next update redoes it
+        pass
+    print_failures(failures)
 
 def run_query(args):
+    """
+    Print results as they are read. Returns the number of results.
+    """
     query = ' '.join(args.terms)
-    print('Results for: %s' % query)
-    with lucene_manager.LuceneManager(args.path) as index_manager:
-        results = list(index_manager.search(query))
-        pretty_printed = [lucene_manager.format_document(r) for r in results]
-        print('\n\n'.join(pretty_printed))
-        return results
+    output_format = getattr(args, 'output_format', 'text')
+    if output_format == 'text':
+        print('Results for: %s' % query)
+    filters = search.make_filters(
+        after_date=getattr(args, 'after', None),
+        before_date=getattr(args, 'before', None),
+        extensions=getattr(args, 'extensions', []),
+        path_prefix=getattr(args, 'path_prefix', None),
+        index_loc=args.path,
+    )
+    limit = None if getattr(args, 'all_results', False) else getattr(args, 'limit', 5)
+    results = search.iter_query(args.path, query, filters=filters, offset=getattr(args, 'offset', 0), limit=limit,
+                                fields=search.result_fields(output_format, getattr(args, 'snippet', False)), config=load_config(args))
+    n_results = 0
+    def counted(results):
+        nonlocal n_results
+        for result in results:
+            n_results += 1
+            yield result
+    for output in search.format_results(counted(results), output_format):
+        sys.stdout.write(output)
+        sys.stdout.flush()
+    return n_results
+
+def serve_queries(args):
+    from . import metadata_manager
+    assert metadata_manager.index_exists(args.path), "Index doesn't exist."
+    print('Serving queries on %s (Ctrl-C to stop)' % server.get_socket_path(args.path))
+    try:
+        server.serve(args.path, config=load_config(args))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == '__main__':
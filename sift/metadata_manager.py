@@ -1,54 +1,234 @@
 """
-We manage the last index as a csv for now.
-This is a bad idea
-Expensive to read and write the full file every time
-But for now convenient to just use pandas for some diffing operations.
+We manage the last index details (per file: last modified time, importer strategy and version, extension) in a metadata store.
+The default store is a SQLite table keyed by file name, so an update only touches the rows of files that changed,
+and diffs can stream rows in file name order without loading the whole table.
+
+Indexes created before the SQLite store kept this data in .siftindex/metadata.csv; it is migrated on first open.
+pandas is only imported by the functions returning DataFrames: it takes longer to import than a query through sift serve takes.
 """
 
-import pandas as pd
+import sqlite3
 from pathlib import Path
 
-DEFAULT_INDEX_STORE_FILENAME = '.siftindex/metadata.csv'
+DEFAULT_INDEX_STORE_FILENAME = '.siftindex/metadata.db'
+LEGACY_CSV_FILENAME = '.siftindex/metadata.csv'
+
+# columns stored per file name, in order. content_hash is optional (None unless status.content_hash is enabled)
+DETAIL_COLUMNS = ['last_mod', 'strategy', 'strategy_version', 'extension', 'content_hash']
 
 def get_index_metadata_path(index_loc, index_store_filename):
     return Path(index_loc).joinpath(index_store_filename)
 
 def index_exists(index_loc, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
-    return get_index_metadata_path(index_loc, index_store_filename).exists()
+    return (get_index_metadata_path(index_loc, index_store_filename).exists()
+        or get_index_metadata_path(index_loc, LEGACY_CSV_FILENAME).exists())
 
 def make_empty_index():
     """return empty frame with correct types"""
+    import pandas as pd
     return pd.DataFrame({
         'fname': pd.Series(dtype='str'),
         'last_mod': pd.Series(dtype='float'),
         'strategy': pd.Series(dtype='str'),
         'strategy_version': pd.Series(dtype='float'),
         'extension': pd.Series(dtype='str'),
+        'content_hash': pd.Series(dtype='str'),
     }).set_index('fname')
 
+def prefix_upper_bound(prefix):
+    """
+    Smallest string after all strings starting with prefix: names starting with prefix are a range of the primary key.
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+# explicit column order: columns added by ALTER TABLE come last, whatever the table's age
+SELECT_COLUMNS = ', '.join(['fname'] + DETAIL_COLUMNS)
+
+class SqliteMetadataStore(object):
+    """
+    Records are (fname, last_mod, strategy, strategy_version, extension, content_hash) tuples.
+    One row per file in a WITHOUT ROWID table clustered on file name:
+    upserts and deletes are index lookups, and iter_details() is a sequential scan of the primary key.
+    Used with the "with" statement; changes are committed on a clean exit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.connection = sqlite3.connect(str(self.path))
+        # WAL lets readers (e.g. sift status) run while an update writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS files (
+            fname TEXT PRIMARY KEY,
+            last_mod REAL NOT NULL,
+            strategy TEXT NOT NULL,
+            strategy_version REAL NOT NULL,
+            extension TEXT NOT NULL,
+            content_hash TEXT
+        ) WITHOUT ROWID''')
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(files)')]
+        if 'content_hash' not in columns:
+            # stores created before content hashes
+            self.connection.execute('ALTER TABLE files ADD COLUMN content_hash TEXT')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS properties (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        # modified times of scanned directories, see scanner.scan_tree_pruned()
+        self.connection.execute('CREATE TABLE IF NOT EXISTS directories (dname TEXT PRIMARY KEY, mtime REAL NOT NULL) WITHOUT ROWID')
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.connection.commit()
+        else:
+            self.connection.rollback()
+        self.connection.close()
+
+    def upsert(self, records):
+        """Insert or replace records."""
+        self.connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', records)
+
+    def delete(self, fnames):
+        """Delete records for these file names. Missing file names are ignored."""
+        self.connection.executemany('DELETE FROM files WHERE fname = ?', ((fname,) for fname in fnames))
+
+    def get(self, fname):
+        """Return the record for this file name, or None."""
+        return self.connection.execute('SELECT %s FROM files WHERE fname = ?' % SELECT_COLUMNS, (fname,)).fetchone()
+
+    def iter_details(self, prefix=None):
+        """Generator over all records, or those whose file name starts with prefix, sorted by file name."""
+        # separate cursor so callers can write through this store while iterating
+        cursor = self.connection.cursor()
+        cursor.arraysize = 1000
+        if prefix:
+            cursor.execute('SELECT %s FROM files WHERE fname >= ? AND fname < ? ORDER BY fname' % SELECT_COLUMNS, (prefix, prefix_upper_bound(prefix)))
+        else:
+            cursor.execute('SELECT %s FROM files ORDER BY fname' % SELECT_COLUMNS)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def get_directories(self):
+        """Return dict of directory prefix to modified time, as saved by save_directories()."""
+        return dict(self.connection.execute('SELECT dname, mtime FROM directories'))
+
+    def save_directories(self, directories):
+        """Save directory modified times (dict of directory prefix to modified time). None forgets a directory and those under it."""
+        forgotten = [dname for dname, mtime in directories.items() if mtime is None]
+        # the root directory of an index at the current directory is '': forgetting it forgets everything
+        self.connection.executemany(
+            'DELETE FROM directories WHERE dname >= ? AND dname < ?', ((dname, prefix_upper_bound(dname)) for dname in forgotten if dname))
+        if '' in forgotten:
+            self.connection.execute('DELETE FROM directories')
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO directories VALUES (?, ?)', ((dname, mtime) for dname, mtime in directories.items() if mtime is not None))
+
+    def get_property(self, key):
+        """Return a string value stored for the whole index, or None."""
+        row = self.connection.execute('SELECT value FROM properties WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_property(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO properties VALUES (?, ?)', (key, str(value)))
+
+    def commit(self):
+        self.connection.commit()
+
+METADATA_BACKENDS = {
+    'sqlite': SqliteMetadataStore,
+}
+DEFAULT_METADATA_BACKEND = 'sqlite'
+
+def open_store(index_loc, index_store_filename=DEFAULT_INDEX_STORE_FILENAME, backend=DEFAULT_METADATA_BACKEND):
+    """
+    Open the metadata store of this index, migrating a legacy metadata.csv if one is found.
+    Use with the "with" statement.
+    """
+    path = get_index_metadata_path(index_loc, index_store_filename)
+    legacy_path = get_index_metadata_path(index_loc, LEGACY_CSV_FILENAME)
+    if not path.exists() and legacy_path.exists():
+        migrate_csv(legacy_path, path, backend)
+    return METADATA_BACKENDS[backend](path)
+
+def migrate_csv(legacy_path, path, backend=DEFAULT_METADATA_BACKEND):
+    """
+    One-time migration of a metadata.csv written by older versions. The csv is kept, renamed to metadata.csv.migrated.
+    """
+    import pandas as pd
+    legacy_details = pd.read_csv(legacy_path, index_col='fname')
+    legacy_columns = ['last_mod', 'strategy', 'strategy_version', 'extension']
+    with METADATA_BACKENDS[backend](path) as store:
+        # no content hashes in legacy indexes
+        store.upsert(record + (None,) for record in legacy_details[legacy_columns].itertuples(name=None))
+    legacy_path.rename(legacy_path.with_name(legacy_path.name + '.migrated'))
+
+# metadata store property: format of the Lucene documents the index was written with.
+# 2: body indexed with offsets. Lucene can't change a field's index options in place, so indexes of older formats are rebuilt
+INDEX_FORMAT_KEY = 'sift.index_format'
+INDEX_FORMAT = 2
+
+def index_format_is_current(index_loc, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
+    with open_store(index_loc, index_store_filename) as store:
+        return store.get_property(INDEX_FORMAT_KEY) == str(INDEX_FORMAT)
+
+def set_index_format(index_loc, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
+    with open_store(index_loc, index_store_filename) as store:
+        store.set_property(INDEX_FORMAT_KEY, INDEX_FORMAT)
+
+def forget_all_files(index_loc, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
+    """
+    Remove every file's data, and saved directory modified times: the next status finds all files new.
+    """
+    with open_store(index_loc, index_store_filename) as store:
+        store.delete(record[0] for record in store.iter_details())
+        store.save_directories({'': None})
+
 def create_index(index_loc, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
     assert not index_exists(
         index_loc, index_store_filename), 'Index already exists.'
     parent_dir = get_index_metadata_path(index_loc, index_store_filename).parent
     if not parent_dir.exists():
         parent_dir.mkdir()
-    save_index_details(make_empty_index(), index_loc, index_store_filename)
+    # creates schema
+    set_index_format(index_loc, index_store_filename)
 
 def last_index_details(index_loc, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
     """
-    load last index management data
+    load last index management data as a dataframe indexed by fname
     """
-    return pd.read_csv(get_index_metadata_path(index_loc, index_store_filename), index_col='fname')
+    with open_store(index_loc, index_store_filename) as store:
+        records = list(store.iter_details())
+    if len(records) == 0:
+        return make_empty_index()
+    import pandas as pd
+    return pd.DataFrame.from_records(records, columns=['fname'] + DETAIL_COLUMNS, index='fname')
 
-def update_file_data():
+def update_file_data(index_loc, fname, last_mod, strategy, strategy_version, extension, content_hash=None, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
     """
     update a single file's data
     """
-    pass
+    with open_store(index_loc, index_store_filename) as store:
+        store.upsert([(fname, last_mod, strategy, strategy_version, extension, content_hash)])
+
+def delete_file_data(index_loc, fnames, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
+    """
+    remove these files' data
+    """
+    with open_store(index_loc, index_store_filename) as store:
+        store.delete(fnames)
 
 def save_index_details(new_index_details, index_loc, index_store_filename=DEFAULT_INDEX_STORE_FILENAME):
     """
-    save updated index management data
+    upsert index management data for the files in new_index_details (a dataframe indexed by fname)
     """
-    new_index_details.to_csv(get_index_metadata_path(
-        index_loc, index_store_filename))
+    # optional columns may be missing; store them as NULL
+    details = new_index_details.reindex(columns=DETAIL_COLUMNS).astype(object)
+    details = details.where(details.notnull(), None)
+    with open_store(index_loc, index_store_filename) as store:
+        store.upsert(details.itertuples(name=None))
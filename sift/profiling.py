@@ -0,0 +1,212 @@
+import json
+import math
+import os
+import threading
+import time
+
+"""
+Timing instrumentation: named spans around the stages of a command, e.g. sift --profile update.
+Spans nest per thread, so each one has a total time and a self time (total minus nested spans).
+Work plans are lazy generators, so scanning and diffing are timed per item pulled through profiled_iter().
+Disabled by default: span() then returns a shared no-op and profiled_iter() returns its iterable as is.
+"""
+
+# time of a span, or of an item pulled through a profiled iterable, that is spent in nested spans
+class _Frame(object):
+    __slots__ = ['children']
+
+    def __init__(self):
+        self.children = 0.0
+
+class Span(_Frame):
+    """
+    Times a "with" block. Set bytes to the amount of data it processed, and detail to what it processed (e.g. a file name, shown in traces).
+    """
+    __slots__ = ['profiler', 'name', 'tags', 'bytes', 'detail', 'start']
+
+    def __init__(self, profiler, name, tags):
+        super().__init__()
+        self.profiler = profiler
+        self.name = name
+        self.tags = tags
+        self.bytes = 0
+        self.detail = None
+
+    def __enter__(self):
+        self.profiler.stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        duration = time.perf_counter() - self.start
+        stack = self.profiler.stack()
+        stack.pop()
+        if stack:
+            stack[-1].children += duration
+        self.profiler.record(self.name, self.tags, self.start, duration, duration - self.children, self.bytes, detail=self.detail)
+
+class _NoSpan(object):
+    """Stands in for Span while profiling is disabled."""
+    bytes = 0
+    detail = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+NO_SPAN = _NoSpan()
+
+class Profiler(object):
+    """
+    Collects spans from all threads. Per span name and tags: durations (for percentiles), self time, items and bytes.
+    With trace=True, also keeps every span for trace_events().
+    """
+
+    def __init__(self, trace=False):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.groups = {}
+        self.events = [] if trace else None
+        self.started = time.perf_counter()
+
+    def stack(self):
+        """Spans open in the calling thread, innermost last."""
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    def record(self, name, tags, start, duration, self_duration, n_bytes=0, items=1, detail=None):
+        key = (name, tuple(sorted(tags.items())))
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = {'durations': [], 'self': 0.0, 'items': 0, 'bytes': 0}
+            group['durations'].append(duration)
+            group['self'] += self_duration
+            group['items'] += items
+            group['bytes'] += n_bytes
+            if self.events is not None:
+                self.events.append((name, tags, start, duration, self_duration, items, n_bytes, detail, threading.get_ident()))
+
+    def iterate(self, name, iterable, tags):
+        """
+        Generator over iterable, timing the calls that pull its items. Recorded as one span when it ends.
+        """
+        iterator = iter(iterable)
+        frame = _Frame()
+        first_start = time.perf_counter()
+        total = own = 0.0
+        items = 0
+        try:
+            while True:
+                stack = self.stack()
+                frame.children = 0.0
+                stack.append(frame)
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed = time.perf_counter() - start
+                    stack.pop()
+                    if stack:
+                        stack[-1].children += elapsed
+                    total += elapsed
+                    own += elapsed - frame.children
+                items += 1
+                yield item
+        finally:
+            self.record(name, tags, first_start, total, own, items=items)
+
+    def summary(self):
+        """
+        Rows of (name, tags, count, total, self, p50, p95, items, bytes), slowest first. Times in seconds.
+        """
+        rows = []
+        with self.lock:
+            groups = list(self.groups.items())
+        for (name, tags), group in groups:
+            durations = sorted(group['durations'])
+            rows.append((name, dict(tags), len(durations), sum(durations), group['self'],
+                         percentile(durations, 50), percentile(durations, 95), group['items'], group['bytes']))
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
+
+    def trace_events(self):
+        """
+        Spans in Chrome's trace event format (load in chrome://tracing or Perfetto).
+        Iterable spans are drawn from their first item, as long as the time spent pulling items.
+        """
+        pid = os.getpid()
+        return {
+            'traceEvents': [
+                {
+                    'name': name, 'cat': 'sift', 'ph': 'X', 'pid': pid, 'tid': thread_id,
+                    'ts': (start - self.started) * 1e6, 'dur': duration * 1e6,
+                    'args': dict(tags, self_ms=self_duration * 1e3, items=items, bytes=n_bytes, **({} if detail is None else {'detail': detail})),
+                }
+                for name, tags, start, duration, self_duration, items, n_bytes, detail, thread_id in self.events or []
+            ],
+            'displayTimeUnit': 'ms',
+        }
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of a sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+_profiler = None
+
+def enable(trace=False):
+    """
+    Start collecting spans, from all threads. Returns the Profiler.
+    """
+    global _profiler
+    _profiler = Profiler(trace)
+    return _profiler
+
+def disable():
+    global _profiler
+    _profiler = None
+
+def enabled():
+    return _profiler is not None
+
+def span(name, **tags):
+    """
+    Context manager timing a block as span [name], e.g. with span('import', strategy='PdfImporter', extension='pdf') as s: ...
+    """
+    if _profiler is None:
+        return NO_SPAN
+    return Span(_profiler, name, tags)
+
+def profiled_iter(name, iterable, **tags):
+    """
+    Time the pulling of items from iterable as span [name]: for lazy stages like scanning.
+    """
+    if _profiler is None:
+        return iterable
+    return _profiler.iterate(name, iterable, tags)
+
+def format_summary(profiler):
+    lines = ['%-14s %-34s %8s %10s %10s %10s %10s %10s %10s' % (
+        'span', 'tags', 'count', 'total s', 'self s', 'p50 ms', 'p95 ms', 'items', 'MB')]
+    for name, tags, count, total, self_total, p50, p95, items, n_bytes in profiler.summary():
+        lines.append('%-14s %-34s %8d %10.3f %10.3f %10.2f %10.2f %10d %10.1f' % (
+            name, ' '.join('%s=%s' % tag for tag in sorted(tags.items())), count, total, self_total,
+            p50 * 1e3, p95 * 1e3, items, n_bytes / 1e6))
+    return '\n'.join(lines)
+
+def write_trace(profiler, path):
+    with open(path, 'w') as f:
+        json.dump(profiler.trace_events(), f)
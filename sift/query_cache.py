@@ -0,0 +1,169 @@
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+"""
+On-disk cache of search results, shared by `sift query` and `sift serve` processes.
+Entries are keyed by the normalized query, filters and page, and tagged with the version of the index reader that produced them:
+a commit opens a reader with a new version, so older entries stop matching and are dropped the next time results are stored.
+Hit and miss counts are kept with the cache, see stats().
+Lookups don't write: their counts and recency are batched in memory, and written with the next put(), every few lookups, or on close.
+"""
+
+DEFAULT_QUERY_CACHE_FILENAME = '.siftindex/query_cache.db'
+
+# write the counts and recency of lookups at least every this many lookups
+FLUSH_EVERY_LOOKUPS = 100
+
+# puts wait this long for other processes' writes; writing lookups is best-effort, and waits much less
+BUSY_TIMEOUT_SECONDS = 5.0
+FLUSH_BUSY_TIMEOUT_SECONDS = 0.05
+
+def make_key(terms, filters=None, offset=0, n_hits=5, fields=None):
+    """
+    Cache key of a search. Queries that differ only in whitespace share a key.
+    """
+    return json.dumps([' '.join(terms.split()), filters, offset, n_hits, fields], sort_keys=True)
+
+class QueryCache(object):
+    """
+    Least recently used entries are evicted beyond max_entries.
+    Thread-safe: one connection behind a lock. Used with the "with" statement.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False, timeout=BUSY_TIMEOUT_SECONDS)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            index_version TEXT NOT NULL,
+            results TEXT NOT NULL,
+            last_used REAL NOT NULL
+        )''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self.connection.commit()
+        self._clear_pending()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        with self.lock:
+            self._flush()
+        self.connection.close()
+
+    def _clear_pending(self):
+        self.pending_counts = {'hits': 0, 'misses': 0}
+        self.pending_used = {}
+
+    def _write_pending(self):
+        """
+        Write the counts and recency of lookups since the last write, uncommitted. Call with the lock held.
+        """
+        for name, count in self.pending_counts.items():
+            if count:
+                self.connection.execute('INSERT OR IGNORE INTO counters VALUES (?, 0)', (name,))
+                self.connection.execute('UPDATE counters SET value = value + ? WHERE name = ?', (count, name))
+        self.connection.executemany('UPDATE entries SET last_used = ? WHERE key = ?', [(used, key) for key, used in self.pending_used.items()])
+
+    def _flush(self):
+        """
+        Write and commit pending lookups, unless another process holds the write lock for long: then they wait for the next write.
+        Call with the lock held.
+        """
+        if not any(self.pending_counts.values()):
+            return
+        self.connection.execute('PRAGMA busy_timeout = %d' % (FLUSH_BUSY_TIMEOUT_SECONDS * 1000))
+        try:
+            self._write_pending()
+            self.connection.commit()
+            self._clear_pending()
+        except sqlite3.OperationalError:
+            # database is locked
+            self.connection.rollback()
+        finally:
+            self.connection.execute('PRAGMA busy_timeout = %d' % (BUSY_TIMEOUT_SECONDS * 1000))
+
+    def get(self, index_version, key):
+        """
+        Returns cached results of this search on this index version, or None. Counts a hit or a miss.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT results FROM entries WHERE key = ? AND index_version = ?', (key, str(index_version))).fetchone()
+            if row is None:
+                self.pending_counts['misses'] += 1
+            else:
+                self.pending_counts['hits'] += 1
+                self.pending_used[key] = time.time()
+            if sum(self.pending_counts.values()) >= FLUSH_EVERY_LOOKUPS:
+                self._flush()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, index_version, key, results):
+        with self.lock:
+            # recency first, so entries looked up since the last write aren't evicted
+            self._write_pending()
+            # entries of other index versions can't be hit again
+            self.connection.execute('DELETE FROM entries WHERE index_version != ?', (str(index_version),))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', (key, str(index_version), json.dumps(results), time.time()))
+            self.connection.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            self.connection.commit()
+            self._clear_pending()
+
+    def stats(self):
+        """
+        Dict of hits, misses, hit_rate (None before any lookup) and entries.
+        """
+        with self.lock:
+            self._flush()
+            counters = dict(self.connection.execute('SELECT name, value FROM counters'))
+            entries = self.connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            # lookups that couldn't be written yet
+            hits = counters.get('hits', 0) + self.pending_counts['hits']
+            misses = counters.get('misses', 0) + self.pending_counts['misses']
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else None,
+            'entries': entries,
+        }
+
+def open_cache(index_loc, max_entries, cache_filename=DEFAULT_QUERY_CACHE_FILENAME):
+    """
+    Open the query cache of this index. Use with the "with" statement.
+    """
+    return QueryCache(Path(index_loc).joinpath(cache_filename), max_entries)
+
+def open_cache_if_enabled(index_loc, config):
+    """
+    The index's query cache if the query_cache.enabled setting is on, else a context manager yielding None.
+    """
+    if config is None or not config.getboolean('query_cache', 'enabled'):
+        return contextlib.nullcontext()
+    return open_cache(index_loc, config.getint('query_cache', 'max_entries'))
+
+def cached_search(index_manager, query_cache, terms, n_hits=5, filters=None, offset=0, fields=None):
+    """
+    LuceneManager.search() through query_cache (may be None), for the version of the index the manager has open.
+    """
+    if query_cache is None:
+        return index_manager.search(terms, n_hits=n_hits, filters=filters, offset=offset, fields=fields)
+    key = make_key(terms, filters, offset, n_hits, fields)
+    index_version = index_manager.version()
+    results = query_cache.get(index_version, key)
+    if results is None:
+        results = index_manager.search(terms, n_hits=n_hits, filters=filters, offset=offset, fields=fields)
+        query_cache.put(index_version, key, results)
+    return results
@@ -0,0 +1,227 @@
+import os
+import time
+
+"""
+Single-pass directory walker used to build work plans.
+One os.scandir() walk visits each directory once, prunes ignored directories before descending,
+and routes each file to its importer by extension. Stat results come from the DirEntry objects.
+"""
+
+# Default ignored file path components
+IGNORE_PATHS = ['.siftindex']
+
+# directories modified this recently can change again within the same modified time tick: they aren't trusted to be unchanged next time
+RACY_SECONDS = 2
+
+def match_extension(file_name, extensions):
+    """
+    Return the longest whitelisted extension that file_name ends with, or None.
+    e.g. "archive.tar.gz" matches "tar.gz" before "gz".
+    """
+    dot = file_name.find('.')
+    while dot != -1:
+        candidate = file_name[dot + 1:]
+        if candidate in extensions:
+            return candidate
+        dot = file_name.find('.', dot + 1)
+    return None
+
+def root_prefix(base_path):
+    """
+    Prefix of the file names scan_tree() yields under base_path: none for the current directory.
+    Normalized ("./d/" and "d" both give "d/"), so keys don't depend on how the path is spelled, and match str(Path) keys of older indexes.
+    """
+    base_path = os.path.normpath(str(base_path))
+    return '' if base_path == '.' else os.path.join(base_path, '')
+
+def is_ignored(fname, ignore_paths=IGNORE_PATHS):
+    """
+    Whether a path has an ignored component, i.e. scan_tree() would not visit it.
+    """
+    return any(part in ignore_paths for part in fname.split(os.sep))
+
+def _sorted_entries(prefix, ignore_paths):
+    """
+    List a directory as (entry, is_dir) pairs, sorted so that a depth-first walk yields full paths in string order:
+    directories sort by name + separator, since every path under them starts that way.
+    """
+    try:
+        with os.scandir(prefix or '.') as entries:
+            listing = []
+            for entry in entries:
+                if entry.name in ignore_paths:
+                    continue
+                try:
+                    # don't follow directory symlinks, to avoid cycles
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                listing.append((entry.name + os.sep if is_dir else entry.name, entry, is_dir))
+    except (PermissionError, FileNotFoundError, NotADirectoryError):
+        return iter([])
+    listing.sort(key=lambda item: item[0])
+    return ((entry, is_dir) for _, entry, is_dir in listing)
+
+def scan_tree(base_path, extensions, ignore_paths=IGNORE_PATHS):
+    """
+    Walk base_path once.
+    Yields (fname, extension, last_mod) tuples for files whose extension is whitelisted, sorted by fname:
+        - fname: path to file, prefixed by base_path (unless base_path is the current directory)
+        - extension: matched key from extensions
+        - last_mod: last modified time as unix timestamp
+    """
+    extensions = frozenset(extensions)
+    ignore_paths = frozenset(ignore_paths)
+    prefix = root_prefix(base_path)
+    # explicit stack of directory listings instead of recursion: trees can be arbitrarily deep
+    stack = [(prefix, _sorted_entries(prefix, ignore_paths))]
+    while stack:
+        prefix, listing = stack[-1]
+        item = next(listing, None)
+        if item is None:
+            stack.pop()
+            continue
+        entry, is_dir = item
+        if is_dir:
+            child_prefix = prefix + entry.name + os.sep
+            stack.append((child_prefix, _sorted_entries(child_prefix, ignore_paths)))
+            continue
+        extension = match_extension(entry.name, extensions)
+        if extension is None:
+            continue
+        try:
+            if not entry.is_file():
+                continue
+            last_mod = entry.stat().st_mtime  # unix timestamp
+        except OSError:
+            # e.g. broken symlink or file removed mid-walk
+            continue
+        yield (prefix + entry.name, extension, last_mod)
+
+def parent_directory(directory):
+    """
+    Parent of a directory prefix as scan_tree_pruned() keys them ("a/b/" -> "a/", "a/" -> "").
+    """
+    return directory[:directory.rstrip(os.sep).rfind(os.sep) + 1]
+
+def _directory_mtime(prefix):
+    try:
+        return os.stat(prefix or '.').st_mtime
+    except OSError:
+        return None
+
+def scan_tree_pruned(base_path, extensions, known_directories, known_files, observed, ignore_paths=IGNORE_PATHS):
+    """
+    Like scan_tree(), but directories whose modified time hasn't changed since the last scan are not listed:
+    their files come from known_files, without a stat() call each.
+        - known_directories: dict of directory prefix (path ending with a separator, like fnames start) to modified time, from the last scan
+        - known_files: iterable of (fname, last_mod) sorted by fname, from the last scan
+        - observed: dict this fills in with the modified times of directories listed from disk, and None for known directories that are gone
+          (or changed too recently to trust their modified time next time)
+    Subdirectories of unchanged directories are still checked: a change deep in a tree doesn't change its ancestors' modified times.
+    Neither does a file changed in place (rather than replaced), so only a full scan sees those: pass no known_directories.
+    """
+    extensions = frozenset(extensions)
+    ignore_paths = frozenset(ignore_paths)
+    children = {}
+    for directory in known_directories:
+        if directory:
+            children.setdefault(parent_directory(directory), []).append(directory)
+    known_files = iter(known_files)
+    # next known file not yet read past. The walk goes in fname order, so known files are read in one pass
+    head = [next(known_files, None)]
+    started = time.time()
+
+    def skip_to(fname):
+        while head[0] is not None and head[0][0] < fname:
+            head[0] = next(known_files, None)
+
+    def known_listing(prefix):
+        """
+        Entries of an unchanged directory, in the same order as _sorted_entries(): its known subdirectories and files,
+        and subdirectories with known files but no saved modified time (e.g. forgotten after a racy scan), which are then listed from disk.
+        """
+        subdirectories = sorted(children.get(prefix, []))
+        i = 0
+        # last subdirectory yielded: known files under it were read, or found gone, when it was walked
+        visited = None
+        while True:
+            skip_to(prefix)
+            name = None
+            unknown = None
+            while head[0] is not None and head[0][0].startswith(prefix):
+                fname = head[0][0]
+                rest = fname[len(prefix):]
+                if os.sep not in rest:
+                    name = rest
+                    break
+                if visited is not None and fname.startswith(visited):
+                    head[0] = next(known_files, None)
+                    continue
+                if i < len(subdirectories) and fname >= subdirectories[i]:
+                    # under the next subdirectory: read when it is visited
+                    break
+                # under a subdirectory whose modified time isn't known: it sorts before the next known one
+                unknown = prefix + rest[:rest.index(os.sep) + 1]
+                break
+            if name is not None and (i == len(subdirectories) or prefix + name < subdirectories[i]):
+                last_mod = head[0][1]
+                head[0] = next(known_files, None)
+                yield (name, False, last_mod)
+            elif unknown is not None:
+                visited = unknown
+                yield (unknown[len(prefix):-1], True, None)
+            elif i < len(subdirectories):
+                visited = subdirectories[i]
+                yield (subdirectories[i][len(prefix):-1], True, None)
+                i += 1
+            else:
+                return
+
+    def disk_listing(prefix):
+        """Entries of a directory listed from disk; known subdirectories that are gone are marked in observed."""
+        names = set()
+        for entry, is_dir in _sorted_entries(prefix, ignore_paths):
+            if is_dir:
+                names.add(prefix + entry.name + os.sep)
+            yield (entry.name, is_dir, entry)
+        for directory in children.get(prefix, []):
+            if directory not in names:
+                observed[directory] = None
+
+    def listing(prefix, mtime):
+        if mtime is not None and known_directories.get(prefix) == mtime:
+            return known_listing(prefix)
+        observed[prefix] = None if mtime is None or mtime > started - RACY_SECONDS else mtime
+        return disk_listing(prefix)
+
+    prefix = root_prefix(base_path)
+    stack = [(prefix, listing(prefix, _directory_mtime(prefix)))]
+    while stack:
+        prefix, entries = stack[-1]
+        item = next(entries, None)
+        if item is None:
+            stack.pop()
+            continue
+        name, is_dir, entry = item
+        if is_dir:
+            child_prefix = prefix + name + os.sep
+            mtime = _directory_mtime(child_prefix)
+            if mtime is None:
+                observed[child_prefix] = None
+                continue
+            stack.append((child_prefix, listing(child_prefix, mtime)))
+            continue
+        extension = match_extension(name, extensions)
+        if extension is None:
+            continue
+        if isinstance(entry, os.DirEntry):
+            try:
+                if not entry.is_file():
+                    continue
+                last_mod = entry.stat().st_mtime
+            except OSError:
+                continue
+        else:
+            last_mod = entry
+        yield (prefix + name, extension, last_mod)
@@ -1,8 +1,151 @@
-def execute_query(match_text, after_date=None, before_date=None):
-    pass
+import json
+import re
+import time
+from datetime import datetime, timezone
+from . import server, query_cache
+from .scanner import root_prefix
 
-def format_results(results):
+"""
+Search entry point for the command line: filters, query server or in-process search, and output.
+Filters restrict results by last modified time, extension and path prefix.
+They are applied as non-scoring Lucene FILTER clauses, so they don't change ranking and Lucene can cache them across queries.
+Lucene is only imported once there is no query server to ask: with one running, sift query doesn't start a JVM.
+"""
+
+DATE_FORMATS = ['%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S']
+# relative dates: "30d" is 30 days ago
+RELATIVE_DATE = re.compile(r'^(\d+)([hdw])$')
+RELATIVE_UNIT_SECONDS = {'h': 3600, 'd': 86400, 'w': 7 * 86400}
+# ... are counted from the current time rounded down to this, so repeated searches share a query cache key
+RELATIVE_DATE_RESOLUTION_SECONDS = 60
+
+# sift query --format: human readable text, one JSON object per line, one JSON array, or NUL-separated paths (for xargs -0)
+OUTPUT_FORMATS = ['text', 'ndjson', 'json', 'paths0']
+
+def parse_date(text, now=None):
+    """
+    Unix timestamp of a local date or time (2019-02-28, 2019-02-28T22:17), or of a time ago (12h, 30d, 2w; from now, to the minute).
+    """
+    match = RELATIVE_DATE.match(text)
+    if match:
+        if now is None:
+            now = time.time() // RELATIVE_DATE_RESOLUTION_SECONDS * RELATIVE_DATE_RESOLUTION_SECONDS
+        return now - int(match.group(1)) * RELATIVE_UNIT_SECONDS[match.group(2)]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).timestamp()
+        except ValueError:
+            pass
+    raise ValueError('Expected a date like 2019-02-28 or 2019-02-28T22:17, or a time ago like 30d, got: %s' % text)
+
+def make_filters(after_date=None, before_date=None, extensions=(), path_prefix=None, index_loc='.'):
+    """
+    Filters for LuceneManager.search(): files modified at or after after_date and before before_date (unix timestamps),
+    with one of these extensions, under this path prefix (relative to index_loc, the index root).
+    Returns None if there is nothing to filter on.
+    """
+    filters = {}
+    if after_date is not None:
+        filters['after'] = after_date
+    if before_date is not None:
+        filters['before'] = before_date
+    if extensions:
+        filters['extensions'] = [extension.lstrip('.').lower() for extension in extensions]
+    if path_prefix:
+        # keys are file names as scanned: the index root (unless it is the current directory), then the relative path
+        filters['path_prefix'] = root_prefix(index_loc) + re.sub(r'^(\./)+', '', path_prefix)
+    return filters or None
+
+def iter_query(index_loc, match_text, filters=None, offset=0, limit=5, fields=None, config=None):
+    """
+    Generator over results: up to [limit] (None for all) after the first [offset].
+    Asks a running query server if there is one (all results are streamed over one connection); otherwise opens the index here.
+    Only limited queries go through the query cache.
+    fields: result fields to fill in, see LuceneManager.iter_hits().
+    """
+    if limit is None:
+        results = server.stream(index_loc, match_text, filters=filters, offset=offset, fields=fields)
+    else:
+        results = server.query(index_loc, match_text, n_hits=limit, filters=filters, offset=offset, fields=fields)
+    if results is not None:
+        yield from results
+        return
+    from . import lucene_manager
+    # read-only: doesn't take the write lock, so queries can run alongside each other and alongside sift update
+    with lucene_manager.LuceneManager(index_loc, read_only=True, config=config) as index_manager:
+        if limit is None:
+            # streamed, not cached
+            yield from index_manager.iter_search(match_text, filters=filters, offset=offset, fields=fields)
+            return
+        with query_cache.open_cache_if_enabled(index_loc, index_manager.config) as cache:
+            results = query_cache.cached_search(index_manager, cache, match_text, n_hits=limit, filters=filters, offset=offset,
+                                                fields=fields or lucene_manager.RESULT_FIELDS)
+        yield from results
+
+def execute_query(index_loc, match_text, after_date=None, before_date=None, extensions=(), path_prefix=None, n_hits=5, config=None):
+    """
+    Returns a list of the top n_hits results.
+    """
+    filters = make_filters(after_date, before_date, extensions, path_prefix, index_loc)
+    return list(iter_query(index_loc, match_text, filters=filters, limit=n_hits, config=config))
+
+def result_fields(output_format, snippet=False):
+    """
+    Result fields an output format prints (None: all of them). Without excerpts, the highlighter isn't run.
+    """
+    if output_format == 'text':
+        return None
+    if output_format == 'paths0':
+        return ['fullpath']
+    return ['fullpath', 'last_modified_time', 'score'] + (['excerpt'] if snippet else [])
+
+def format_document(document_result):
+    """
+    pretty print
+    """
+    def pprint_unix_timestamp(ts):
+        """
+        returns e.g. 2019-02-28 22:17:55 EST
+        ref: https://stackoverflow.com/a/40769643/130164
+        """
+        utc_time = datetime.fromtimestamp(int(ts), timezone.utc)
+        local_time = utc_time.astimezone()
+        return local_time.strftime("%Y-%m-%d %H:%M:%S %Z")
+
+    return '=== {fullpath} ({last_modified_time}) ===\n{excerpt}'.format(
+        fullpath=document_result['fullpath'],
+        last_modified_time=pprint_unix_timestamp(document_result['last_modified_time']),
+        # score=document_result['score'],
+        excerpt=document_result.get('excerpt', '')
+    )
+
+def to_record(result):
+    """
+    Result as a JSON-ready dict: path, mtime (unix timestamp), score, and snippet if the result has an excerpt.
+    """
+    record = {'path': result['fullpath'], 'mtime': int(result['last_modified_time']), 'score': result['score']}
+    if 'excerpt' in result:
+        record['snippet'] = result['excerpt']
+    return record
+
+def format_results(results, output_format='text'):
     """
-    pretty print results
+    Generator of output text for results, written as each result is read.
     """
-    pass
\ No newline at end of file
+    if output_format == 'text':
+        for r in results:
+            yield format_document(r) + '\n\n'
+    elif output_format == 'ndjson':
+        for r in results:
+            yield json.dumps(to_record(r)) + '\n'
+    elif output_format == 'json':
+        separator = '[\n'
+        for r in results:
+            yield separator + json.dumps(to_record(r))
+            separator = ',\n'
+        yield '[]\n' if separator == '[\n' else '\n]\n'
+    elif output_format == 'paths0':
+        for r in results:
+            yield r['fullpath'] + '\0'
+    else:
+        raise ValueError('Unknown output format %r, expected one of: %s' % (output_format, ', '.join(OUTPUT_FORMATS)))
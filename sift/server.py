@@ -0,0 +1,203 @@
+import contextlib
+import itertools
+import json
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from . import query_cache as sift_query_cache
+
+"""
+Long-running query server.
+`sift serve` keeps the JVM, index reader and searcher warm and answers queries over a Unix socket inside .siftindex/,
+so `sift query` skips JVM startup and opening the index. The reader is refreshed when the index has new commits.
+Protocol: one JSON object per line in each direction. A request with "stream" set (sift query --all) is answered with
+pages of results, one per line, until a line with "done" set, all over the same connection.
+Nothing on the client side (query(), stream(), _send()) imports Lucene: sift query tries the server before paying for that.
+"""
+
+DEFAULT_SOCKET_FILENAME = '.siftindex/query.sock'
+
+# sift query gives up on a server that doesn't answer within this long, and searches in-process
+CLIENT_TIMEOUT_SECONDS = 30
+# the server drops a connection with no request for this long, so clients that stall can't pile up
+SERVER_TIMEOUT_SECONDS = 60
+# results per line of a streamed response
+STREAM_PAGE_SIZE = 500
+
+def get_socket_path(index_loc, socket_filename=DEFAULT_SOCKET_FILENAME):
+    return Path(index_loc).joinpath(socket_filename)
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    timeout = SERVER_TIMEOUT_SECONDS
+
+    def handle(self):
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    if request.get('stream'):
+                        with contextlib.closing(self.server.iter_request_pages(request)) as pages:
+                            for page in pages:
+                                self.respond({'results': page})
+                        response = {'results': [], 'done': True}
+                    else:
+                        response = {'results': self.server.run_request(request)}
+                except (socket.timeout, BrokenPipeError, ConnectionResetError):
+                    raise
+                except Exception as error:
+                    response = {'error': '%s: %s' % (type(error).__name__, error)}
+                self.respond(response)
+        except (socket.timeout, BrokenPipeError, ConnectionResetError):
+            pass  # idle or gone: the client falls back to searching in-process
+
+    def respond(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Each connection gets its own thread, so a client that stalls only holds up itself.
+    Requests still run one at a time, behind a lock: refresh() swaps the reader the searches use.
+    Streams only hold the lock while they read a page, and the reader isn't refreshed while any is in progress:
+    their searchAfter position only holds for the reader they started on.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, index_manager, query_cache=None):
+        """
+        query_cache: optional .query_cache.QueryCache of results.
+        """
+        self.index_manager = index_manager
+        self.query_cache = query_cache
+        self.lock = threading.Lock()
+        # streamed requests in progress
+        self.streams = 0
+        super().__init__(str(socket_path), QueryHandler)
+
+    def refresh(self):
+        """
+        Pick up commits made since the last query, e.g. by sift update, unless a stream is in progress. Call with the lock held.
+        """
+        if not self.streams:
+            self.index_manager.refresh()
+
+    def run_request(self, request):
+        from .lucene_manager import RESULT_FIELDS, attach_current_thread
+        if request.get('ping'):
+            return []
+        attach_current_thread()
+        with self.lock:
+            self.refresh()
+            return sift_query_cache.cached_search(
+                self.index_manager, self.query_cache, request['terms'], n_hits=request.get('n_hits', 5), filters=request.get('filters'),
+                offset=request.get('offset', 0), fields=request.get('fields') or RESULT_FIELDS)
+
+    def iter_request_pages(self, request):
+        """
+        Generator over all results of a streamed request, STREAM_PAGE_SIZE at a time. Not cached, like --all in-process.
+        """
+        from .lucene_manager import RESULT_FIELDS, attach_current_thread
+        attach_current_thread()
+        with self.lock:
+            self.refresh()
+            self.streams += 1
+        try:
+            results = self.index_manager.iter_search(request['terms'], filters=request.get('filters'), offset=request.get('offset', 0),
+                                                      fields=request.get('fields') or RESULT_FIELDS)
+            while True:
+                with self.lock:
+                    page = list(itertools.islice(results, STREAM_PAGE_SIZE))
+                if not page:
+                    return
+                yield page
+        finally:
+            with self.lock:
+                self.streams -= 1
+
+def _send(socket_path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(CLIENT_TIMEOUT_SECONDS)
+        client.connect(str(socket_path))
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as response:
+            return _receive(response)
+
+def _receive(response):
+    line = response.readline()
+    if not line:
+        raise ConnectionResetError('Query server closed the connection')
+    return json.loads(line)
+
+def query(index_loc, terms, n_hits=5, filters=None, offset=0, fields=None, socket_filename=DEFAULT_SOCKET_FILENAME):
+    """
+    Run a query through a running server: up to n_hits results after the first [offset].
+    filters: see search.make_filters(). fields: result fields to return, see LuceneManager.iter_hits().
+    Returns None if no server is running, so the caller can search in-process instead.
+    """
+    socket_path = get_socket_path(index_loc, socket_filename)
+    if not socket_path.exists():
+        return None
+    try:
+        response = _send(socket_path, {'terms': terms, 'n_hits': n_hits, 'filters': filters, 'offset': offset, 'fields': fields})
+    except OSError:
+        # stale socket left behind by a server that died, a server that hangs (socket.timeout),
+        # or a socket path too long for AF_UNIX on deep index paths
+        return None
+    if 'error' in response:
+        raise RuntimeError('Query server error: %s' % response['error'])
+    return response['results']
+
+def stream(index_loc, terms, filters=None, offset=0, fields=None, socket_filename=DEFAULT_SOCKET_FILENAME):
+    """
+    Run a query through a running server: all results after the first [offset], over one connection, as the server reads them.
+    See query() for the arguments. Returns None if no server is running, otherwise a generator over results.
+    """
+    socket_path = get_socket_path(index_loc, socket_filename)
+    if not socket_path.exists():
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(CLIENT_TIMEOUT_SECONDS)
+        client.connect(str(socket_path))
+        client.sendall(json.dumps({'terms': terms, 'filters': filters, 'offset': offset, 'fields': fields, 'stream': True}).encode('utf-8') + b'\n')
+        response = client.makefile('rb')
+        first_page = _receive(response)
+    except OSError:
+        # as in query()
+        client.close()
+        return None
+    return _iter_stream(client, response, first_page)
+
+def _iter_stream(client, response, page):
+    with client, response:
+        while True:
+            if 'error' in page:
+                raise RuntimeError('Query server error: %s' % page['error'])
+            yield from page['results']
+            if page.get('done'):
+                return
+            try:
+                page = _receive(response)
+            except OSError:
+                raise RuntimeError('Query server stopped')
+
+def serve(index_loc, socket_filename=DEFAULT_SOCKET_FILENAME, config=None):
+    """
+    Serve queries until interrupted.
+    """
+    from .lucene_manager import LuceneManager
+    socket_path = get_socket_path(index_loc, socket_filename)
+    if socket_path.exists():
+        try:
+            _send(socket_path, {'ping': True})
+        except (ConnectionRefusedError, FileNotFoundError):
+            socket_path.unlink()  # stale
+        else:
+            raise RuntimeError('A query server is already running on %s' % socket_path)
+    with LuceneManager(index_loc, read_only=True, config=config) as index_manager, sift_query_cache.open_cache_if_enabled(index_loc, config) as query_cache:
+        with QueryServer(socket_path, index_manager, query_cache) as server:
+            try:
+                server.serve_forever()
+            finally:
+                socket_path.unlink()
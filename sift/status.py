@@ -1,136 +1,222 @@
-import pandas as pd
-from . import metadata_manager
-from pathlib import Path
+import os
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from . import metadata_manager, profiling
+from .hashing import file_hash
 from .importers.registry import IMPORTER_REGISTRY
-from functional import seq
+from .scanner import scan_tree, scan_tree_pruned, IGNORE_PATHS
 
 """
 These methods are responsible for checking status of current index and formulating work plan to update current index with changed files.
+Plans are streams of records sorted by file name, so the last index details and the current tree are compared in a single merge-join pass.
 """
 
-# Default ignored file path components
-IGNORE_PATHS = ['.siftindex']
+# per-file details, as stored by metadata_manager. content_hash is only known for hashed files
+FileRecord = namedtuple('FileRecord', ['fname', 'last_mod', 'strategy', 'strategy_version', 'extension', 'content_hash'], defaults=[None])
 
-def file_list(base_path, extension, ignore_paths=IGNORE_PATHS):
-    """
-    Get file attributes on paths matching this extension that are confirmed to be files.
-    Returns list of { fname: "filename", last_mod: "last modified time as unix timestamp" } dictionaries
-    """
-    all_files_with_extension = Path(base_path).glob('**/*.%s' % extension)
+# one entry of a work plan. old and new are FileRecords, or None for new and deleted files respectively
+Change = namedtuple('Change', ['kind', 'fname', 'old', 'new'])
+
+# change kinds
+NEW_FILE = 'new_files'
+DELETED_FILE = 'deleted_files'
+UPDATED_FILE = 'updated_files'
+DIFF_STRATEGY = 'diff_strategy'
+NEWER_STRATEGY = 'newer_strategy'
+TOUCHED_FILE = 'touched_files' # modified time changed but content hash didn't: metadata-only update
+UNCHANGED = 'unchanged'
+
+# change kinds whose files get (re-)imported
+IMPORT_KINDS = [NEW_FILE, UPDATED_FILE, DIFF_STRATEGY, NEWER_STRATEGY]
+
+# metadata store property: extensions the saved directory modified times were scanned for
+SCANNED_EXTENSIONS_KEY = 'sift.scanned_extensions'
 
-    confirm_is_file = lambda path: path.is_file()
-    no_ignore = lambda path: not any([part in ignore_paths for part in path.parts])
-    def get_file_attributes(path):
-        return {
-            'fname': str(path),
-            'last_mod': path.stat().st_mtime  # unix timestamp
-        }
+# work queued per worker thread, bounding memory while a work plan streams through a thread pool
+QUEUED_PER_JOB = 4
 
-    return (seq(all_files_with_extension)
-        .filter(confirm_is_file) # confirm it's a file
-        .filter(no_ignore) # confirm not in an ignored file path
-        .map(get_file_attributes) # transform into file attributes dict
-        .to_list()
-    )
+# pretty-print headers. Unchanged files are not shown
+STATUS_HEADERS = {
+    NEW_FILE: 'New',
+    DELETED_FILE: 'Deleted',
+    UPDATED_FILE: 'Updated',
+    DIFF_STRATEGY: 'New importer available',
+    NEWER_STRATEGY: 'Updated importer available',
+    TOUCHED_FILE: 'Touched (content unchanged)',
+}
 
-def make_plan_from_scratch(index_loc, strategies):
+def make_plan_from_scratch(index_loc, strategies, ignore_paths=IGNORE_PATHS):
     """
-    Plan how to index this directory from scratch.
+    Plan how to index this directory from scratch, in a single walk of the tree.
     Arguments:
         - index_loc: directory to analyze
         - strategies: dict mapping file extensions to their Importer strategies
-    Returns: pandas dataframe with columns:
-        - relative path to file (index)
+    Returns: generator of FileRecords sorted by fname, with:
+        - relative path to file
         - last modified time (as unix timestamp)
         - importer strategy name
         - importer strategy version
+        - extension (explicit because of cases like .tar.gz which would be hard to extract from fname)
+    """
+    return plan_records(scan_tree(index_loc, strategies.keys(), ignore_paths), strategies)
+
+def make_plan_pruned(index_loc, strategies, known_directories, known_details, observed, ignore_paths=IGNORE_PATHS):
+    """
+    Like make_plan_from_scratch(), but only directories whose modified time changed since known_directories are listed;
+    files of the others are planned from known_details (FileRecords sorted by fname), with the current strategies.
+    Directory modified times read from disk go into observed, see scanner.scan_tree_pruned().
+    """
+    known_files = ((record.fname, record.last_mod) for record in known_details)
+    return plan_records(scan_tree_pruned(index_loc, strategies.keys(), known_directories, known_files, observed, ignore_paths), strategies)
+
+def plan_records(scan_results, strategies):
+    """
+    FileRecords for (fname, extension, last_mod) tuples from a scan.
+    """
+    # strategy fields looked up once per extension, and shared by its records
+    fields = {extension: (strategy.__name__, strategy.version) for extension, strategy in strategies.items()}
+    make_record = FileRecord._make
+    for fname, extension, last_mod in scan_results:
+        strategy_name, strategy_version = fields[extension]
+        yield make_record((fname, last_mod, strategy_name, strategy_version, extension, None))
+
+def scanned_extensions(strategies):
+    return ','.join(sorted(strategies.keys()))
+
+def load_directories(index_loc, strategies):
+    """
+    Directory modified times saved by the last update, if its scan looked for the same extensions; else an empty dict.
+    """
+    with metadata_manager.open_store(index_loc) as store:
+        if store.get_property(SCANNED_EXTENSIONS_KEY) != scanned_extensions(strategies):
+            # files with newly indexed extensions could be in any directory
+            return {}
+        return store.get_directories()
+
+def classify_change(old, new):
     """
-    def make_plan_per_extension(extension, strategy):
-        files = file_list(index_loc, extension)
-        if len(files) == 0:
-            return metadata_manager.make_empty_index()
-        df = pd.DataFrame.from_records(
-            files,
-            index='fname' # requires files to be non-empty
-        )
-        df['strategy'] = strategy.__name__
-        df['strategy_version'] = strategy.version
-        # specifying extension explicitly because of cases like .tar.gz which would be hard to extract from fname
-        df['extension'] = extension
-        return df
-    return pd.concat([make_plan_per_extension(extension, strategy) for extension, strategy in strategies.items()])
+    Classify a file present in both the last index details and the new plan.
+    A different strategy takes precedence over a newer strategy version, which takes precedence over a different modified time.
+    Any difference in modified time counts as updated, including older times (e.g. a file restored from backup).
+    """
+    if new.strategy != old.strategy:
+        return DIFF_STRATEGY
+    if new.strategy_version > old.strategy_version:
+        return NEWER_STRATEGY
+    if new.last_mod != old.last_mod:
+        return UPDATED_FILE
+    return UNCHANGED
 
 def diff_work_between_plans(last_index_details, new_plan):
     """
     Compares new plan to index this directory from scratch against the last plan that was executed.
-    Returns list of changes that, if applied to last_index_details, would transform it into new_plan:
+    Both are iterables of FileRecords sorted by fname; they are consumed lazily in one pass.
+    Yields Changes that, if applied to last_index_details, would transform it into new_plan:
         - new files
         - removed files
-        - files with newer date modified
+        - files with different date modified
         - files with different strategy
-        - files with same strategy but different strategy version
-
-    Not handled: files with older date modified
-    """
-    df = pd.merge(
-        last_index_details,
-        new_plan,
-        left_index=True,
-        right_index=True,
-        how='outer',
-        suffixes=('_old', '_new'),
-        indicator=True
-    )
-    rollups = {
-        'new_files': df.loc[df['_merge'] == 'right_only'],
-        'deleted_files': df.loc[df['_merge'] == 'left_only'],
-        'updated_files': df.loc[(df['_merge'] == 'both') & (
-            df['last_mod_new'] > df['last_mod_old'])],
-        'diff_strategy': df.loc[(df['_merge'] == 'both') & (
-            df['strategy_new'] != df['strategy_old'])],
-        'newer_strategy': df.loc[(df['_merge'] == 'both') & (
-            df['strategy_version_new'] > df['strategy_version_old']) & (
-            df['strategy_new'] == df['strategy_old'])],
-        'unchanged': df.loc[(df['_merge'] == 'both') & (
-            df['last_mod_new'] == df['last_mod_old']) & (
-            df['strategy_version_new'] == df['strategy_version_old']) & (
-            df['strategy_new'] == df['strategy_old'])]
-    }
-    assert sum([value.shape[0] for key,value in rollups.items()]) == df.shape[0]
-    return rollups
+        - files with same strategy but newer strategy version
+        - unchanged files
+    """
+    last_index_details = iter(last_index_details)
+    new_plan = iter(new_plan)
+    # runs once per file: _make() skips the keyword handling of Change(...)
+    make_change = Change._make
+    old = next(last_index_details, None)
+    new = next(new_plan, None)
+    while old is not None and new is not None:
+        if old.fname < new.fname:
+            yield make_change((DELETED_FILE, old.fname, old, None))
+            old = next(last_index_details, None)
+        elif new.fname < old.fname:
+            yield make_change((NEW_FILE, new.fname, None, new))
+            new = next(new_plan, None)
+        else:
+            yield make_change((classify_change(old, new), new.fname, old, new))
+            old = next(last_index_details, None)
+            new = next(new_plan, None)
+    # one side is exhausted: the rest of the other is all deleted, or all new
+    while old is not None:
+        yield make_change((DELETED_FILE, old.fname, old, None))
+        old = next(last_index_details, None)
+    while new is not None:
+        yield make_change((NEW_FILE, new.fname, None, new))
+        new = next(new_plan, None)
+
+def _with_content_hash(change, hash_future):
+    if hash_future is None:
+        return change
+    try:
+        content_hash = hash_future.result()
+    except OSError:
+        # e.g. removed since the walk; the importer will report it
+        return change
+    new = change.new._replace(content_hash=content_hash)
+    if change.kind == UPDATED_FILE and change.old.content_hash == content_hash:
+        return Change(TOUCHED_FILE, change.fname, change.old, new)
+    return change._replace(new=new)
+
+def hash_changes(work_plan, jobs=None):
+    """
+    Fingerprint the contents of files about to be imported, on a pool of [jobs] threads (default: number of CPUs).
+    Streams: changes come out in the same order, at most a few per thread behind the input.
+    Updated files whose content hash matches the last index details become touched files, which skip the importer.
+    """
+    jobs = jobs or os.cpu_count()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        window = deque()
+        for change in work_plan:
+            hash_future = pool.submit(file_hash, change.fname) if change.kind in IMPORT_KINDS else None
+            window.append((change, hash_future))
+            if len(window) >= jobs * QUEUED_PER_JOB:
+                yield _with_content_hash(*window.popleft())
+        while window:
+            yield _with_content_hash(*window.popleft())
+
+def pending_changes(work_plan):
+    """
+    Filter a work plan down to changes that require action.
+    """
+    return (change for change in work_plan if change.kind != UNCHANGED)
+
+def format_change(change):
+    return '{header}: {fname}'.format(header=STATUS_HEADERS[change.kind], fname=change.fname)
 
 def format_status(work_plan):
     """
-    Pretty-print a plan to update last index.
-    """
-    headers_and_data = [
-        ("New", work_plan['new_files']),
-        ("Deleted", work_plan['deleted_files']),
-        ("Updated", work_plan['updated_files']),
-        ("New importer available", work_plan['diff_strategy']),
-        ("Updated importer available", work_plan['newer_strategy']),
-        # ("Unchanged", work_plan['unchanged']), # debug only
-    ]
-    section_separator = '\n'
-    def make_section(header, data):
-        def get_file_names(diff_plan):
-            return '\n'.join(diff_plan.index.values)
-
-        if len(data) == 0:
-            return None
-
-        return "{header}:\n{filenames}".format(
-            header=header,
-            filenames=get_file_names(data)
-        )
-
-    section_outputs = [make_section(header, data)
-                       for (header, data) in headers_and_data]
-    return section_separator.join(filter(lambda s: s != None, section_outputs))
-
-def status(index_loc):
+    Pretty-print a plan to update last index, one line per changed file.
+    Generator, so output can be shown while the tree is still being walked.
+    """
+    return (format_change(change) for change in pending_changes(work_plan))
+
+def iter_last_index_details(index_loc):
+    """
+    Stream the last index details as FileRecords sorted by fname.
+    """
+    with metadata_manager.open_store(index_loc) as store:
+        yield from map(FileRecord._make, store.iter_details())
+
+def status(index_loc, strategies=IMPORTER_REGISTRY, content_hash=False, jobs=None, prune_directories=False, directories=None):
+    """
+    Returns the work plan to bring the index up to date: a generator of Changes sorted by fname.
+    content_hash: fingerprint new and changed files (on [jobs] threads), so files that were only touched skip re-importing.
+    prune_directories: only list directories that changed since the last update. Files changed in place
+    don't change their directory's modified time, so they are missed.
+    directories: optional dict, filled in with the directory modified times seen while the plan is consumed,
+    to save with the changes, see update.update().
+    """
     assert metadata_manager.index_exists(index_loc), "Index doesn't exist."
-    return diff_work_between_plans(
-        metadata_manager.last_index_details(index_loc),
-        make_plan_from_scratch(index_loc, IMPORTER_REGISTRY)
-    )
+    if prune_directories:
+        known_directories, known_details = load_directories(index_loc, strategies), iter_last_index_details(index_loc)
+    else:
+        # every directory is listed, so the scan needs no records (and no second read of the store)
+        known_directories, known_details = {}, iter(())
+    work_plan = profiling.profiled_iter('diff', diff_work_between_plans(
+        iter_last_index_details(index_loc),
+        profiling.profiled_iter('scan', make_plan_pruned(index_loc, strategies, known_directories, known_details,
+                                                         {} if directories is None else directories))
+    ))
+    if content_hash:
+        work_plan = profiling.profiled_iter('hash', hash_changes(work_plan, jobs))
+    return work_plan
@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+"""
+On-disk cache of importer output.
+Extracted text only depends on the file's content, the importer and how much of its output was kept (index.max_indexed_mb),
+so it is keyed by (content hash, strategy, strategy version, text limit).
+Index rebuilds, strategy changes that come back to an old importer, and moved or copied files then skip the importer.
+Text is stored zlib-compressed; least recently used entries are evicted once the cache grows past its size limit.
+"""
+
+DEFAULT_CACHE_FILENAME = '.siftindex/text_cache.db'
+
+# commit cache writes every this many puts; the cache can lose recent entries in a crash, which is harmless
+COMMIT_EVERY_PUTS = 100
+
+# bump when the entries table changes: older caches are dropped, not migrated
+SCHEMA_VERSION = 2
+
+# text_limit of entries holding an importer's whole output
+NO_LIMIT = -1
+
+# after eviction, the cache is at most this fraction of its limit, so eviction doesn't run on every put
+EVICT_TO_FRACTION = 0.9
+
+class TextCache(object):
+    """
+    Thread-safe: importer threads share one connection behind a lock, compressing and decompressing outside it.
+    Used with the "with" statement.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.connection.execute('DROP TABLE IF EXISTS entries')
+            self.connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS entries (
+            content_hash TEXT NOT NULL,
+            strategy TEXT NOT NULL,
+            strategy_version REAL NOT NULL,
+            text_limit INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (content_hash, strategy, strategy_version, text_limit)
+        )''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+        self.total_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        self.puts_since_commit = 0
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.connection.commit()
+        self.connection.close()
+
+    def get(self, content_hash, strategy, strategy_version, text_limit=None):
+        """
+        Returns cached text, or None.
+        text_limit: the max_bytes the text was cut to when it was put, None for the whole output.
+        """
+        key = _key(content_hash, strategy, strategy_version, text_limit)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT data FROM entries WHERE content_hash = ? AND strategy = ? AND strategy_version = ? AND text_limit = ?', key).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                'UPDATE entries SET last_used = ? WHERE content_hash = ? AND strategy = ? AND strategy_version = ? AND text_limit = ?',
+                (time.time(),) + key)
+        return zlib.decompress(row[0]).decode('utf-8', errors='surrogateescape')
+
+    def put(self, content_hash, strategy, strategy_version, text, text_limit=None):
+        data = zlib.compress(text.encode('utf-8', errors='surrogateescape'))
+        if len(data) > self.max_bytes:
+            return
+        key = _key(content_hash, strategy, strategy_version, text_limit)
+        with self.lock:
+            previous = self.connection.execute(
+                'SELECT size FROM entries WHERE content_hash = ? AND strategy = ? AND strategy_version = ? AND text_limit = ?',
+                key).fetchone()
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)', key + (data, len(data), time.time()))
+            self.total_bytes += len(data) - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TO_FRACTION))
+            self.puts_since_commit += 1
+            if self.puts_since_commit >= COMMIT_EVERY_PUTS:
+                self.connection.commit()
+                self.puts_since_commit = 0
+
+    def _evict(self, target_bytes):
+        """
+        Delete least recently used entries until the cache holds at most target_bytes. Call with the lock held.
+        """
+        evicted = []
+        for key_and_size in self.connection.execute(
+                'SELECT content_hash, strategy, strategy_version, text_limit, size FROM entries ORDER BY last_used'):
+            if self.total_bytes <= target_bytes:
+                break
+            evicted.append(key_and_size[:4])
+            self.total_bytes -= key_and_size[4]
+        self.connection.executemany(
+            'DELETE FROM entries WHERE content_hash = ? AND strategy = ? AND strategy_version = ? AND text_limit = ?', evicted)
+
+def _key(content_hash, strategy, strategy_version, text_limit):
+    return (content_hash, strategy, strategy_version, NO_LIMIT if text_limit is None else text_limit)
+
+def open_cache(index_loc, max_bytes, cache_filename=DEFAULT_CACHE_FILENAME):
+    """
+    Open the text cache of this index. Use with the "with" statement.
+    """
+    return TextCache(Path(index_loc).joinpath(cache_filename), max_bytes)
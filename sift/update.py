@@ -1,89 +1,278 @@
-from . import metadata_manager
-import pandas as pd
+from . import metadata_manager, profiling
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from .importers.registry import IMPORTER_REGISTRY
-from .lucene_manager import make_document
+from .importers.importer import limit_text
+from .lucene_manager import make_document, attach_current_thread
+from .hashing import file_hash
+from .status import NEW_FILE, DELETED_FILE, TOUCHED_FILE, IMPORT_KINDS, QUEUED_PER_JOB, SCANNED_EXTENSIONS_KEY, scanned_extensions
 
-def update(index_loc, index_manager, work_plan, delete=False, strategies=IMPORTER_REGISTRY, verbose=False):
+# defaults for the update.commit_every_* settings
+COMMIT_EVERY_DOCS = 1000
+COMMIT_EVERY_SECONDS = 60
+
+# stored with each Lucene commit and in the metadata store, to check they were saved together
+GENERATION_KEY = 'sift.generation'
+
+def update(index_loc, index_manager, work_plan, delete=False, strategies=IMPORTER_REGISTRY, verbose=False, jobs=None,
+           commit_every_docs=COMMIT_EVERY_DOCS, commit_every_seconds=COMMIT_EVERY_SECONDS, text_cache=None, max_indexed_bytes=None,
+           store_body=True, directories=None):
     """
     Execute a work plan from .status.status() to update index.
+    The work plan is consumed as a stream; importing starts while it is still being computed.
+    Importers run in a pool of [jobs] threads (default: number of CPUs); the calling thread is the only one writing to the index.
+    Strategies with a batch_size above 1 get their files in batches, through run_batch().
+    Commits every [commit_every_docs] files or [commit_every_seconds] seconds, whichever comes first.
+    Each commit saves the metadata of the files it covers, so an interrupted update resumes where it stopped.
+    text_cache: optional .text_cache.TextCache of importer output, checked before running importers.
+    max_indexed_bytes: index at most this much text of each file; importers that stream are not read further.
+    store_body: keep each file's text in the index, for search excerpts.
+    directories: directory modified times filled in by .status.status() as the work plan was computed.
+    They are saved with the last commit, except for directories with changes left to do (failures, and deleted files unless delete),
+    so the next status only lists directories that changed since.
+    Returns dict mapping file names that failed to import to their exception. Failures don't stop the batch.
     """
     assert metadata_manager.index_exists(index_loc), "Index doesn't exist."
+    jobs = jobs or os.cpu_count()
+
+    failures = {}
+    missing_fnames = []
+
+    with metadata_manager.open_store(index_loc) as store:
+        # Each Lucene commit is tagged with a generation number, which is saved to the metadata store right after.
+        # If the index is ahead, the last update stopped in between: files of its last commit are in the index
+        # but not in the metadata, so they show up as new again and must be replaced rather than inserted twice.
+        metadata_generation = int(store.get_property(GENERATION_KEY) or 0)
+        index_generation = int(index_manager.last_commit_data().get(GENERATION_KEY, 0))
+        recovering = index_generation > metadata_generation
+        generation = max(index_generation, metadata_generation)
+        if verbose and recovering:
+            print('Recovering from an interrupted update.')
+
+        # metadata changes since the last commit: records of imported files, and file names to forget
+        changed_details = []
+        deleted_fnames = []
+        last_commit_time = time.monotonic()
+
+        def commit():
+            nonlocal generation, last_commit_time
+            generation += 1
+            with profiling.span('commit'):
+                index_manager.commit({GENERATION_KEY: generation})
+            with profiling.span('metadata'):
+                store.upsert(changed_details)
+                store.delete(deleted_fnames)
+                store.set_property(GENERATION_KEY, generation)
+                store.commit()
+            changed_details.clear()
+            deleted_fnames.clear()
+            last_commit_time = time.monotonic()
+
+        def commit_if_due():
+            if (len(changed_details) + len(deleted_fnames) >= commit_every_docs
+                    or time.monotonic() - last_commit_time >= commit_every_seconds):
+                commit()
+
+        def write_result(change, result):
+            """Write one finished import (a document, or the exception raised importing it) to the index."""
+            if isinstance(result, Exception):
+                # keep previous details (or stay unindexed) so the file is retried next time
+                failures[change.fname] = result
+                if verbose:
+                    print('Failed: %s (%s)' % (change.fname, result))
+                return
+            if change.kind == NEW_FILE and not recovering:
+                with profiling.span('index write'):
+                    inserted_key = index_manager.insert(result)
+                if verbose:
+                    print('Inserted: %s' % inserted_key)
+            else:
+                with profiling.span('index write'):
+                    updated_key = index_manager.update(change.fname, result)
+                if verbose:
+                    print('Updated: %s' % updated_key)
+            changed_details.append(change.new)
+            commit_if_due()
+
+        # importers mostly wait on pandoc/pdftotext subprocesses, so threads are enough to use all cores
+        with ThreadPoolExecutor(max_workers=jobs, initializer=attach_current_thread) as pool:
+            # future -> (changes it imports, whether it is a batch). Batches return a list of documents or exceptions
+            pending = {}
+            # changes waiting to be submitted together, per importer strategy with batch_size > 1
+            batches = {}
+
+            def write_finished(return_when):
+                done, _ = wait(pending, return_when=return_when)
+                for future in done:
+                    changes, batch = pending.pop(future)
+                    try:
+                        results = future.result() if batch else [future.result()]
+                    except Exception as error:
+                        results = [error] * len(changes)
+                    for change, result in zip(changes, results):
+                        write_result(change, result)
+
+            def submit(future, changes, batch=False):
+                pending[future] = (changes, batch)
+                if len(pending) >= jobs * QUEUED_PER_JOB:
+                    # write to the index in completion order
+                    write_finished(FIRST_COMPLETED)
+
+            def submit_batch(strategy):
+                changes = batches.pop(strategy)
+                submit(pool.submit(perform_batch, strategy, changes, text_cache=text_cache, max_bytes=max_indexed_bytes,
+                                   store_body=store_body), changes, batch=True)
+
+            # execute new_files, updated_files, new importer, updated importer, and maybe deletions
+            for change in work_plan:
+                if change.kind == DELETED_FILE:
+                    missing_fnames.append(change.fname)
+                    if delete:
+                        with profiling.span('index write'):
+                            deleted_key = index_manager.delete(change.fname)
+                        deleted_fnames.append(change.fname)
+                        if verbose:
+                            print('Deleted: %s' % deleted_key)
+                        commit_if_due()
+                elif change.kind == TOUCHED_FILE:
+                    # content unchanged: the index is already up to date
+                    changed_details.append(change.new)
+                    commit_if_due()
+                elif change.kind in IMPORT_KINDS:
+                    strategy = strategies[change.new.extension]
+                    if strategy.batch_size > 1:
+                        batches.setdefault(strategy, []).append(change)
+                        if len(batches[strategy]) >= strategy.batch_size:
+                            submit_batch(strategy)
+                    else:
+                        submit(pool.submit(perform_single_file, strategies, change.new.extension, change.fname, change.new.last_mod,
+                                           text_cache=text_cache, content_hash=change.new.content_hash, max_bytes=max_indexed_bytes,
+                                           store_body=store_body), [change])
+            for strategy in list(batches):
+                submit_batch(strategy)
+            while pending:
+                write_finished(FIRST_COMPLETED)
+
+        if verbose and missing_fnames:
+            print('Missing objects removed from index.' if delete else 'Missing objects NOT removed from index.')
+
+        if directories is not None:
+            save_directories(store, directories, strategies, list(failures) + ([] if delete else missing_fnames))
+
+        # commit remaining changes
+        commit()
+    return failures
+
 
-    # execute new_files, updated_files, new importer, updated importer, and maybe deletions
-    if delete:
-        for fname, _, __ in extract_file_info(work_plan['deleted_files']):
-            deleted_key = index_manager.delete(fname)
-            if verbose:
-                print('Deleted: %s' % deleted_key)
-    if verbose and len(work_plan['deleted_files']) > 0:
-        print('Missing objects removed from index.' if delete else 'Missing objects NOT removed from index.')
-
-    for fname, extension, modified_time in extract_file_info(work_plan['new_files']):
-        inserted_key = index_manager.insert(
-            perform_single_file(strategies, extension, fname, modified_time)
-        )
-        if verbose:
-            print('Inserted: %s' % inserted_key)
-
-    for df_key in ['updated_files', 'diff_strategy', 'newer_strategy']:
-        for fname, extension, modified_time in extract_file_info(work_plan[df_key]):
-            updated_key = index_manager.update(
-                fname,
-                perform_single_file(strategies, extension, fname, modified_time)
-            )
-            if verbose:
-                print('Updated: %s' % updated_key)
-
-    # commit changes
-    index_manager.commit()
-
-    # update our index metadata
-    new_index_details = summarize_new_index_status(work_plan, delete)
-    metadata_manager.save_index_details(new_index_details, index_loc)
-
-
-def extract_file_info(df):
+def save_directories(store, directories, strategies, pending_fnames):
     """
-    Convenience generator over file names, file extensions, and file modified times from a work plan dataframe.
+    Save directory modified times from a scan, forgetting the directories of files with changes still pending.
     """
-    for fname, row in df[['extension_new', 'last_mod_new']].iterrows():  # fname is index
-        yield (fname, row['extension_new'], row['last_mod_new'])
+    directories = dict(directories)
+    for fname in pending_fnames:
+        directories[os.path.join(os.path.dirname(fname), '')] = None
+    store.save_directories(directories)
+    store.set_property(SCANNED_EXTENSIONS_KEY, scanned_extensions(strategies))
 
-def perform_single_file(strategies, extension, file_path, modified_time):
+
+def perform_single_file(strategies, extension, file_path, modified_time, text_cache=None, content_hash=None, max_bytes=None, store_body=True):
+    """
+    Launches and executes an importer strategy, unless its output for this content is in text_cache. Then transforms into a lucene document.
+    content_hash: fingerprint of the file as of modified_time, if already known.
+    max_bytes: keep at most this much of the importer's output.
+    """
+    strategy = strategies[extension]
+    if text_cache is None:
+        contents = run_importer(strategy, extension, file_path, max_bytes)
+    else:
+        if content_hash is None:
+            content_hash = file_hash(file_path)
+        with profiling.span('text cache'):
+            contents = text_cache.get(content_hash, strategy.__name__, strategy.version, max_bytes)
+        if contents is None:
+            stat_before = _file_stat(file_path)
+            contents = run_importer(strategy, extension, file_path, max_bytes)
+            if _unchanged_since_hashed(file_path, modified_time, stat_before):
+                with profiling.span('text cache'):
+                    text_cache.put(content_hash, strategy.__name__, strategy.version, contents, max_bytes)
+    return make_document(file_path, modified_time, contents, store_body=store_body, extension=extension)
+
+
+def run_importer(strategy, extension, file_path, max_bytes=None):
+    """
+    Instantiate and run an importer strategy over a file, keeping at most max_bytes of its output. Profiled as an "import" span.
+    """
+    with profiling.span('import', strategy=strategy.__name__, extension=extension) as span:
+        importer = strategy()
+        importer.max_bytes = max_bytes
+        contents = limit_text(importer.run_stream(file_path), max_bytes)
+        if profiling.enabled():
+            span.bytes = _file_size(file_path)
+            span.detail = file_path
+    return contents
+
+
+def _file_stat(file_path):
+    """
+    (size, modified time) of a file, or None if it can't be read.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def _unchanged_since_hashed(file_path, modified_time, stat_before):
     """
-    Launches and executes an importer strategy. Then transforms into a lucene document.
+    Whether the importer read the contents the content hash was computed for: the file still has the modified time it was
+    scanned (and hashed) with, and didn't change while it was imported. Otherwise its output must not be cached under that hash.
     """
-    importer_strategy = strategies[extension]() # instantiate
-    contents = importer_strategy.run(file_path)
-    return make_document(file_path, modified_time, contents)
+    return stat_before is not None and stat_before[1] == modified_time and _file_stat(file_path) == stat_before
+
+
+def _file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
 
-def summarize_new_index_status(work_plan, delete):
+def perform_batch(strategy, changes, text_cache=None, max_bytes=None, store_body=True):
     """
-    return new_files, updated_files, new importer, updated importer, and maybe deletions
+    Like perform_single_file() for several changes imported by the same strategy, with one run_batch() call for the files not in text_cache.
+    Returns a list with a lucene document, or the exception raised importing it, for each change.
     """
-    choose_newer = ['new_files', 'updated_files', 'diff_strategy', 'newer_strategy', 'unchanged']
-    all_dfs = pd.concat([work_plan[key] for key in choose_newer])
-    all_dfs = all_dfs.drop(['last_mod_old', 'strategy_old', 'strategy_version_old', 'extension_old'], axis=1)
-    all_dfs = all_dfs.rename(columns={
-        'last_mod_new': 'last_mod',
-        'strategy_new': 'strategy',
-        'strategy_version_new': 'strategy_version',
-        'extension_new': 'extension'
-    })
-    if not delete:
-        # concat deleted files
-        choose_older_df = work_plan['deleted_files'].copy()
-        choose_older_df = choose_older_df.drop(['last_mod_new', 'strategy_new', 'strategy_version_new', 'extension_new'], axis=1)
-        choose_older_df = choose_older_df.rename(columns={
-            'last_mod_old': 'last_mod',
-            'strategy_old': 'strategy',
-            'strategy_version_old': 'strategy_version',
-            'extension_old': 'extension'
-        })
-        all_dfs = pd.concat([all_dfs, choose_older_df])
-    all_dfs = all_dfs.drop(['_merge'], axis=1)
-    # assert we have only the expected columns
-    column_diff = set(all_dfs.columns).symmetric_difference(
-        set(['extension', 'last_mod', 'strategy', 'strategy_version']))
-    assert len(column_diff) == 0, column_diff
-    return all_dfs
+    contents = [None] * len(changes)
+    content_hashes = [change.new.content_hash for change in changes]
+    if text_cache is not None:
+        for i, change in enumerate(changes):
+            try:
+                if content_hashes[i] is None:
+                    content_hashes[i] = file_hash(change.fname)
+                contents[i] = text_cache.get(content_hashes[i], strategy.__name__, strategy.version, max_bytes)
+            except Exception as error:
+                contents[i] = error
+    to_import = [i for i, text in enumerate(contents) if text is None]
+    if to_import:
+        fnames = [changes[i].fname for i in to_import]
+        stats_before = {i: _file_stat(changes[i].fname) for i in to_import} if text_cache is not None else {}
+        with profiling.span('import', strategy=strategy.__name__, extension='(batch)') as span:
+            importer = strategy()
+            importer.max_bytes = max_bytes
+            imported = importer.run_batch(fnames)
+            if profiling.enabled():
+                span.bytes = sum(_file_size(fname) for fname in fnames)
+                span.detail = fnames
+        for i, text in zip(to_import, imported):
+            if not isinstance(text, Exception):
+                text = limit_text([text], max_bytes)
+            contents[i] = text
+            if (text_cache is not None and not isinstance(text, Exception)
+                    and _unchanged_since_hashed(changes[i].fname, changes[i].new.last_mod, stats_before[i])):
+                text_cache.put(content_hashes[i], strategy.__name__, strategy.version, text, max_bytes)
+    return [
+        text if isinstance(text, Exception) else make_document(change.fname, change.new.last_mod, text, store_body=store_body, extension=change.new.extension)
+        for change, text in zip(changes, contents)
+    ]
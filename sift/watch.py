@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from . import metadata_manager, status, update
+from .importers.registry import IMPORTER_REGISTRY
+from .scanner import IGNORE_PATHS, match_extension, root_prefix, is_ignored
+from .status import FileRecord, Change, NEW_FILE, DELETED_FILE
+
+try:
+    # optional: inotify (Linux), FSEvents (macOS) or ReadDirectoryChangesW (Windows) events
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+"""
+Continuous incremental indexing: `sift watch` keeps the index open and applies file system events as they arrive.
+Events are collected by a watchdog observer thread and debounced: once the tree has been quiet for a moment,
+the changed paths are checked against the metadata store and the resulting work plan goes through update.update(),
+which commits it. Between events the process sleeps.
+Events can be missed (watch limits, network file systems, changes while not watching), so the whole tree is
+also reconciled with a full status scan on start and then every watch.reconcile_seconds.
+Without watchdog installed, these scans are all there is.
+"""
+
+# defaults for the watch.* settings
+DEBOUNCE_SECONDS = 1.0
+RECONCILE_SECONDS = 3600.0
+
+# apply events at least this many debounce periods after the first one, even if the tree keeps changing
+MAX_DEBOUNCE_PERIODS = 10
+
+# watchdog event types that can change what is indexed; others (opened, closed_no_write) are ignored
+CHANGE_EVENTS = frozenset(['created', 'deleted', 'modified', 'moved', 'closed'])
+
+class ChangeCollector(object):
+    """
+    Watchdog event handler accumulating the paths that changed, as file names relative to the index like scan_tree()'s.
+    Thread-safe: the observer thread adds paths, the watch loop takes them.
+    """
+
+    def __init__(self, index_loc, ignore_paths=IGNORE_PATHS):
+        self.root = os.path.abspath(index_loc)
+        self.prefix = root_prefix(index_loc)
+        self.ignore_paths = ignore_paths
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.files = set()
+        self.directories = set()
+        self.first_event_time = None
+        self.last_event_time = None
+
+    def to_fname(self, path):
+        """
+        File name of an event path as the metadata store has it, or None if it is outside the index or ignored.
+        """
+        relative_path = os.path.relpath(os.path.abspath(os.fsdecode(path)), self.root)
+        if relative_path == '.' or relative_path.startswith(os.pardir + os.sep) or is_ignored(relative_path, self.ignore_paths):
+            return None
+        return self.prefix + relative_path
+
+    def dispatch(self, event):
+        if event.event_type not in CHANGE_EVENTS:
+            return
+        # directories: only creations, deletions and moves matter, changes to their files have events of their own
+        if event.is_directory and event.event_type not in ('created', 'deleted', 'moved'):
+            return
+        fnames = [self.to_fname(event.src_path)]
+        if event.event_type == 'moved':
+            fnames.append(self.to_fname(event.dest_path))
+        fnames = [fname for fname in fnames if fname is not None]
+        if not fnames:
+            return
+        with self.lock:
+            (self.directories if event.is_directory else self.files).update(fnames)
+            now = time.monotonic()
+            if self.first_event_time is None:
+                self.first_event_time = now
+            self.last_event_time = now
+            self.changed.set()
+
+    def wait(self, timeout=None):
+        """
+        Block until there are changes to take, or timeout seconds. Returns whether there are.
+        """
+        return self.changed.wait(timeout)
+
+    def quiet_for(self, debounce_seconds):
+        """
+        Seconds left before the changes are due: debounce_seconds after the last event, or a few debounce periods after the first.
+        """
+        with self.lock:
+            if self.first_event_time is None:
+                return 0
+            due = min(self.last_event_time + debounce_seconds, self.first_event_time + debounce_seconds * MAX_DEBOUNCE_PERIODS)
+        return max(due - time.monotonic(), 0)
+
+    def take(self):
+        """
+        Returns (files, directories) that changed since the last call, as sets of file names.
+        """
+        with self.lock:
+            files, directories = self.files, self.directories
+            self.files, self.directories = set(), set()
+            self.first_event_time = self.last_event_time = None
+            self.changed.clear()
+        return files, directories
+
+def current_record(fname, strategies, ignore_paths=IGNORE_PATHS):
+    """
+    FileRecord of a file as it is now, like make_plan_from_scratch() would plan it, or None if it wouldn't be indexed.
+    """
+    if is_ignored(fname, ignore_paths):
+        return None
+    extension = match_extension(os.path.basename(fname), strategies.keys())
+    if extension is None:
+        return None
+    try:
+        if not os.path.isfile(fname):
+            return None
+        last_mod = os.stat(fname).st_mtime
+    except OSError:
+        return None
+    strategy = strategies[extension]
+    return FileRecord(fname, last_mod, strategy.__name__, strategy.version, extension)
+
+def plan_changes(store, files, directories, strategies, ignore_paths=IGNORE_PATHS):
+    """
+    Work plan for these changed files and directories (file names, as from ChangeCollector.take()), sorted by fname.
+    Directories are diffed against their metadata in full, since moving or deleting one only has a directory event.
+    """
+    changes = {}
+    for directory in sorted(directories):
+        last_details = (FileRecord._make(record) for record in store.iter_details(prefix=os.path.join(directory, '')))
+        for change in status.diff_work_between_plans(last_details, status.make_plan_from_scratch(directory, strategies, ignore_paths)):
+            changes[change.fname] = change
+    for fname in files:
+        if fname in changes:
+            continue
+        record = store.get(fname)
+        old = None if record is None else FileRecord._make(record)
+        new = current_record(fname, strategies, ignore_paths)
+        if old is None and new is None:
+            continue
+        if old is None:
+            changes[fname] = Change(NEW_FILE, fname, None, new)
+        elif new is None:
+            changes[fname] = Change(DELETED_FILE, fname, old, None)
+        else:
+            changes[fname] = Change(status.classify_change(old, new), fname, old, new)
+    return [changes[fname] for fname in sorted(changes)]
+
+def watch(index_loc, index_manager, strategies=IMPORTER_REGISTRY, delete=False, verbose=False, jobs=None, content_hash=False,
+          debounce_seconds=DEBOUNCE_SECONDS, reconcile_seconds=RECONCILE_SECONDS, stop_event=None, **update_options):
+    """
+    Keep the index up to date with its tree until stop_event (a threading.Event) is set; forever by default.
+    index_manager is kept open throughout: each batch of changes is written and committed by update.update(),
+    with delete, strategies, verbose, jobs and update_options passed through.
+    content_hash: fingerprint changed files as status.status() does, so touched files skip re-importing.
+    Returns dict mapping file names that failed to import to their exception, as of their last attempt.
+    """
+    assert metadata_manager.index_exists(index_loc), "Index doesn't exist."
+    stop_event = stop_event or threading.Event()
+    collector = ChangeCollector(index_loc)
+    failures = {}
+
+    def apply(work_plan):
+        work_plan = status.pending_changes(work_plan)
+        if content_hash:
+            work_plan = status.hash_changes(work_plan, jobs)
+        first_change = next(work_plan, None)
+        if first_change is None:
+            return
+        batch = [first_change] + list(work_plan)
+        batch_failures = update.update(index_loc, index_manager, batch, delete=delete, strategies=strategies,
+                                       verbose=verbose, jobs=jobs, **update_options)
+        for change in batch:
+            failures.pop(change.fname, None)
+        failures.update(batch_failures)
+
+    observer = None
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(collector, collector.root, recursive=True)
+        observer.start()
+    elif verbose:
+        print('watchdog is not installed: checking for changes with a full scan every %d seconds' % reconcile_seconds)
+    try:
+        next_reconcile = 0
+        while not stop_event.is_set():
+            if time.monotonic() >= next_reconcile:
+                # a full scan covers the events pending so far
+                collector.take()
+                apply(status.diff_work_between_plans(
+                    status.iter_last_index_details(index_loc), status.make_plan_from_scratch(index_loc, strategies)))
+                next_reconcile = time.monotonic() + reconcile_seconds
+                continue
+            # idle until events arrive (or the next reconciliation), waking up now and then to check stop_event
+            if not collector.wait(min(max(next_reconcile - time.monotonic(), 0), debounce_seconds * MAX_DEBOUNCE_PERIODS)):
+                continue
+            remaining = collector.quiet_for(debounce_seconds)
+            while remaining > 0 and not stop_event.wait(remaining):
+                remaining = collector.quiet_for(debounce_seconds)
+            files, directories = collector.take()
+            with metadata_manager.open_store(index_loc) as store:
+                work_plan = plan_changes(store, files, directories, strategies)
+            apply(work_plan)
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+    return failures
@@ -0,0 +1,27 @@
+import sift.config
+from pytest import raises
+
+def test_defaults(tmpdir):
+    config = sift.config.load_config(str(tmpdir))
+    assert config.get('index', 'directory') == 'mmap'
+    assert config.getfloat('index', 'ram_buffer_mb') == 64
+    assert config.getboolean('index', 'use_compound_file')
+
+def test_precedence(tmpdir):
+    """
+    Command line overrides beat the config file, which beats defaults.
+    """
+    tmpdir.mkdir('.siftindex')
+    sift.config.save_setting(str(tmpdir), 'index.directory', 'nio')
+    sift.config.save_setting(str(tmpdir), 'index.ram_buffer_mb', '256')
+    config = sift.config.load_config(str(tmpdir), ['index.ram_buffer_mb=32', 'other.key = value'])
+    assert config.get('index', 'directory') == 'nio'
+    assert config.getfloat('index', 'ram_buffer_mb') == 32
+    assert config.get('other', 'key') == 'value'
+    assert config.get('index', 'merge_policy') == 'tiered'
+
+def test_bad_override(tmpdir):
+    with raises(ValueError):
+        sift.config.load_config(str(tmpdir), ['index.directory'])
+    with raises(ValueError):
+        sift.config.load_config(str(tmpdir), ['directory=nio'])
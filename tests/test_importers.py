@@ -1,5 +1,5 @@
-import sift.importers
-from pytest import fixture
+import sift.importers.registry, sift.importers.importer, sift.config
+from pytest import fixture, raises
 
 def test_markdown(datadir):
     # convert Path to str before sending to importer
@@ -7,8 +7,116 @@ def test_markdown(datadir):
     with open(datadir.join('output.txt'), 'r') as expected_output:
         assert sift.importers.pandoc_importer.PandocImporter().run(input_file) == expected_output.read()
 
-def test_pdf(datadir):
+def test_markdown_fast(datadir):
+    input_file = str(datadir.join('input.md'))
+    with open(datadir.join('output_markdown.txt'), 'r') as expected_output:
+        assert sift.importers.markdown_importer.MarkdownImporter().run(input_file) == expected_output.read()
+
+def test_strip_markdown():
+    lines = [
+        'Title',
+        '=====',
+        '> * [x] see [the docs](http://example.com) and ![a chart](chart.png), <b>now</b>',
+        '1. snake_case_name, *it*, ~~old~~, \\*literal\\*',
+        '```python',
+        'x = *y*',
+        '```',
+        '| a | b |',
+        '|---|:-:|',
+        '[docs]: http://example.com',
+        '## Closed ##',
+    ]
+    assert list(sift.importers.markdown_importer.strip_markdown(lines)) == [
+        'Title',
+        '',
+        'see the docs and a chart, now',
+        'snake_case_name, it, old, *literal*',
+        '',
+        'x = *y*',
+        '',
+        'a   b',
+        '',
+        '',
+        'Closed',
+    ]
+
+def test_registry_setting(tmpdir):
+    assert sift.importers.registry.get_registry(sift.config.load_config(str(tmpdir)))['md'] == sift.importers.markdown_importer.MarkdownImporter
+    config = sift.config.load_config(str(tmpdir), ['importers.md=pandoc', 'importers.pdf=pdftotext'])
+    registry = sift.importers.registry.get_registry(config)
+    assert registry['md'] == sift.importers.pandoc_importer.PandocImporter
+    assert registry['pdf'] == sift.importers.pdf_importer.PdftotextImporter
+    assert registry['txt'] == sift.importers.text_importer.TextImporter
+    with raises(ValueError, match='Unknown importer for .md'):
+        sift.importers.registry.get_registry(sift.config.load_config(str(tmpdir), ['importers.md=nope']))
+
+def test_pdftotext(datadir):
     # convert Path to str before sending to importer
     input_file = str(datadir.join('input2.pdf'))
     with open(datadir.join('output2.txt'), 'r') as expected_output:
-        assert sift.importers.pdf_importer.PdfImporter().run(input_file) == expected_output.read()
+        assert sift.importers.pdf_importer.PdftotextImporter().run(input_file) == expected_output.read()
+
+def test_pdf(datadir):
+    input_file = str(datadir.join('input2.pdf'))
+    # same words as pdftotext, with different whitespace
+    with open(datadir.join('output2.txt'), 'r') as expected_output:
+        assert sift.importers.pdf_importer.PdfImporter().run(input_file).split() == expected_output.read().split()
+
+def test_pdf_limits(datadir):
+    input_file = str(datadir.join('input2.pdf'))
+    assert sift.importers.pdf_importer.extract_text(input_file, max_bytes=0) == ''
+    # through the worker processes, with the limit update() sets from index.max_indexed_mb
+    importer = sift.importers.pdf_importer.PdfImporter()
+    importer.max_bytes = 9
+    assert importer.run(input_file) == 'My header'
+
+def test_markdown_batch(datadir):
+    # through pandoc-server if it is installed, else one pandoc per file; same output either way
+    input_file = str(datadir.join('input.md'))
+    with open(datadir.join('output.txt'), 'r') as expected_output:
+        expected = expected_output.read()
+    results = sift.importers.pandoc_importer.PandocImporter().run_batch([input_file, str(datadir.join('missing.md')), input_file])
+    assert results[0] == expected and results[2] == expected
+    assert isinstance(results[1], Exception)
+
+def test_pandoc_server_start_retries(mocker):
+    """
+    pandoc-server is started again on another port if it didn't come up, e.g. because its port was taken.
+    """
+    pandoc = sift.importers.pandoc_importer
+    mocker.patch.object(pandoc.shutil, 'which', return_value='/usr/bin/pandoc-server')
+    process = mocker.MagicMock()
+    start = mocker.patch.object(pandoc, '_start_server_process', side_effect=[(None, None), (process, 'http://127.0.0.1:1234')])
+    assert pandoc._start_server() == (process, 'http://127.0.0.1:1234')
+    assert start.call_count == 2
+    start.side_effect = [(None, None)] * pandoc.SERVER_START_ATTEMPTS
+    assert pandoc._start_server() == (None, None)
+
+def test_streaming_importers(datadir, tmpdir):
+    markdown_file = str(datadir.join('input.md'))
+    markdown_importer = sift.importers.markdown_importer.MarkdownImporter()
+    assert ''.join(markdown_importer.run_stream(markdown_file)) == markdown_importer.run(markdown_file)
+    pdf_file = str(datadir.join('input2.pdf'))
+    pdf_importer = sift.importers.pdf_importer.PdfImporter()
+    assert ''.join(pdf_importer.run_stream(pdf_file)) == pdf_importer.run(pdf_file)
+    text_file = tmpdir.join('big.txt')
+    text_file.write('abc' * 1000)
+    chunks = list(sift.importers.text_importer.TextImporter().read_file_chunks(str(text_file), chunk_chars=1024))
+    assert [len(chunk) for chunk in chunks] == [1024, 1024, 952]
+
+def test_limit_text():
+    read = []
+    closed = []
+    def chunks():
+        try:
+            for chunk in ['ab', 'cd', 'ef', 'gh']:
+                read.append(chunk)
+                yield chunk
+        finally:
+            closed.append(True)
+    assert sift.importers.importer.limit_text(chunks(), max_bytes=5) == 'abcde'
+    # stops reading at the limit
+    assert read == ['ab', 'cd', 'ef'] and closed == [True]
+    assert sift.importers.importer.limit_text(chunks()) == 'abcdefgh'
+    # doesn't split multi-byte characters
+    assert sift.importers.importer.limit_text(['a\u00e9'], max_bytes=2) == 'a'
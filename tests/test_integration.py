@@ -2,10 +2,9 @@
 using high-level interfaces from main.py
 """
 
-import sift.main, sift.metadata_manager
+import sift.main, sift.metadata_manager, sift.search, sift.scanner, sift.config, sift.watch, sift.lucene_manager
 import argparse
 from pytest import fixture
-from pandas.testing import assert_frame_equal
 from pathlib import Path
 
 
@@ -15,8 +14,8 @@ def args(datadir):
 
 @fixture
 def search_args(datadir):
-    def _search_args(terms):
-        return argparse.Namespace(path=str(datadir), delete_missing=False, terms=terms)
+    def _search_args(terms, **filters):
+        return argparse.Namespace(path=str(datadir), delete_missing=False, terms=terms, **filters)
     return _search_args
 
 @fixture
@@ -42,9 +41,23 @@ def test_repeated_reindex(prep_index, args):
     status_one = sift.main.get_status(args)
     sift.main.update_index(args)
     status_two = sift.main.get_status(args)
-    # status objects are dicts holding dataframes
-    for key in status_one.keys():
-        assert_frame_equal(status_one[key], status_two[key])
+    # status objects are lists of printed status lines
+    assert status_one == status_two
+
+def test_status_finds_in_place_edits(prep_index, args):
+    """
+    With default settings, a file rewritten in place is found even though its directory's modified time didn't change.
+    """
+    import os
+    sift.main.update_index(args)
+    directory = Path(args.path).joinpath('apple')
+    directory_stat = os.stat(str(directory))
+    edited = directory.joinpath('banana.md')
+    with open(str(edited), 'a') as f:
+        f.write('\nmore bananas\n')
+    os.utime(str(edited), (edited.stat().st_atime, edited.stat().st_mtime + 10))
+    os.utime(str(directory), ns=(directory_stat.st_atime_ns, directory_stat.st_mtime_ns))
+    assert sift.main.get_status(args) == ['Updated: %s' % (sift.scanner.root_prefix(args.path) + 'apple/banana.md')]
 
 def test_queries(prep_index, args, search_args):
     """
@@ -53,16 +66,36 @@ def test_queries(prep_index, args, search_args):
     sift.main.get_status(args)
     sift.main.update_index(args)
     # expect 1 result
-    assert len(sift.main.run_query(search_args(['apple']))) == 1
+    assert sift.main.run_query(search_args(['apple'])) == 1
 
     # OR or AND should work, expect 1 result
-    assert len(sift.main.run_query(search_args(['apple', 'banana']))) == 1
+    assert sift.main.run_query(search_args(['apple', 'banana'])) == 1
 
     # only OR should work, expect 1 result
-    assert len(sift.main.run_query(search_args(['apple', 'blackberry']))) == 1
+    assert sift.main.run_query(search_args(['apple', 'blackberry'])) == 1
 
     # only OR should work, expect 2 results
-    assert len(sift.main.run_query(search_args(['apple', 'apricot']))) == 2
+    assert sift.main.run_query(search_args(['apple', 'apricot'])) == 2
+
+def test_filtered_queries(prep_index, args, search_args):
+    """
+    init --> update --> query with extension, path and date filters
+    """
+    sift.main.update_index(args)
+    assert sift.main.run_query(search_args(['apple', 'apricot'], extensions=['pdf'])) == 1
+    assert sift.main.run_query(search_args(['apple', 'apricot'], path_prefix='apple/')) == 1
+    assert sift.main.run_query(search_args(['apple', 'apricot'], after=sift.search.parse_date('1d'))) == 2
+    assert sift.main.run_query(search_args(['apple', 'apricot'], before=sift.search.parse_date('2000-01-01'))) == 0
+
+def test_machine_readable_queries(prep_index, args, search_args, capsys):
+    """
+    Machine-readable formats print paths as stored, like text output: prefixed by --path, so they resolve from the current directory.
+    """
+    sift.main.update_index(args)
+    capsys.readouterr()
+    assert sift.main.run_query(search_args(['apple', 'apricot'], output_format='paths0')) == 2
+    root = sift.scanner.root_prefix(args.path)
+    assert sorted(capsys.readouterr().out.split('\0')) == ['', root + 'apple/banana.md', root + 'fruit.pdf']
 
 
 def test_repeated_index_new_files(prep_index, args, datadir):
@@ -78,3 +111,49 @@ def test_repeated_index_new_files(prep_index, args, datadir):
     Path(str(datadir)).joinpath('test10.md').touch()
 
     sift.main.update_index(args)
+
+def test_text_cache_follows_content_hash(args):
+    """
+    cache.enabled=auto (the default) only opens the text cache with status.content_hash on: its key is the content hash.
+    """
+    for overrides, expected in [([], False), (['status.content_hash=true'], True), (['cache.enabled=true'], True)]:
+        index_config = sift.config.load_config(args.path, overrides)
+        with sift.main.open_text_cache(args.path, index_config) as cache:
+            assert (cache is not None) == expected
+
+def test_interrupted_watch_rolls_back(prep_index, args, mocker):
+    """
+    Ctrl-C in the middle of a batch leaves neither the index nor the metadata with part of it, so the next update doesn't duplicate documents.
+    """
+    mocker.patch.object(sift.watch, 'Observer', None)
+    insert = sift.lucene_manager.LuceneManager.insert
+    inserted = []
+    def interrupting_insert(self, document):
+        if inserted:
+            raise KeyboardInterrupt
+        inserted.append(document)
+        return insert(self, document)
+    mocker.patch.object(sift.lucene_manager.LuceneManager, 'insert', interrupting_insert)
+    sift.main.watch_index(args)
+    assert len(inserted) == 1
+    assert sift.metadata_manager.last_index_details(args.path).shape[0] == 0
+    with sift.lucene_manager.LuceneManager(args.path, read_only=True) as index_manager:
+        assert index_manager.num_docs() == 0
+
+    mocker.stopall()
+    sift.main.update_index(args)
+    with sift.lucene_manager.LuceneManager(args.path, read_only=True) as index_manager:
+        assert index_manager.num_docs() == 2
+
+def test_update_rebuilds_older_index_format(prep_index, args):
+    """
+    An index written by an older version of sift (body without offsets) is rebuilt by the next update, without duplicates.
+    """
+    sift.main.update_index(args)
+    with sift.metadata_manager.open_store(args.path) as store:
+        store.set_property(sift.metadata_manager.INDEX_FORMAT_KEY, '1')
+    sift.main.update_index(args)
+    assert sift.metadata_manager.index_format_is_current(args.path)
+    assert sift.metadata_manager.last_index_details(args.path).shape[0] == 2
+    with sift.lucene_manager.LuceneManager(args.path, read_only=True) as index_manager:
+        assert index_manager.num_docs() == 2
@@ -1,5 +1,7 @@
-from sift.lucene_manager import LuceneManager, assert_document_equals, format_document, make_document
-from pytest import fixture
+from sift.config import load_config
+from sift.lucene_manager import LuceneManager, EMPTY_INDEX_VERSION, assert_document_equals, make_document, attach_current_thread
+from pytest import fixture, raises
+import threading
 import time
 
 @fixture
@@ -66,6 +68,61 @@ def test_insert_query_by_body(manager, document):
     assert len(results) == 1
     assert_document_equals(results[0], document)
 
+def test_search_excerpt(manager, document):
+    """
+    Matches in the body are highlighted in the excerpt.
+    """
+    manager.insert(document)
+    manager.commit()
+    results = list(manager.search('contents'))
+    assert len(results) == 1
+    assert '*contents*' in results[0]['excerpt']
+
+def test_rebuild_index_with_legacy_body(tmpdir, document):
+    """
+    An index whose body field was written without offsets (before index format 2) takes documents with offsets
+    once its documents are deleted, as sift update does when rebuilding it.
+    """
+    from org.apache.lucene.document import Field, TextField
+    legacy_document = make_document('test/legacy.txt', time.time(), 'Legacy contents')
+    legacy_document.removeField('body')
+    legacy_document.add(TextField('body', 'Legacy contents', Field.Store.YES))
+    with LuceneManager(index_root_loc=str(tmpdir)) as legacy_manager:
+        legacy_manager.insert(legacy_document)
+        legacy_manager.commit()
+    with LuceneManager(index_root_loc=str(tmpdir)) as rebuilt_manager:
+        rebuilt_manager.delete_all()
+        rebuilt_manager.insert(document)
+        rebuilt_manager.commit()
+        rebuilt_manager.refresh()
+        assert rebuilt_manager.num_docs() == 1
+        assert '*contents*' in rebuilt_manager.search('contents')[0]['excerpt']
+
+def test_unstored_body(manager):
+    """
+    A document whose body is not stored is still found by its body, without an excerpt.
+    """
+    manager.insert(make_document('test/unstored.txt', time.time(), 'Unstored contents', store_body=False))
+    manager.commit()
+    results = list(manager.search('unstored'))
+    assert len(results) == 1
+    assert results[0]['fullpath'] == 'test/unstored.txt'
+    assert results[0]['excerpt'] == ''
+
+def test_paginated_search(manager):
+    """
+    Paging with searchAfter returns the same hits as one big search, and only the requested fields.
+    """
+    for i in range(12):
+        manager.insert(make_document('test/page%02d.txt' % i, time.time(), 'paged contents ' * (i + 1)))
+    manager.commit()
+    all_paths = [r['fullpath'] for r in manager.search('paged', n_hits=100)]
+    assert len(all_paths) == 12
+    paged = list(manager.iter_hits(manager.make_query('paged'), offset=3, limit=7, fields=['fullpath'], page_size=2))
+    assert [r['fullpath'] for r in paged] == all_paths[3:10]
+    assert all(list(r.keys()) == ['fullpath'] for r in paged)
+    assert len(list(manager.iter_search('paged', offset=10))) == 2
+
 def test_update_document(manager, document, document_updated):
     """
     Insert a document, then update it, and confirm it was updated in index.
@@ -101,3 +158,96 @@ def test_analyzer(manager):
 
     tokens = manager.debug_analyzer('test_File-More1.tar.gz')
     assert tokens == ['test_file', 'more1', 'tar.gz'], tokens
+
+def test_read_only_cannot_write(manager, datadir, document):
+    with LuceneManager(index_root_loc=str(datadir), read_only=True) as read_only_manager:
+        with raises(AssertionError):
+            read_only_manager.insert(document)
+
+def test_read_only_before_first_commit(tmpdir, document):
+    """
+    A read-only manager on an index without commits, e.g. while the first sift update runs, finds nothing
+    instead of waiting for the write lock; refresh() picks up the first commit.
+    """
+    with LuceneManager(index_root_loc=str(tmpdir)) as writer_manager:
+        with LuceneManager(index_root_loc=str(tmpdir), read_only=True) as read_only_manager:
+            assert read_only_manager.search(document['fullpath']) == []
+            assert read_only_manager.version() == EMPTY_INDEX_VERSION
+            assert not read_only_manager.refresh()
+            writer_manager.insert(document)
+            writer_manager.commit()
+            assert read_only_manager.refresh()
+            assert len(read_only_manager.search(document['fullpath'])) == 1
+            assert read_only_manager.version() >= 0
+
+def test_read_only_queries_during_update(manager, datadir, document):
+    """
+    Read-only managers don't take the write lock: several can query at once while a writer keeps committing.
+    Each sees new commits after refresh().
+    """
+    manager.insert(document)
+    manager.commit()
+    n_threads, n_rounds = 4, 20
+    errors = []
+    hit_counts = []
+    doc_counts = []
+
+    def run_queries():
+        attach_current_thread()
+        try:
+            with LuceneManager(index_root_loc=str(datadir), read_only=True) as read_only_manager:
+                for _ in range(n_rounds):
+                    read_only_manager.refresh()
+                    hit_counts.append(len(read_only_manager.search(document['fullpath'])))
+                    doc_counts.append(read_only_manager.num_docs())
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=run_queries) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    # concurrent update
+    for i in range(n_rounds):
+        manager.insert(make_document('test/other%d.txt' % i, time.time(), 'Other contents'))
+        manager.commit()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(hit_counts) == n_threads * n_rounds
+    assert all(count == 1 for count in hit_counts)
+    assert all(1 <= count <= n_rounds + 1 for count in doc_counts)
+
+    # a fresh read-only manager sees everything that was committed
+    with LuceneManager(index_root_loc=str(datadir), read_only=True) as read_only_manager:
+        assert read_only_manager.num_docs() == n_rounds + 1
+
+def test_commit_user_data(manager, document):
+    """
+    User data stored with a commit is read back as strings.
+    """
+    manager.insert(document)
+    manager.commit({'sift.generation': 7})
+    assert manager.last_commit_data() == {'sift.generation': '7'}
+
+def test_optimize(manager):
+    """
+    Merging segments keeps every document and the last commit's user data.
+    """
+    for i in range(5):
+        manager.insert(make_document('test/segment%d.txt' % i, time.time(), 'Segment contents'))
+        manager.commit({'sift.generation': i})
+    assert manager.segment_count() > 1
+    manager.optimize()
+    assert manager.segment_count() == 1
+    assert manager.num_docs() == 5
+    assert manager.last_commit_data() == {'sift.generation': '4'}
+
+def test_parallel_search(manager, datadir):
+    for i in range(5):
+        manager.insert(make_document('test/segment%d.txt' % i, time.time(), 'Segment contents'))
+        manager.commit()
+    config = load_config(str(datadir), ['search.threads=4'])
+    with LuceneManager(index_root_loc=str(datadir), read_only=True, config=config) as parallel_manager:
+        assert parallel_manager.segment_count() > 1
+        assert [r['fullpath'] for r in parallel_manager.search('segment', n_hits=10)] == [r['fullpath'] for r in manager.search('segment', n_hits=10)]
@@ -0,0 +1,97 @@
+import sift.metadata_manager
+import pandas as pd
+import sqlite3
+from pytest import fixture
+from pandas.testing import assert_frame_equal
+
+@fixture
+def indexdir(tmpdir):
+    sift.metadata_manager.create_index(str(tmpdir))
+    return str(tmpdir)
+
+def test_empty_index_dtypes(indexdir):
+    assert_frame_equal(
+        sift.metadata_manager.last_index_details(indexdir),
+        sift.metadata_manager.make_empty_index()
+    )
+
+def test_upsert_and_delete_single_files(indexdir):
+    """
+    Per-file upserts replace existing rows; deletes remove only the named rows.
+    """
+    sift.metadata_manager.update_file_data(indexdir, 'b.txt', 1.0, 'TextImporter', 1.0, 'txt')
+    sift.metadata_manager.update_file_data(indexdir, 'a.md', 2.0, 'PandocImporter', 1.0, 'md')
+    sift.metadata_manager.update_file_data(indexdir, 'b.txt', 3.0, 'TextImporter', 1.0, 'txt')
+    with sift.metadata_manager.open_store(indexdir) as store:
+        assert store.count() == 2
+        assert store.get('b.txt') == ('b.txt', 3.0, 'TextImporter', 1.0, 'txt', None)
+        # streamed in file name order
+        assert [record[0] for record in store.iter_details()] == ['a.md', 'b.txt']
+
+    sift.metadata_manager.delete_file_data(indexdir, ['a.md', 'missing.txt'])
+    details = sift.metadata_manager.last_index_details(indexdir)
+    assert list(details.index) == ['b.txt']
+    assert details.loc['b.txt', 'last_mod'] == 3.0
+
+def test_migrate_legacy_csv(tmpdir):
+    """
+    An index written by older versions (metadata.csv) is migrated on first open.
+    """
+    tmpdir.mkdir('.siftindex').join('metadata.csv').write(
+        'fname,last_mod,strategy,strategy_version,extension\n'
+        'notes/a.md,1551400000.5,PandocImporter,1.0,md\n'
+    )
+    indexdir = str(tmpdir)
+    assert sift.metadata_manager.index_exists(indexdir)
+    details = sift.metadata_manager.last_index_details(indexdir)
+    assert list(details.index) == ['notes/a.md']
+    assert details.loc['notes/a.md', 'last_mod'] == 1551400000.5
+    assert not tmpdir.join('.siftindex', 'metadata.csv').exists()
+    assert tmpdir.join('.siftindex', 'metadata.csv.migrated').exists()
+
+def test_add_content_hash_column_to_old_store(tmpdir):
+    """
+    Stores created before content hashes get the column added on open.
+    """
+    tmpdir.mkdir('.siftindex')
+    connection = sqlite3.connect(str(tmpdir.join('.siftindex', 'metadata.db')))
+    connection.execute('CREATE TABLE files (fname TEXT PRIMARY KEY, last_mod REAL NOT NULL, strategy TEXT NOT NULL, '
+                       'strategy_version REAL NOT NULL, extension TEXT NOT NULL) WITHOUT ROWID')
+    connection.execute("INSERT INTO files VALUES ('a.txt', 1.0, 'TextImporter', 1.0, 'txt')")
+    connection.commit()
+    connection.close()
+
+    indexdir = str(tmpdir)
+    sift.metadata_manager.update_file_data(indexdir, 'b.txt', 2.0, 'TextImporter', 1.0, 'txt', 'blake2b:00')
+    with sift.metadata_manager.open_store(indexdir) as store:
+        assert list(store.iter_details()) == [
+            ('a.txt', 1.0, 'TextImporter', 1.0, 'txt', None),
+            ('b.txt', 2.0, 'TextImporter', 1.0, 'txt', 'blake2b:00'),
+        ]
+
+def test_iter_details_prefix(indexdir):
+    """
+    Records under a directory are a range of file names; siblings sharing the name's start are not included.
+    """
+    with sift.metadata_manager.open_store(indexdir) as store:
+        store.upsert([
+            (fname, 1.0, 'TextImporter', 1.0, 'txt', None)
+            for fname in ['a.txt', 'docs/a.txt', 'docs/sub/b.txt', 'docs0.txt', 'docs2/c.txt']
+        ])
+        assert [record[0] for record in store.iter_details(prefix='docs/')] == ['docs/a.txt', 'docs/sub/b.txt']
+        assert len(list(store.iter_details())) == 5
+
+def test_index_format(indexdir):
+    """
+    New indexes are in the current format. Forgetting all files leaves the next status with everything new.
+    """
+    assert sift.metadata_manager.index_format_is_current(indexdir)
+    sift.metadata_manager.update_file_data(indexdir, 'a.md', 1.0, 'MarkdownImporter', 1.0, 'md')
+    with sift.metadata_manager.open_store(indexdir) as store:
+        store.save_directories({'docs/': 1.0})
+        store.set_property(sift.metadata_manager.INDEX_FORMAT_KEY, '1')
+    assert not sift.metadata_manager.index_format_is_current(indexdir)
+    sift.metadata_manager.forget_all_files(indexdir)
+    with sift.metadata_manager.open_store(indexdir) as store:
+        assert store.count() == 0
+        assert store.get_directories() == {}
@@ -0,0 +1,86 @@
+import time
+import threading
+from pytest import fixture
+import sift.profiling, sift.update, sift.status
+from sift.importers.text_importer import TextImporter
+
+@fixture
+def profiler():
+    profiler = sift.profiling.enable(trace=True)
+    yield profiler
+    sift.profiling.disable()
+
+def summary_by_name(profiler):
+    return {row[0]: row for row in profiler.summary()}
+
+def test_disabled_is_a_no_op():
+    items = [1, 2]
+    assert sift.profiling.profiled_iter('scan', items) is items
+    with sift.profiling.span('import', strategy='TextImporter') as span:
+        span.bytes = 10
+    assert span is sift.profiling.NO_SPAN
+    assert not sift.profiling.enabled()
+
+def test_nested_spans_self_time(profiler):
+    with sift.profiling.span('outer'):
+        with sift.profiling.span('inner') as span:
+            span.bytes = 5
+            time.sleep(0.02)
+    rows = summary_by_name(profiler)
+    name, tags, count, total, self_total, p50, p95, items, n_bytes = rows['outer']
+    assert count == 1 and total >= 0.02
+    # the inner span's time is not the outer span's own
+    assert self_total < 0.01
+    assert rows['inner'][8] == 5
+
+def test_profiled_iter(profiler):
+    def slow_scan():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+    def diff(records):
+        for record in records:
+            yield record * 2
+    results = list(sift.profiling.profiled_iter('diff', diff(sift.profiling.profiled_iter('scan', slow_scan()))))
+    assert results == [0, 2, 4]
+    rows = summary_by_name(profiler)
+    assert rows['scan'][7] == 3 and rows['scan'][3] >= 0.03
+    # time spent pulling from the scan counts towards diff's total, not its self time
+    assert rows['diff'][3] >= rows['scan'][3]
+    assert rows['diff'][4] < 0.01
+
+def test_spans_from_threads(profiler):
+    def work():
+        with sift.profiling.span('import', extension='txt'):
+            pass
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    rows = profiler.summary()
+    assert [(row[0], row[1], row[2]) for row in rows] == [('import', {'extension': 'txt'}, 4)]
+    assert len({event['tid'] for event in profiler.trace_events()['traceEvents']}) >= 1
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert sift.profiling.percentile(values, 50) == 50
+    assert sift.profiling.percentile(values, 95) == 95
+    assert sift.profiling.percentile([3.0], 95) == 3.0
+    assert sift.profiling.percentile([], 50) is None
+
+def test_update_import_spans(profiler, tmpdir, mocker):
+    """
+    Importers are timed per strategy and extension, with the size of each file and its name in the trace.
+    """
+    mocker.patch.object(sift.update, 'make_document', side_effect=lambda file_path, modified_time, contents, **kwargs: contents)
+    path = tmpdir.join('a.txt')
+    path.write('hello')
+    sift.update.perform_single_file({'txt': TextImporter}, 'txt', str(path), 1.0)
+
+    row = summary_by_name(profiler)['import']
+    assert row[1] == {'strategy': 'TextImporter', 'extension': 'txt'}
+    assert row[8] == 5
+    event = profiler.trace_events()['traceEvents'][0]
+    assert event['args']['detail'] == str(path)
+    assert 'import' in sift.profiling.format_summary(profiler)
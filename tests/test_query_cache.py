@@ -0,0 +1,72 @@
+import sift.query_cache
+from pytest import fixture
+
+RESULTS = [{'fullpath': 'a.md', 'last_modified_time': '1551400000', 'score': 1.5, 'excerpt': '*apple*'}]
+
+@fixture
+def cache(tmpdir):
+    with sift.query_cache.open_cache(str(tmpdir), max_entries=2) as cache:
+        yield cache
+
+def test_keys():
+    assert sift.query_cache.make_key('apple  banana ') == sift.query_cache.make_key('apple banana')
+    assert sift.query_cache.make_key('apple') != sift.query_cache.make_key('apple', offset=5)
+    assert sift.query_cache.make_key('apple') != sift.query_cache.make_key('apple', filters={'extensions': ['md']})
+
+def test_round_trip_and_stats(cache):
+    key = sift.query_cache.make_key('apple')
+    assert cache.get(7, key) is None
+    cache.put(7, key, RESULTS)
+    assert cache.get(7, key) == RESULTS
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'entries': 1}
+
+def test_new_index_version_invalidates(cache):
+    cache.put(7, 'apple', RESULTS)
+    assert cache.get(8, 'apple') is None
+    cache.put(8, 'banana', [])
+    # entries of older versions are dropped
+    assert cache.stats()['entries'] == 1
+
+def test_evicts_least_recently_used(cache):
+    cache.put(7, 'a', [])
+    cache.put(7, 'b', [])
+    assert cache.get(7, 'a') == []
+    cache.put(7, 'c', [])
+    assert cache.get(7, 'a') == [] and cache.get(7, 'c') == []
+    assert cache.get(7, 'b') is None
+
+def test_persists_across_processes(tmpdir):
+    with sift.query_cache.open_cache(str(tmpdir), max_entries=10) as cache:
+        cache.put(7, 'apple', RESULTS)
+        cache.get(7, 'apple')
+    with sift.query_cache.open_cache(str(tmpdir), max_entries=10) as cache:
+        assert cache.get(7, 'apple') == RESULTS
+        assert cache.stats()['hits'] == 2
+
+def test_cached_search(cache, mocker):
+    index_manager = mocker.MagicMock()
+    index_manager.version.return_value = 7
+    index_manager.search.return_value = RESULTS
+    assert sift.query_cache.cached_search(index_manager, cache, 'apple', n_hits=3) == RESULTS
+    assert sift.query_cache.cached_search(index_manager, cache, ' apple', n_hits=3) == RESULTS
+    index_manager.search.assert_called_once_with('apple', n_hits=3, filters=None, offset=0, fields=None)
+    # a commit was picked up
+    index_manager.version.return_value = 8
+    sift.query_cache.cached_search(index_manager, cache, 'apple', n_hits=3)
+    assert index_manager.search.call_count == 2
+
+def test_lookups_write_best_effort(tmpdir):
+    """
+    Lookups are written in batches, and skipped for later while another process holds the write lock.
+    """
+    with sift.query_cache.open_cache(str(tmpdir), max_entries=10) as cache, \
+            sift.query_cache.open_cache(str(tmpdir), max_entries=10) as other:
+        cache.put(7, 'apple', RESULTS)
+        assert cache.get(7, 'apple') == RESULTS
+        assert other.stats()['hits'] == 0
+        other.connection.execute('BEGIN IMMEDIATE')
+        assert cache.stats()['hits'] == 1
+        other.connection.rollback()
+        assert cache.pending_counts['hits'] == 1
+        cache.stats()
+        assert other.stats()['hits'] == 1
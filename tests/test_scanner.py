@@ -0,0 +1,130 @@
+import os
+import time
+from sift.scanner import scan_tree, scan_tree_pruned, match_extension, parent_directory
+
+def test_match_extension_prefers_longest():
+    extensions = {'gz', 'tar.gz', 'md'}
+    assert match_extension('archive.tar.gz', extensions) == 'tar.gz'
+    assert match_extension('notes.gz', extensions) == 'gz'
+    assert match_extension('notes.md', extensions) == 'md'
+    assert match_extension('notes.md.bak', extensions) is None
+    assert match_extension('README', extensions) is None
+
+def test_scan_tree_prunes_ignored_paths(tmpdir):
+    """
+    Files under ignored directories are never visited; other files are routed by extension.
+    """
+    tmpdir.join('a.txt').write('a')
+    tmpdir.mkdir('sub').mkdir('deeper').join('b.md').write('b')
+    tmpdir.mkdir('.siftindex').join('c.txt').write('c')
+    tmpdir.join('d.jpg').write('d')
+    base = str(tmpdir)
+    results = sorted(scan_tree(base, ['txt', 'md']))
+    assert [(fname, extension) for fname, extension, _ in results] == [
+        (base + '/a.txt', 'txt'),
+        (base + '/sub/deeper/b.md', 'md'),
+    ]
+    assert results[0][2] == tmpdir.join('a.txt').mtime()
+
+def test_scan_tree_relative_to_current_directory(tmpdir):
+    tmpdir.join('a.txt').write('a')
+    with tmpdir.as_cwd():
+        assert [fname for fname, _, __ in scan_tree('.', ['txt'])] == ['a.txt']
+
+def test_scan_tree_sorted_by_full_path(tmpdir):
+    """
+    Output is in full path string order, which the streaming diff relies on.
+    Note "a.txt" < "a/b.txt" because "." < "/".
+    """
+    tmpdir.mkdir('a').join('b.txt').write('')
+    tmpdir.join('a.txt').write('')
+    tmpdir.join('a-c.txt').write('')
+    tmpdir.join('B.txt').write('')
+    tmpdir.mkdir('a b').join('c.txt').write('')
+    fnames = [fname for fname, _, __ in scan_tree(str(tmpdir), ['txt'])]
+    assert fnames == sorted(fnames)
+    assert len(fnames) == 5
+
+def age_directories(tmpdir):
+    """Set directory modified times in the past, so scans trust them."""
+    past = time.time() - 100
+    for path in [tmpdir] + list(tmpdir.visit(fil=lambda p: p.check(dir=1))):
+        os.utime(str(path), (past, past))
+
+def test_parent_directory():
+    assert parent_directory('a/b/') == 'a/'
+    assert parent_directory('a/') == ''
+
+def test_scan_tree_pruned(tmpdir):
+    """
+    A pruned scan finds the same files as a full one, but only lists directories whose modified time changed.
+    """
+    tmpdir.join('a.txt').write('a')
+    tmpdir.mkdir('sub').mkdir('deeper').join('b.txt').write('b')
+    tmpdir.join('sub').join('c.txt').write('c')
+    tmpdir.mkdir('old').join('d.txt').write('d')
+    age_directories(tmpdir)
+    base = str(tmpdir)
+    prefix = os.path.join(base, '')
+
+    observed = {}
+    first_scan = list(scan_tree_pruned(base, ['txt'], {}, [], observed))
+    assert first_scan == list(scan_tree(base, ['txt']))
+    assert sorted(observed) == [prefix, prefix + 'old/', prefix + 'sub/', prefix + 'sub/deeper/']
+
+    # nothing changed: no directory is listed again
+    known_directories = observed
+    observed = {}
+    known_files = [(fname, last_mod) for fname, _, last_mod in first_scan]
+    assert list(scan_tree_pruned(base, ['txt'], known_directories, known_files, observed)) == first_scan
+    assert observed == {}
+
+    # a new file deep in the tree, a removed directory
+    tmpdir.join('sub').join('deeper').join('e.txt').write('e')
+    tmpdir.join('old').remove()
+    # changed in place: the directory's modified time doesn't change, so the change isn't seen
+    tmpdir.join('sub').join('c.txt').write('changed')
+    tmpdir.join('sub').join('c.txt').setmtime(time.time() + 10)
+    observed = {}
+    results = list(scan_tree_pruned(base, ['txt'], known_directories, known_files, observed))
+    assert [fname for fname, _, __ in results] == [prefix + 'a.txt', prefix + 'sub/c.txt', prefix + 'sub/deeper/b.txt', prefix + 'sub/deeper/e.txt']
+    assert results[1] == first_scan[2]
+    # just modified directories are listed again next time
+    assert observed == {prefix: None, prefix + 'old/': None, prefix + 'sub/deeper/': None}
+
+def test_scan_tree_pruned_lists_forgotten_subdirectories(tmpdir):
+    """
+    A subdirectory whose modified time wasn't saved (changed too recently, or forgotten for a failed import)
+    is listed from disk even though its parent is unchanged: its files aren't reported gone.
+    """
+    tmpdir.mkdir('t').mkdir('sub').join('x.txt').write('x')
+    tmpdir.join('t').join('z.txt').write('z')
+    age_directories(tmpdir)
+    base = str(tmpdir)
+    prefix = os.path.join(base, '')
+    tmpdir.join('t').join('sub').join('y.txt').write('y')
+
+    observed = {}
+    first_scan = list(scan_tree_pruned(base, ['txt'], {}, [], observed))
+    assert observed[prefix + 't/sub/'] is None
+    known_directories = {directory: mtime for directory, mtime in observed.items() if mtime is not None}
+    known_files = [(fname, last_mod) for fname, _, last_mod in first_scan]
+    observed = {}
+    assert list(scan_tree_pruned(base, ['txt'], known_directories, known_files, observed)) == first_scan
+    assert list(observed) == [prefix + 't/sub/']
+
+    # ... and once it is gone, only its files are
+    tmpdir.join('t').join('sub').remove()
+    results = list(scan_tree_pruned(base, ['txt'], known_directories, known_files, {}))
+    assert [fname for fname, _, __ in results] == [prefix + 't/z.txt']
+
+def test_root_prefix_normalized(tmpdir):
+    """
+    File names don't depend on how the base path is spelled, and match the str(Path) form of older indexes.
+    """
+    from sift.scanner import root_prefix
+    assert root_prefix('./d') == root_prefix('d/') == root_prefix('d//') == 'd/'
+    assert root_prefix('.') == root_prefix('./') == ''
+    tmpdir.mkdir('d').join('a.txt').write('a')
+    with tmpdir.as_cwd():
+        assert [fname for fname, _, __ in scan_tree('./d/', ['txt'])] == ['d/a.txt']
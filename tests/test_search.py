@@ -0,0 +1,68 @@
+import sift.search
+import json
+from datetime import datetime
+from pytest import raises
+
+def test_parse_date():
+    assert sift.search.parse_date('2019-02-28') == datetime(2019, 2, 28).timestamp()
+    assert sift.search.parse_date('2019-02-28T22:17') == datetime(2019, 2, 28, 22, 17).timestamp()
+    assert sift.search.parse_date('30d', now=1551400000) == 1551400000 - 30 * 86400
+    assert sift.search.parse_date('2w', now=1551400000) == 1551400000 - 14 * 86400
+    # relative to the current minute, so repeated queries share a cache key
+    assert sift.search.parse_date('30d') % 60 == 0
+    with raises(ValueError):
+        sift.search.parse_date('last month')
+
+def test_make_filters():
+    assert sift.search.make_filters() is None
+    assert sift.search.make_filters(after_date=1.5, extensions=['.MD', 'pdf'], path_prefix='./notes/') == {
+        'after': 1.5,
+        'extensions': ['md', 'pdf'],
+        'path_prefix': 'notes/',
+    }
+
+def test_make_filters_path_prefix_under_index_root():
+    """
+    Keys start with the index path when it isn't the current directory, so prefixes given relative to it must too.
+    """
+    assert sift.search.make_filters(path_prefix='books/', index_loc='/data') == {'path_prefix': '/data/books/'}
+    assert sift.search.make_filters(path_prefix='./books/', index_loc='data/') == {'path_prefix': 'data/books/'}
+    assert sift.search.make_filters(path_prefix='books/', index_loc='./') == {'path_prefix': 'books/'}
+
+def test_iter_query_through_server(mocker):
+    """
+    All results are streamed from a query server over one connection, uncached; limited queries are one cached request.
+    """
+    hits = [{'fullpath': 'file%d.txt' % i} for i in range(12)]
+    stream = mocker.patch.object(sift.search.server, 'stream', side_effect=lambda index_loc, terms, offset, **kwargs: iter(hits[offset:]))
+    query = mocker.patch.object(sift.search.server, 'query', side_effect=lambda index_loc, terms, n_hits, offset, **kwargs: hits[offset:offset + n_hits])
+
+    assert list(sift.search.iter_query('.', 'file', offset=2, limit=None)) == hits[2:]
+    assert stream.call_count == 1 and query.call_count == 0
+    assert list(sift.search.iter_query('.', 'file', offset=3, limit=4)) == hits[3:7]
+    assert stream.call_count == 1 and query.call_count == 1
+
+RESULTS = [
+    {'fullpath': 'notes/a.md', 'last_modified_time': '1551400000', 'score': 1.5},
+    {'fullpath': 'b c.pdf', 'last_modified_time': '1551300000', 'score': 0.5},
+]
+
+def test_machine_output_formats():
+    assert ''.join(sift.search.format_results(RESULTS, 'ndjson')) == (
+        '{"path": "notes/a.md", "mtime": 1551400000, "score": 1.5}\n'
+        '{"path": "b c.pdf", "mtime": 1551300000, "score": 0.5}\n'
+    )
+    assert json.loads(''.join(sift.search.format_results(RESULTS, 'json'))) == [
+        {'path': 'notes/a.md', 'mtime': 1551400000, 'score': 1.5},
+        {'path': 'b c.pdf', 'mtime': 1551300000, 'score': 0.5},
+    ]
+    assert json.loads(''.join(sift.search.format_results([], 'json'))) == []
+    assert ''.join(sift.search.format_results(RESULTS, 'paths0')) == 'notes/a.md\0b c.pdf\0'
+    with_snippet = dict(RESULTS[0], excerpt='*apple* pie')
+    assert json.loads(next(sift.search.format_results([with_snippet], 'ndjson')))['snippet'] == '*apple* pie'
+
+def test_result_fields():
+    # no excerpts, so no highlighting, unless snippets are asked for
+    assert 'excerpt' not in sift.search.result_fields('ndjson')
+    assert 'excerpt' in sift.search.result_fields('json', snippet=True)
+    assert sift.search.result_fields('paths0') == ['fullpath']
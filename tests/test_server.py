@@ -0,0 +1,97 @@
+import sift.server
+import sift.lucene_manager
+import threading
+from pytest import fixture, raises
+
+@fixture
+def index_manager(mocker):
+    manager = mocker.MagicMock()
+    manager.search.return_value = [{'fullpath': 'a.md', 'last_modified_time': '1551400000', 'score': 1.5, 'excerpt': '*apple*'}]
+    return manager
+
+@fixture
+def running_server(tmpdir, index_manager):
+    tmpdir.mkdir('.siftindex')
+    server = sift.server.QueryServer(sift.server.get_socket_path(str(tmpdir)), index_manager)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+def test_query_through_server(tmpdir, running_server, index_manager):
+    """
+    Queries are answered by the server, which refreshes its reader first.
+    """
+    results = sift.server.query(str(tmpdir), 'apple', n_hits=3)
+    assert results == index_manager.search.return_value
+    index_manager.refresh.assert_called_once()
+    index_manager.search.assert_called_once_with('apple', n_hits=3, filters=None, offset=0, fields=sift.lucene_manager.RESULT_FIELDS)
+
+def test_query_filters_through_server(tmpdir, running_server, index_manager):
+    filters = {'after': 1551400000.0, 'extensions': ['md'], 'path_prefix': 'notes/'}
+    sift.server.query(str(tmpdir), 'apple', filters=filters, offset=10, fields=['fullpath'])
+    index_manager.search.assert_called_once_with('apple', n_hits=5, filters=filters, offset=10, fields=['fullpath'])
+
+def test_query_errors_are_reported(tmpdir, running_server, index_manager):
+    index_manager.search.side_effect = ValueError('bad query')
+    with raises(RuntimeError, match='bad query'):
+        sift.server.query(str(tmpdir), 'apple')
+
+def test_stream_through_server(tmpdir, running_server, index_manager, mocker):
+    """
+    All results come over one connection, a page at a time, without going through the query cache.
+    """
+    mocker.patch.object(sift.server, 'STREAM_PAGE_SIZE', 3)
+    hits = [{'fullpath': 'file%d.txt' % i} for i in range(7)]
+    index_manager.iter_search.return_value = iter(hits)
+    assert list(sift.server.stream(str(tmpdir), 'apple', offset=2, fields=['fullpath'])) == hits
+    index_manager.iter_search.assert_called_once_with('apple', filters=None, offset=2, fields=['fullpath'])
+    index_manager.search.assert_not_called()
+    assert running_server.streams == 0
+
+def test_stream_errors_are_reported(tmpdir, running_server, index_manager):
+    index_manager.iter_search.side_effect = ValueError('bad query')
+    with raises(RuntimeError, match='bad query'):
+        list(sift.server.stream(str(tmpdir), 'apple'))
+
+def test_stalled_client_does_not_block_queries(tmpdir, running_server, index_manager):
+    """
+    A client that connects and never sends a request only holds up its own connection.
+    """
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled_client:
+        stalled_client.connect(str(sift.server.get_socket_path(str(tmpdir))))
+        assert sift.server.query(str(tmpdir), 'apple') == index_manager.search.return_value
+
+def test_server_drops_idle_clients(tmpdir, running_server, mocker):
+    import socket
+    mocker.patch.object(sift.server.QueryHandler, 'timeout', 0.1)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle_client:
+        idle_client.settimeout(5)
+        idle_client.connect(str(sift.server.get_socket_path(str(tmpdir))))
+        assert idle_client.recv(1) == b''
+
+def test_query_without_server(tmpdir):
+    """
+    No server running: caller should fall back to searching in-process.
+    """
+    assert sift.server.query(str(tmpdir), 'apple') is None
+    assert sift.server.stream(str(tmpdir), 'apple') is None
+    # stale socket file
+    tmpdir.mkdir('.siftindex').join('query.sock').write('')
+    assert sift.server.query(str(tmpdir), 'apple') is None
+    assert sift.server.stream(str(tmpdir), 'apple') is None
+
+def test_query_server_not_answering(tmpdir, mocker):
+    """
+    A server that accepts connections but doesn't answer times out, and the caller searches in-process.
+    """
+    import socket
+    tmpdir.mkdir('.siftindex')
+    mocker.patch.object(sift.server, 'CLIENT_TIMEOUT_SECONDS', 0.1)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as hung_server:
+        hung_server.bind(str(sift.server.get_socket_path(str(tmpdir))))
+        hung_server.listen(1)
+        assert sift.server.query(str(tmpdir), 'apple') is None
@@ -1,9 +1,8 @@
 import sift.status
+import sift.hashing
+from sift.status import FileRecord, Change
 import time
 import pytest
-import pandas as pd
-import numpy as np
-from pandas.testing import assert_frame_equal
 
 @pytest.fixture
 def mock_importer(mocker):
@@ -32,162 +31,95 @@ def mock_index():
             strategy_versions = [1.0 for i in range(len(names))]
         assert len(names) == len(times) == len(
             strategies) == len(strategy_versions)
-        # specify dtypes so that string NaNs become None not np.nan
-        return pd.DataFrame({
-            'fname': pd.Series(names, dtype='str'),
-            'last_mod': pd.Series(times, dtype='float'),
-            'strategy': pd.Series(strategies, dtype='str'),
-            'strategy_version': pd.Series(strategy_versions, dtype='float'),
-            'extension': pd.Series(extensions, dtype='str'),
-        }).set_index('fname')
+        return [FileRecord(*fields) for fields in zip(names, times, strategies, strategy_versions, extensions)]
     return _mock_index
 
 
-def test_make_plan_from_scratch(mocker, filetype_strategies, mock_index):
+def test_make_plan_from_scratch(tmpdir, filetype_strategies, mock_index):
     """
-    Confirm make_plan_from_scratch returns whitelisted extensions only with appropriate importer metadata.
+    Confirm make_plan_from_scratch returns whitelisted extensions only with appropriate importer metadata, sorted by file name.
     """
-    mocker.patch.object(sift.status, 'file_list')
+    tmpdir.join('test.txt').write('text')
+    tmpdir.mkdir('notes').join('test.md').write('# markdown')
+    tmpdir.join('test.jpg').write('not whitelisted')
+    tmpdir.mkdir('.siftindex').join('ignored.txt').write('ignored path')
     common_time = time.time()
-    sift.status.file_list.side_effect = [
-        # return value for first execution
-        [
-            {
-                'fname': 'test.txt',
-                'last_mod': common_time
-            }
-        ],
-        # return value for second execution
-        [
-            {
-                'fname': 'test.md',
-                'last_mod': common_time
-            }
-        ],
-        # return value for third execution
-        [],
-    ]
-    assert_frame_equal(
-        sift.status.make_plan_from_scratch('.', filetype_strategies),
-        mock_index(
-            names=['test.txt', 'test.md'],
-            times=[common_time, common_time],
-            extensions=['txt', 'md'],
-            strategies=['TextImporter', 'MarkdownImporter'],
-            strategy_versions=[1.0, 3.0]
-        )
+    for path in tmpdir.visit(fil=lambda p: p.check(file=1)):
+        path.setmtime(common_time)
+    base = str(tmpdir)
+    assert list(sift.status.make_plan_from_scratch(base, filetype_strategies)) == mock_index(
+        names=[base + '/notes/test.md', base + '/test.txt'],
+        times=[tmpdir.join('test.txt').mtime()] * 2,
+        extensions=['md', 'txt'],
+        strategies=['MarkdownImporter', 'TextImporter'],
+        strategy_versions=[3.0, 1.0]
     )
 
-def test_make_plan_from_scratch_empty_directory_dtypes(mocker, filetype_strategies, mock_index):
+def test_make_plan_from_scratch_empty_directory(tmpdir, filetype_strategies):
     """
-    Confirm make_plan_from_scratch returns the right dtypes when there are no files.
+    Confirm make_plan_from_scratch returns an empty plan when there are no files.
     """
-    mocker.patch.object(sift.status, 'file_list')
-    sift.status.file_list.return_value = []
-    assert_frame_equal(
-        sift.status.make_plan_from_scratch('.', filetype_strategies),
-        mock_index([], [], []) # correct dtypes specified here
-    )
-
-
-# expected column order
-diff_plan_expected_column_order = [
-    'last_mod_old', 'strategy_old', 'strategy_version_old', 'extension_old',
-    'last_mod_new', 'strategy_new', 'strategy_version_new', 'extension_new',
-    '_merge',
-]
-expected_empty_diffplan_shape = (0, len(diff_plan_expected_column_order))
-def empty_diffplan(plan):
-    return plan.shape == expected_empty_diffplan_shape
+    assert list(sift.status.make_plan_from_scratch(str(tmpdir), filetype_strategies)) == []
 
 
 ###########
+# expected changes, shared with test_update
 
+def expected_new_file_change(common_time):
+    return Change('new_files', 'new_file.txt', None, FileRecord('new_file.txt', common_time, 'MyImporter', 1.0, 'txt'))
 
-def expected_new_file_df(common_time):
-    return pd.DataFrame({
-            'fname': ['new_file.txt'],
-            'last_mod_old': [np.nan],  # float
-            'last_mod_new': [common_time],
-            'strategy_old': [None],  # object
-            'strategy_new': ['MyImporter'],
-            'strategy_version_old': [np.nan],  # float
-            'strategy_version_new': [1.0],
-            'extension_old': [None],
-            'extension_new': ['txt'],
-            '_merge': pd.Series(
-                ['right_only'],
-                dtype=pd.api.types.CategoricalDtype(
-                    categories=['left_only', 'right_only', 'both'], ordered=False)
-            )
-        }).set_index('fname')[diff_plan_expected_column_order]
+def expected_unchanged_file_change(common_time):
+    record = FileRecord('unchanged_file.txt', common_time, 'MyImporter', 1.0, 'txt')
+    return Change('unchanged', 'unchanged_file.txt', record, record)
 
-def test_diff_work_new_files(mock_index):
-    """
-    Confirm diff_work_between_plans produces proper classifications on synthetic plans, in this case with a new file.
-    """
-    common_time = time.time()
-    old_index = mock_index([], [], [])
-    new_index = mock_index(['new_file.txt'], [common_time], ['txt'])
+def expected_removed_file_change(common_time):
+    return Change('deleted_files', 'deleted_file.txt', FileRecord('deleted_file.txt', common_time, 'MyImporter', 1.0, 'txt'), None)
 
-    diff_work = sift.status.diff_work_between_plans(old_index, new_index)
-    print(diff_work['new_files'])
+def expected_updated_file_change(common_time):
+    return Change(
+        'updated_files',
+        'updated_file.txt',
+        FileRecord('updated_file.txt', common_time - 1000, 'MyImporter', 1.0, 'txt'),
+        FileRecord('updated_file.txt', common_time, 'MyImporter', 1.0, 'txt')
+    )
 
-    assert_frame_equal(
-        diff_work['new_files'],
-        expected_new_file_df(common_time)
+def expected_diff_strategy_change(common_time):
+    return Change(
+        'diff_strategy',
+        'diff_strategy.txt',
+        FileRecord('diff_strategy.txt', common_time, 'UnspecializedImporter', 2.0, 'txt'),
+        FileRecord('diff_strategy.txt', common_time, 'SpecializedImporter', 3.0, 'txt') # this version should not interfere!
     )
 
-    assert empty_diffplan(diff_work['unchanged'])
-    assert empty_diffplan(diff_work['deleted_files'])
-    assert empty_diffplan(diff_work['updated_files'])
-    assert empty_diffplan(diff_work['diff_strategy'])
-    assert empty_diffplan(diff_work['newer_strategy'])
+def expected_newer_strategy_change(common_time):
+    return Change(
+        'newer_strategy',
+        'newer_strategy.txt',
+        FileRecord('newer_strategy.txt', common_time, 'MyImporter', 1.0, 'txt'),
+        FileRecord('newer_strategy.txt', common_time, 'MyImporter', 2.0, 'txt')
+    )
 
 ###########
 
+def diff(old_index, new_index):
+    return list(sift.status.diff_work_between_plans(old_index, new_index))
 
-def expected_unchanged_file_df(common_time):
-    return pd.DataFrame({
-        'fname': ['unchanged_file.txt'],
-        'last_mod_old': [common_time],
-        'last_mod_new': [common_time],
-        'strategy_old': ['MyImporter'],
-        'strategy_new': ['MyImporter'],
-        'strategy_version_old': [1.0],
-        'strategy_version_new': [1.0],
-        'extension_old': ['txt'],
-        'extension_new': ['txt'],
-        '_merge': pd.Series(
-            ['both'],
-            dtype=pd.api.types.CategoricalDtype(
-                categories=['left_only', 'right_only', 'both'], ordered=False)
-        )
-    }).set_index('fname')[diff_plan_expected_column_order]
+def test_diff_work_new_files(mock_index):
+    """
+    Confirm diff_work_between_plans produces proper classifications on synthetic plans, in this case with a new file.
+    """
+    common_time = time.time()
+    old_index = mock_index([], [], [])
+    new_index = mock_index(['new_file.txt'], [common_time], ['txt'])
+    assert diff(old_index, new_index) == [expected_new_file_change(common_time)]
 
 def test_diff_work_unchanged_file(mock_index):
     """
-    Confirm diff_work_between_plans produces proper classifications on synthetic plans, in this case with a new file.
+    Confirm diff_work_between_plans produces proper classifications on synthetic plans, in this case with an unchanged file.
     """
     common_time = time.time()
     index = mock_index(['unchanged_file.txt'], [common_time], ['txt'])
-
-    diff_work = sift.status.diff_work_between_plans(index, index)
-
-    assert empty_diffplan(diff_work['new_files'])
-    assert empty_diffplan(diff_work['deleted_files'])
-    assert empty_diffplan(diff_work['updated_files'])
-    assert empty_diffplan(diff_work['diff_strategy'])
-    assert empty_diffplan(diff_work['newer_strategy'])
-
-    assert_frame_equal(
-        diff_work['unchanged'],
-        expected_unchanged_file_df(common_time)
-    )
-
-###########
-
-
+    assert diff(index, index) == [expected_unchanged_file_change(common_time)]
 
 def test_diff_work_new_and_unchanged_files(mock_index):
     """
@@ -195,76 +127,11 @@ def test_diff_work_new_and_unchanged_files(mock_index):
     """
     common_time = time.time()
     old_index = mock_index(['unchanged_file.txt'], [common_time], ['txt'])
-    new_index = mock_index(['unchanged_file.txt', 'new_file.txt'], [common_time, common_time], ['txt', 'txt'])
-
-    diff_work = sift.status.diff_work_between_plans(old_index, new_index)
-
-    assert_frame_equal(
-        diff_work['new_files'],
-        pd.DataFrame({
-            'fname': ['new_file.txt'],
-            'last_mod_old': [np.nan], # float
-            'last_mod_new': [common_time],
-            'strategy_old': [None], # object
-            'strategy_new': ['MyImporter'],
-            'strategy_version_old': [np.nan], # float
-            'strategy_version_new': [1.0],
-            'extension_old': [None],
-            'extension_new': ['txt'],
-            '_merge': pd.Series(
-                ['right_only'],
-                dtype=pd.api.types.CategoricalDtype(
-                    categories=['left_only', 'right_only', 'both'], ordered=False)
-            )
-        }).set_index('fname')[diff_plan_expected_column_order]
-    )
-
-    assert empty_diffplan(diff_work['deleted_files'])
-    assert empty_diffplan(diff_work['updated_files'])
-    assert empty_diffplan(diff_work['diff_strategy'])
-    assert empty_diffplan(diff_work['newer_strategy'])
-
-    assert_frame_equal(
-        diff_work['unchanged'],
-        pd.DataFrame({
-            'fname': ['unchanged_file.txt'],
-            'last_mod_old': [common_time],
-            'last_mod_new': [common_time],
-            'strategy_old': ['MyImporter'],
-            'strategy_new': ['MyImporter'],
-            'strategy_version_old': [1.0],
-            'strategy_version_new': [1.0],
-            'extension_old': ['txt'],
-            'extension_new': ['txt'],
-            '_merge': pd.Series(
-                ['both'],
-                dtype=pd.api.types.CategoricalDtype(
-                    categories=['left_only', 'right_only', 'both'], ordered=False)
-            )
-        }).set_index('fname')[diff_plan_expected_column_order]
-    )
-
-
-###########
-
-def expected_removed_file_df(common_time):
-    return pd.DataFrame({
-        'fname': ['deleted_file.txt'],
-        'last_mod_old': [common_time],
-        'last_mod_new': [np.nan],  # float
-        'strategy_new': [None],  # object
-        'strategy_old': ['MyImporter'],
-        'strategy_version_new': [np.nan],  # float
-        'strategy_version_old': [1.0],
-        'extension_new': [None],
-        'extension_old': ['txt'],
-        '_merge': pd.Series(
-            ['left_only'],
-            dtype=pd.api.types.CategoricalDtype(
-                categories=['left_only', 'right_only', 'both'], ordered=False)
-        )
-    }).set_index('fname')[diff_plan_expected_column_order]
-
+    new_index = mock_index(['new_file.txt', 'unchanged_file.txt'], [common_time, common_time], ['txt', 'txt'])
+    assert diff(old_index, new_index) == [
+        expected_new_file_change(common_time),
+        expected_unchanged_file_change(common_time),
+    ]
 
 def test_diff_work_removed_only_file(mock_index):
     """
@@ -273,22 +140,7 @@ def test_diff_work_removed_only_file(mock_index):
     common_time = time.time()
     old_index = mock_index(['deleted_file.txt'], [common_time], ['txt'])
     new_index = mock_index([], [], [])
-
-    diff_work = sift.status.diff_work_between_plans(old_index, new_index)
-
-    assert_frame_equal(
-        diff_work['deleted_files'],
-        expected_removed_file_df(common_time)
-    )
-
-    assert empty_diffplan(diff_work['new_files'])
-    assert empty_diffplan(diff_work['updated_files'])
-    assert empty_diffplan(diff_work['diff_strategy'])
-    assert empty_diffplan(diff_work['newer_strategy'])
-    assert empty_diffplan(diff_work['unchanged'])
-
-
-###########
+    assert diff(old_index, new_index) == [expected_removed_file_change(common_time)]
 
 def test_diff_work_removed_and_unchanged_files(mock_index):
     """
@@ -298,73 +150,11 @@ def test_diff_work_removed_and_unchanged_files(mock_index):
     old_index = mock_index(['permanent_file.txt', 'temporary_file.txt'], [
                            common_time, common_time], ['txt', 'txt'])
     new_index = mock_index(['permanent_file.txt'], [common_time], ['txt'])
-
-    diff_work = sift.status.diff_work_between_plans(old_index, new_index)
-
-    assert_frame_equal(
-        diff_work['deleted_files'],
-        pd.DataFrame({
-            'fname': ['temporary_file.txt'],
-            'last_mod_old': [common_time],
-            'last_mod_new': [np.nan],  # float
-            'strategy_new': [None],  # object
-            'strategy_old': ['MyImporter'],
-            'strategy_version_new': [np.nan],  # float
-            'strategy_version_old': [1.0],
-            'extension_old': ['txt'],
-            'extension_new': [None],
-            '_merge': pd.Series(
-                ['left_only'],
-                dtype=pd.api.types.CategoricalDtype(
-                    categories=['left_only', 'right_only', 'both'], ordered=False)
-            )
-        }).set_index('fname')[diff_plan_expected_column_order]
-    )
-
-    assert empty_diffplan(diff_work['new_files'])
-    assert empty_diffplan(diff_work['updated_files'])
-    assert empty_diffplan(diff_work['diff_strategy'])
-    assert empty_diffplan(diff_work['newer_strategy'])
-
-    assert_frame_equal(
-        diff_work['unchanged'],
-        pd.DataFrame({
-            'fname': ['permanent_file.txt'],
-            'last_mod_old': [common_time],
-            'last_mod_new': [common_time],
-            'strategy_old': ['MyImporter'],
-            'strategy_new': ['MyImporter'],
-            'strategy_version_old': [1.0],
-            'strategy_version_new': [1.0],
-            'extension_old': ['txt'],
-            'extension_new': ['txt'],
-            '_merge': pd.Series(
-                ['both'],
-                dtype=pd.api.types.CategoricalDtype(
-                    categories=['left_only', 'right_only', 'both'], ordered=False)
-            )
-        }).set_index('fname')[diff_plan_expected_column_order]
-    )
-
-###########
-
-def expected_updated_files_df(common_time):
-    return pd.DataFrame({
-        'fname': ['updated_file.txt'],
-        'last_mod_old': [common_time - 1000],
-        'last_mod_new': [common_time],
-        'strategy_new': ['MyImporter'],
-        'strategy_old': ['MyImporter'],
-        'strategy_version_new': [1.0],
-        'strategy_version_old': [1.0],
-        'extension_old': ['txt'],
-        'extension_new': ['txt'],
-        '_merge': pd.Series(
-            ['both'],
-            dtype=pd.api.types.CategoricalDtype(
-                categories=['left_only', 'right_only', 'both'], ordered=False)
-        )
-    }).set_index('fname')[diff_plan_expected_column_order]
+    permanent = FileRecord('permanent_file.txt', common_time, 'MyImporter', 1.0, 'txt')
+    assert diff(old_index, new_index) == [
+        Change('unchanged', 'permanent_file.txt', permanent, permanent),
+        Change('deleted_files', 'temporary_file.txt', FileRecord('temporary_file.txt', common_time, 'MyImporter', 1.0, 'txt'), None),
+    ]
 
 def test_diff_work_updated_files(mock_index):
     """
@@ -373,40 +163,16 @@ def test_diff_work_updated_files(mock_index):
     common_time = time.time()
     old_index = mock_index(['updated_file.txt'], [common_time - 1000], ['txt'])
     new_index = mock_index(['updated_file.txt'], [common_time], ['txt'])
+    assert diff(old_index, new_index) == [expected_updated_file_change(common_time)]
 
-    diff_work = sift.status.diff_work_between_plans(old_index, new_index)
-
-    assert_frame_equal(
-        diff_work['updated_files'],
-        expected_updated_files_df(common_time)
-    )
-
-    assert empty_diffplan(diff_work['new_files'])
-    assert empty_diffplan(diff_work['deleted_files'])
-    assert empty_diffplan(diff_work['diff_strategy'])
-    assert empty_diffplan(diff_work['newer_strategy'])
-    assert empty_diffplan(diff_work['unchanged'])
-
-###########
-
-def expected_diff_strategy_df(common_time):
-    return pd.DataFrame({
-        'fname': ['diff_strategy.txt'],
-        'last_mod_old': [common_time],
-        'last_mod_new': [common_time],
-        'strategy_old': ['UnspecializedImporter'],
-        'strategy_new': ['SpecializedImporter'],
-        'strategy_version_old': [2.0],
-        'strategy_version_new': [3.0], # this should not interfere!
-        'extension_old': ['txt'],
-        'extension_new': ['txt'],
-        '_merge': pd.Series(
-            ['both'],
-            dtype=pd.api.types.CategoricalDtype(
-                categories=['left_only', 'right_only', 'both'], ordered=False)
-        )
-    }).set_index('fname')[diff_plan_expected_column_order]
-
+def test_diff_work_older_modified_time_is_updated(mock_index):
+    """
+    A file replaced by an older copy (e.g. restored from backup) still needs re-importing.
+    """
+    common_time = time.time()
+    old_index = mock_index(['restored_file.txt'], [common_time], ['txt'])
+    new_index = mock_index(['restored_file.txt'], [common_time - 1000], ['txt'])
+    assert [change.kind for change in diff(old_index, new_index)] == ['updated_files']
 
 def test_diff_work_diff_strategy(mock_index):
     """
@@ -418,40 +184,7 @@ def test_diff_work_diff_strategy(mock_index):
                            'txt'], ['UnspecializedImporter'], [2.0])
     new_index = mock_index(['diff_strategy.txt'], [common_time], [
                            'txt'], ['SpecializedImporter'], [3.0])
-
-    diff_work = sift.status.diff_work_between_plans(old_index, new_index)
-
-    assert_frame_equal(
-        diff_work['diff_strategy'],
-        expected_diff_strategy_df(common_time)
-    )
-
-    assert empty_diffplan(diff_work['new_files'])
-    assert empty_diffplan(diff_work['deleted_files'])
-    assert empty_diffplan(diff_work['updated_files'])
-    assert empty_diffplan(diff_work['newer_strategy'])
-    assert empty_diffplan(diff_work['unchanged'])
-
-###########
-
-def expected_newer_strategy_df(common_time):
-    return pd.DataFrame({
-        'fname': ['newer_strategy.txt'],
-        'last_mod_old': [common_time],
-        'last_mod_new': [common_time],
-        'strategy_old': ['MyImporter'],
-        'strategy_new': ['MyImporter'],
-        'strategy_version_old': [1.0],
-        'strategy_version_new': [2.0],
-        'extension_old': ['txt'],
-        'extension_new': ['txt'],
-        '_merge': pd.Series(
-            ['both'],
-            dtype=pd.api.types.CategoricalDtype(
-                categories=['left_only', 'right_only', 'both'], ordered=False)
-        )
-    }).set_index('fname')[diff_plan_expected_column_order]
-
+    assert diff(old_index, new_index) == [expected_diff_strategy_change(common_time)]
 
 def test_diff_work_newer_strategy(mock_index):
     """
@@ -462,16 +195,81 @@ def test_diff_work_newer_strategy(mock_index):
                            'txt'], ['MyImporter'], [1.0])
     new_index = mock_index(['newer_strategy.txt'], [common_time], [
                            'txt'], ['MyImporter'], [2.0])
+    assert diff(old_index, new_index) == [expected_newer_strategy_change(common_time)]
 
-    diff_work = sift.status.diff_work_between_plans(old_index, new_index)
+def test_diff_work_is_lazy(mock_index):
+    """
+    Changes are yielded before the new plan has been fully consumed.
+    """
+    common_time = time.time()
+    def new_plan():
+        yield from mock_index(['a.txt'], [common_time], ['txt'])
+        raise AssertionError('plan consumed too eagerly')
+    changes = sift.status.diff_work_between_plans([], new_plan())
+    assert next(changes).fname == 'a.txt'
 
-    assert_frame_equal(
-        diff_work['newer_strategy'],
-        expected_newer_strategy_df(common_time)
-    )
+def test_format_status_skips_unchanged(mock_index):
+    common_time = time.time()
+    changes = [
+        expected_new_file_change(common_time),
+        expected_unchanged_file_change(common_time),
+        expected_diff_strategy_change(common_time),
+    ]
+    assert list(sift.status.format_status(changes)) == [
+        'New: new_file.txt',
+        'New importer available: diff_strategy.txt',
+    ]
+
+def test_hash_changes_detects_touched_files(tmpdir):
+    """
+    Updated files whose content hash didn't change become touched files; hashes are attached to new records.
+    """
+    touched, edited, new = [str(tmpdir.join(name)) for name in ['touched.txt', 'edited.txt', 'new.txt']]
+    for fname in [touched, edited, new]:
+        with open(fname, 'w') as f:
+            f.write('contents of %s' % fname)
+    old_hash = sift.hashing.file_hash(touched)
+    changes = [
+        Change('updated_files', edited, FileRecord(edited, 1.0, 'MyImporter', 1.0, 'txt', old_hash), FileRecord(edited, 2.0, 'MyImporter', 1.0, 'txt')),
+        Change('new_files', new, None, FileRecord(new, 2.0, 'MyImporter', 1.0, 'txt')),
+        Change('updated_files', touched, FileRecord(touched, 1.0, 'MyImporter', 1.0, 'txt', old_hash), FileRecord(touched, 2.0, 'MyImporter', 1.0, 'txt')),
+    ]
+    hashed = list(sift.status.hash_changes(changes, jobs=2))
+    assert [change.kind for change in hashed] == ['updated_files', 'new_files', 'touched_files']
+    assert [change.new.content_hash for change in hashed] == [sift.hashing.file_hash(fname) for fname in [edited, new, touched]]
+    assert hashed[2].new.last_mod == 2.0
 
-    assert empty_diffplan(diff_work['new_files'])
-    assert empty_diffplan(diff_work['deleted_files'])
-    assert empty_diffplan(diff_work['updated_files'])
-    assert empty_diffplan(diff_work['diff_strategy'])
-    assert empty_diffplan(diff_work['unchanged'])
+def test_status_lists_changed_directories_only(tmpdir, filetype_strategies, mocker):
+    """
+    With prune_directories, once an update saved the directory modified times of its scan, status only lists directories that changed since.
+    """
+    import os
+    import sift.metadata_manager, sift.scanner, sift.update
+    base = str(tmpdir)
+    sift.metadata_manager.create_index(base)
+    tmpdir.join('a.txt').write('a')
+    tmpdir.mkdir('sub').join('b.txt').write('b')
+    past = time.time() - 100
+    for path in [base, base + '/sub']:
+        os.utime(path, (past, past))
+
+    directories = {}
+    work_plan = list(sift.status.status(base, filetype_strategies, directories=directories))
+    assert [change.kind for change in work_plan] == [sift.status.NEW_FILE] * 2
+    with sift.metadata_manager.open_store(base) as store:
+        store.upsert(change.new for change in work_plan)
+        sift.update.save_directories(store, directories, filetype_strategies, [])
+
+    tmpdir.join('sub').join('c.txt').write('c')
+    listed = mocker.spy(sift.scanner, '_sorted_entries')
+    pending = list(sift.status.pending_changes(sift.status.status(base, filetype_strategies, prune_directories=True)))
+    assert [(change.kind, change.fname) for change in pending] == [(sift.status.NEW_FILE, base + '/sub/c.txt')]
+    assert [call[0][0] for call in listed.call_args_list] == [base + '/sub/']
+
+    # a full scan lists everything, and so does a scan for other extensions
+    listed.reset_mock()
+    list(sift.status.status(base, filetype_strategies))
+    assert listed.call_count == 2
+    listed.reset_mock()
+    list(sift.status.status(base, {'txt': filetype_strategies['txt']}, prune_directories=True))
+    assert listed.call_count == 2
@@ -0,0 +1,49 @@
+import sift.text_cache
+import random
+from pytest import fixture
+
+@fixture
+def cache(tmpdir):
+    with sift.text_cache.open_cache(str(tmpdir), max_bytes=10 * 1024) as cache:
+        yield cache
+
+def test_round_trip(cache):
+    cache.put('blake2b:aa', 'PandocImporter', 1.0, 'Some text — with unicode')
+    assert cache.get('blake2b:aa', 'PandocImporter', 1.0) == 'Some text — with unicode'
+    # keyed by importer and version too
+    assert cache.get('blake2b:aa', 'PandocImporter', 2.0) is None
+    assert cache.get('blake2b:aa', 'TextImporter', 1.0) is None
+    assert cache.get('blake2b:bb', 'PandocImporter', 1.0) is None
+
+def test_keyed_by_text_limit(cache):
+    """
+    Text cut to one max_indexed_bytes isn't served for another.
+    """
+    cache.put('blake2b:aa', 'TextImporter', 1.0, 'text', text_limit=4)
+    assert cache.get('blake2b:aa', 'TextImporter', 1.0, text_limit=4) == 'text'
+    assert cache.get('blake2b:aa', 'TextImporter', 1.0, text_limit=1024) is None
+    assert cache.get('blake2b:aa', 'TextImporter', 1.0) is None
+
+def test_persists(tmpdir):
+    with sift.text_cache.open_cache(str(tmpdir), max_bytes=1024) as cache:
+        cache.put('blake2b:aa', 'TextImporter', 1.0, 'text')
+    with sift.text_cache.open_cache(str(tmpdir), max_bytes=1024) as cache:
+        assert cache.get('blake2b:aa', 'TextImporter', 1.0) == 'text'
+
+def test_evicts_least_recently_used(cache):
+    """
+    Once over the size limit, entries not used recently are evicted first.
+    """
+    def incompressible(seed):
+        # ~3kB compressed
+        rng = random.Random(seed)
+        return ''.join(chr(rng.randrange(0x4e00, 0x9fff)) for _ in range(1500))
+    for i in range(3):
+        cache.put('hash%d' % i, 'TextImporter', 1.0, incompressible(i))
+    # touch the oldest entry so it becomes the most recently used
+    assert cache.get('hash0', 'TextImporter', 1.0) is not None
+    cache.put('hash3', 'TextImporter', 1.0, incompressible(3))
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.get('hash1', 'TextImporter', 1.0) is None
+    assert cache.get('hash0', 'TextImporter', 1.0) is not None
+    assert cache.get('hash3', 'TextImporter', 1.0) is not None
@@ -1,10 +1,13 @@
-import pandas as pd
 import test_status
+import os
 import time
 from pytest import fixture, mark
-import sift.update, sift.metadata_manager
+import sift.update, sift.metadata_manager, sift.lucene_manager, sift.text_cache, sift.status, sift.hashing
 import itertools
 
+# modified time of files written by tests
+MTIME = 1551400000.0
+
 @fixture
 def indexdir(tmpdir):
     sift.metadata_manager.create_index(str(tmpdir))
@@ -13,22 +16,27 @@ def indexdir(tmpdir):
 @fixture
 def mock_index_manager(mocker):
     # mock out lucene manager so we don't run on empty documents
-    return mocker.patch('sift.lucene_manager.LuceneManager',  autospec=True)
+    index_manager = mocker.create_autospec(sift.lucene_manager.LuceneManager, instance=True)
+    index_manager.last_commit_data.return_value = {}
+    return index_manager
 
 @fixture
 def diff_plan():
     common_time = time.time()
-    return {
-        'unchanged': test_status.expected_unchanged_file_df(common_time),
-        'deleted_files': test_status.expected_removed_file_df(common_time),
-        'updated_files': test_status.expected_updated_files_df(common_time),
-        'diff_strategy': test_status.expected_diff_strategy_df(common_time),
-        'newer_strategy': test_status.expected_newer_strategy_df(common_time),
-        'new_files': test_status.expected_new_file_df(common_time),
-    }
+    return [
+        test_status.expected_unchanged_file_change(common_time),
+        test_status.expected_removed_file_change(common_time),
+        test_status.expected_updated_file_change(common_time),
+        test_status.expected_diff_strategy_change(common_time),
+        test_status.expected_newer_strategy_change(common_time),
+        test_status.expected_new_file_change(common_time),
+    ]
 
 def get_filenames(diff_plan, keys):
-    return pd.concat([diff_plan[key] for key in keys]).index.unique()
+    return [change.fname for change in diff_plan if change.kind in keys]
+
+def get_change(diff_plan, fname):
+    return next(change for change in diff_plan if change.fname == fname)
 
 def extract_from_call(call, arg_index):
     # call objects are (args, kwargs) tuples
@@ -65,7 +73,7 @@ def test_strategy_run_calls(indexdir, mock_index_manager, mocker, diff_plan):
     for k in keys_incorrect:
         assert k not in keys_expected
 
-    sift.update.update(indexdir, mock_index_manager, diff_plan)
+    sift.update.update(indexdir, mock_index_manager, iter(diff_plan))
     filepaths = [extract_filename_from_perform_single_file_call(c) for c in sift.update.perform_single_file.call_args_list]
     assert_lists_equal(filepaths, keys_expected)
 
@@ -79,7 +87,7 @@ def test_index_manager_calls_depending_on_delete(indexdir, mock_index_manager, m
     # mock file performer so we don't make real documents
     # instead return just the key so we can track where this key goes
     mocker.patch.object(sift.update, 'perform_single_file')
-    sift.update.perform_single_file.side_effect = lambda strategies, extension, file_path, modified_time: file_path
+    sift.update.perform_single_file.side_effect = lambda strategies, extension, file_path, modified_time, **kwargs: file_path
     # we also mocked lucene manager so we can measure -- mock_index_manager
 
     # we expect insert() on these filenames
@@ -100,7 +108,7 @@ def test_index_manager_calls_depending_on_delete(indexdir, mock_index_manager, m
         assert_lists_have_no_shared_elements(a, b)
 
     # run
-    sift.update.update(indexdir, mock_index_manager, diff_plan, delete=delete, verbose=True)
+    sift.update.update(indexdir, mock_index_manager, iter(diff_plan), delete=delete, verbose=True)
 
     filepaths_insert = [extract_filename_from_index_call(c) for c in mock_index_manager.insert.call_args_list]
     assert_lists_equal(filepaths_insert, insert_expected)
@@ -114,13 +122,216 @@ def test_index_manager_calls_depending_on_delete(indexdir, mock_index_manager, m
     else:
         mock_index_manager.delete.assert_not_called()
 
-def test_summarize_new_index_status():
+def test_failed_imports_do_not_stop_batch(indexdir, mock_index_manager, mocker, diff_plan):
+    """
+    A file whose importer raises is reported, the rest of the batch is still indexed,
+    and the failed file keeps its previous metadata so it is retried next time.
+    """
+    failing_updated = get_filenames(diff_plan, ['updated_files'])[0]
+    failing_new = get_filenames(diff_plan, ['new_files'])[0]
+    def fake_perform_single_file(strategies, extension, file_path, modified_time, **kwargs):
+        if file_path in [failing_updated, failing_new]:
+            raise ValueError('importer crashed')
+        return file_path
+    mocker.patch.object(sift.update, 'perform_single_file')
+    sift.update.perform_single_file.side_effect = fake_perform_single_file
+    last_mod_old = get_change(diff_plan, failing_updated).old.last_mod
+    sift.metadata_manager.update_file_data(indexdir, failing_updated, last_mod_old, 'MyImporter', 1.0, 'txt')
+
+    failures = sift.update.update(indexdir, mock_index_manager, iter(diff_plan), jobs=2)
+
+    assert_lists_equal(list(failures.keys()), [failing_updated, failing_new])
+    filepaths_update = [extract_filename_from_index_call(c) for c in mock_index_manager.update.call_args_list]
+    assert_lists_equal(filepaths_update, get_filenames(diff_plan, ['newer_strategy', 'diff_strategy']))
+    mock_index_manager.insert.assert_not_called()
+
+    new_details = sift.metadata_manager.last_index_details(indexdir)
+    assert failing_new not in new_details.index
+    assert new_details.loc[failing_updated, 'last_mod'] == last_mod_old
+
+@mark.parametrize("delete", [False, True])
+def test_metadata_changes(indexdir, mock_index_manager, mocker, diff_plan, delete):
     """
-    summarize_new_index_status handles synthetic diff plans and respects delete_missing.
-    TODO
+    Only imported files are written to the metadata store, and deleted files are forgotten only if specified.
     """
-    pass
+    mocker.patch.object(sift.update, 'perform_single_file')
+    for change in diff_plan:
+        if change.old is not None:
+            sift.metadata_manager.update_file_data(indexdir, *change.old)
+
+    sift.update.update(indexdir, mock_index_manager, iter(diff_plan), delete=delete)
+
+    details = sift.metadata_manager.last_index_details(indexdir)
+    expected_fnames = get_filenames(diff_plan, ['new_files', 'updated_files', 'diff_strategy', 'newer_strategy', 'unchanged'])
+    if not delete:
+        expected_fnames += get_filenames(diff_plan, ['deleted_files'])
+    assert_lists_equal(list(details.index), expected_fnames)
+    for fname in details.index:
+        change = get_change(diff_plan, fname)
+        expected = change.new if change.new is not None else change.old
+        assert details.loc[fname, 'strategy'] == expected.strategy
+        assert details.loc[fname, 'last_mod'] == expected.last_mod
+
+def test_periodic_commits_save_metadata(indexdir, mock_index_manager, mocker, diff_plan):
+    """
+    Every commit of the index saves the metadata of the files it covers, tagged with the same generation.
+    """
+    mocker.patch.object(sift.update, 'perform_single_file')
+    saved_at_commit = []
+    def fake_commit(user_data):
+        # metadata of the previous commits must already be saved, this commit's not yet
+        saved_at_commit.append((user_data, sift.metadata_manager.last_index_details(indexdir).shape[0]))
+    mock_index_manager.commit.side_effect = fake_commit
+
+    sift.update.update(indexdir, mock_index_manager, iter(diff_plan), delete=True, commit_every_docs=2, jobs=1)
+
+    # 1 deleted file (that wasn't in the metadata) and 4 imported files, committed 2 at a time, then the rest
+    assert saved_at_commit == [
+        ({'sift.generation': 1}, 0),
+        ({'sift.generation': 2}, 1),
+        ({'sift.generation': 3}, 3),
+    ]
+    with sift.metadata_manager.open_store(indexdir) as store:
+        assert store.get_property('sift.generation') == '3'
+        assert store.count() == 4
+
+def test_recover_interrupted_update(indexdir, mock_index_manager, mocker, diff_plan):
+    """
+    If the index has a newer commit than the metadata, the last update was interrupted after committing the index:
+    new files may already be indexed, so they are replaced rather than inserted twice.
+    """
+    mocker.patch.object(sift.update, 'perform_single_file')
+    sift.update.perform_single_file.side_effect = lambda strategies, extension, file_path, modified_time, **kwargs: file_path
+    mock_index_manager.last_commit_data.return_value = {'sift.generation': '5'}
+    with sift.metadata_manager.open_store(indexdir) as store:
+        store.set_property('sift.generation', 4)
+
+    sift.update.update(indexdir, mock_index_manager, iter(diff_plan))
+
+    mock_index_manager.insert.assert_not_called()
+    filepaths_update = [extract_filename_from_index_call(c) for c in mock_index_manager.update.call_args_list]
+    assert_lists_equal(filepaths_update, get_filenames(diff_plan, ['new_files', 'newer_strategy', 'diff_strategy', 'updated_files']))
+    mock_index_manager.commit.assert_called_once_with({'sift.generation': 6})
+
+def test_touched_files_update_metadata_only(indexdir, mock_index_manager, mocker):
+    mocker.patch.object(sift.update, 'perform_single_file')
+    common_time = time.time()
+    updated = test_status.expected_updated_file_change(common_time)
+    touched = updated._replace(kind='touched_files', new=updated.new._replace(content_hash='blake2b:00'))
+
+    sift.update.update(indexdir, mock_index_manager, iter([touched]))
+
+    sift.update.perform_single_file.assert_not_called()
+    mock_index_manager.update.assert_not_called()
+    with sift.metadata_manager.open_store(indexdir) as store:
+        assert store.get(touched.fname) == tuple(touched.new)
+
+def test_perform_single_file_uses_text_cache(tmpdir, mocker):
+    """
+    Importer output is reused for identical content, e.g. a copied file, but not across importer versions.
+    """
+    mocker.patch.object(sift.update, 'make_document', side_effect=lambda file_path, modified_time, contents, **kwargs: contents)
+    importer = mocker.MagicMock()
+    importer.__name__ = 'MyImporter'
+    importer.version = 1.0
+    importer.return_value.run_stream.side_effect = lambda file_path: iter(['imported ', file_path])
+    original, copy = str(tmpdir.join('original.txt')), str(tmpdir.join('copy.txt'))
+    for fname in [original, copy]:
+        with open(fname, 'w') as f:
+            f.write('same contents')
+        os.utime(fname, (MTIME, MTIME))
+
+    with sift.text_cache.open_cache(str(tmpdir), max_bytes=1024 * 1024) as cache:
+        assert sift.update.perform_single_file({'txt': importer}, 'txt', original, MTIME, text_cache=cache) == 'imported %s' % original
+        assert sift.update.perform_single_file({'txt': importer}, 'txt', copy, MTIME, text_cache=cache) == 'imported %s' % original
+        assert importer.return_value.run_stream.call_count == 1
+        importer.version = 2.0
+        assert sift.update.perform_single_file({'txt': importer}, 'txt', copy, MTIME, text_cache=cache) == 'imported %s' % copy
+        assert importer.return_value.run_stream.call_count == 2
+        # text cut to a smaller max_bytes isn't reused once the limit is raised
+        assert sift.update.perform_single_file({'txt': importer}, 'txt', copy, MTIME, text_cache=cache, max_bytes=4) == 'impo'
+        assert sift.update.perform_single_file({'txt': importer}, 'txt', copy, MTIME, text_cache=cache, max_bytes=4096) == 'imported %s' % copy
+        assert importer.return_value.run_stream.call_count == 4
+
+def test_text_cache_skips_files_changed_since_hashed(tmpdir, mocker):
+    """
+    Output of a file modified after its content hash was computed, or while it was imported, isn't cached under that hash.
+    """
+    mocker.patch.object(sift.update, 'make_document', side_effect=lambda file_path, modified_time, contents, **kwargs: contents)
+    fname = str(tmpdir.join('a.txt'))
+    def import_and_edit(file_path):
+        with open(file_path, 'a') as f:
+            f.write(' and more')
+        yield 'imported'
+    importer = mocker.MagicMock()
+    importer.__name__ = 'MyImporter'
+    importer.version = 1.0
+    importer.return_value.run_stream.side_effect = import_and_edit
+    with open(fname, 'w') as f:
+        f.write('contents')
+    os.utime(fname, (MTIME, MTIME))
+    content_hash = sift.hashing.file_hash(fname)
+
+    with sift.text_cache.open_cache(str(tmpdir), max_bytes=1024 * 1024) as cache:
+        # edited while imported
+        sift.update.perform_single_file({'txt': importer}, 'txt', fname, MTIME, text_cache=cache, content_hash=content_hash)
+        assert cache.get(content_hash, 'MyImporter', 1.0) is None
+        with open(fname, 'w') as f:
+            f.write('contents')
+        os.utime(fname, (MTIME, MTIME))
+        importer.return_value.run_stream.side_effect = lambda file_path: iter(['imported'])
+        # modified after it was scanned (and hashed)
+        sift.update.perform_single_file({'txt': importer}, 'txt', fname, MTIME - 10, text_cache=cache, content_hash=content_hash)
+        assert cache.get(content_hash, 'MyImporter', 1.0) is None
+        sift.update.perform_single_file({'txt': importer}, 'txt', fname, MTIME, text_cache=cache, content_hash=content_hash)
+        assert cache.get(content_hash, 'MyImporter', 1.0) == 'imported'
+
+def test_batched_importer(indexdir, mock_index_manager, mocker):
+    """
+    Strategies with batch_size > 1 import files through run_batch(), and a file that fails only fails itself.
+    """
+    mocker.patch.object(sift.update, 'make_document', side_effect=lambda file_path, modified_time, contents, **kwargs: contents)
+    importer = mocker.MagicMock()
+    importer.__name__ = 'MyImporter'
+    importer.batch_size = 2
+    importer.return_value.run_batch.side_effect = lambda full_paths: [
+        ValueError('importer crashed') if full_path == 'c.md' else 'imported %s' % full_path for full_path in full_paths]
+    common_time = time.time()
+    changes = [
+        sift.status.Change('new_files', fname, None, sift.status.FileRecord(fname, common_time, 'MyImporter', 1.0, 'md'))
+        for fname in ['a.md', 'b.md', 'c.md']
+    ]
+
+    failures = sift.update.update(indexdir, mock_index_manager, iter(changes), strategies={'md': importer}, jobs=2)
+
+    assert list(failures.keys()) == ['c.md']
+    assert [c[0][0] for c in importer.return_value.run_batch.call_args_list] == [['a.md', 'b.md'], ['c.md']]
+    assert_lists_equal([extract_filename_from_index_call(c) for c in mock_index_manager.insert.call_args_list],
+                       ['imported a.md', 'imported b.md'])
+    assert_lists_equal(list(sift.metadata_manager.last_index_details(indexdir).index), ['a.md', 'b.md'])
+
+def test_update_saves_scanned_directories(indexdir, mock_index_manager, mocker):
+    """
+    Directory modified times from the scan are saved, except for directories with changes left to do.
+    """
+    def fake_perform_single_file(strategies, extension, file_path, modified_time, **kwargs):
+        if file_path.startswith('failing/'):
+            raise ValueError('importer crashed')
+        return file_path
+    mocker.patch.object(sift.update, 'perform_single_file')
+    sift.update.perform_single_file.side_effect = fake_perform_single_file
+    common_time = time.time()
+    work_plan = [
+        sift.status.Change(sift.status.NEW_FILE, fname, None, sift.status.FileRecord(fname, common_time, 'TextImporter', 1.0, 'txt'))
+        for fname in ['failing/a.txt', 'ok/b.txt']
+    ]
+    directories = {'': 1.0, 'failing/': 2.0, 'ok/': 3.0}
+
+    sift.update.update(indexdir, mock_index_manager, iter(work_plan), directories=directories)
+
+    with sift.metadata_manager.open_store(indexdir) as store:
+        assert store.get_directories() == {'': 1.0, 'ok/': 3.0}
+        assert store.get_property(sift.status.SCANNED_EXTENSIONS_KEY) == sift.status.scanned_extensions(sift.update.IMPORTER_REGISTRY)
 
 # TODO:
-# test perform_single_file
 # test update with some real files
@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import namedtuple
+from pytest import fixture
+import sift.watch, sift.metadata_manager, sift.status, sift.update
+from sift.importers.text_importer import TextImporter
+
+# the attributes of watchdog events that sift uses
+Event = namedtuple('Event', ['event_type', 'src_path', 'is_directory', 'dest_path'], defaults=[None])
+
+STRATEGIES = {'txt': TextImporter}
+
+@fixture
+def indexdir(tmpdir):
+    sift.metadata_manager.create_index(str(tmpdir))
+    return str(tmpdir)
+
+def record(fname, last_mod):
+    return sift.status.FileRecord(fname, last_mod, 'TextImporter', TextImporter.version, 'txt')
+
+def test_collector(indexdir):
+    collector = sift.watch.ChangeCollector(indexdir)
+    root = os.path.abspath(indexdir)
+    collector.dispatch(Event('modified', os.path.join(root, 'a.txt'), False))
+    collector.dispatch(Event('moved', os.path.join(root, 'old'), True, os.path.join(root, 'new')))
+    # not changes: opened files, directory modified times, the index itself, paths outside the tree
+    collector.dispatch(Event('opened', os.path.join(root, 'b.txt'), False))
+    collector.dispatch(Event('modified', os.path.join(root, 'old'), True))
+    collector.dispatch(Event('modified', os.path.join(root, '.siftindex', 'metadata.db'), False))
+    collector.dispatch(Event('created', os.path.join(os.path.dirname(root), 'c.txt'), False))
+    assert collector.wait(0)
+
+    prefix = os.path.join(indexdir, '')
+    assert collector.take() == ({prefix + 'a.txt'}, {prefix + 'old', prefix + 'new'})
+    assert not collector.wait(0)
+    assert collector.take() == (set(), set())
+
+def test_collector_debounce(indexdir):
+    collector = sift.watch.ChangeCollector(indexdir)
+    collector.dispatch(Event('created', os.path.join(indexdir, 'a.txt'), False))
+    assert 0 < collector.quiet_for(10) <= 10
+    collector.take()
+    assert collector.quiet_for(10) == 0
+
+def test_plan_changes(indexdir, tmpdir):
+    prefix = os.path.join(indexdir, '')
+    tmpdir.join('new.txt').write('new')
+    tmpdir.join('updated.txt').write('updated')
+    tmpdir.join('ignored.bin').write('ignored')
+    tmpdir.mkdir('moved_here').join('c.txt').write('c')
+    updated_mod = os.stat(prefix + 'updated.txt').st_mtime
+    c_mod = os.stat(prefix + 'moved_here/c.txt').st_mtime
+    with sift.metadata_manager.open_store(indexdir) as store:
+        store.upsert([
+            record(prefix + 'updated.txt', updated_mod - 10),
+            record(prefix + 'deleted.txt', 1.0),
+            record(prefix + 'moved_away/c.txt', c_mod),
+        ])
+        work_plan = sift.watch.plan_changes(
+            store,
+            {prefix + name for name in ['new.txt', 'updated.txt', 'deleted.txt', 'ignored.bin', 'never_indexed.txt']},
+            {prefix + 'moved_away', prefix + 'moved_here'},
+            STRATEGIES)
+
+    assert [(change.kind, change.fname) for change in work_plan] == [
+        (sift.status.DELETED_FILE, prefix + 'deleted.txt'),
+        (sift.status.DELETED_FILE, prefix + 'moved_away/c.txt'),
+        (sift.status.NEW_FILE, prefix + 'moved_here/c.txt'),
+        (sift.status.NEW_FILE, prefix + 'new.txt'),
+        (sift.status.UPDATED_FILE, prefix + 'updated.txt'),
+    ]
+    assert work_plan[-1].new == record(prefix + 'updated.txt', updated_mod)
+
+def test_watch_reconciles_on_start(indexdir, tmpdir, mocker):
+    """
+    Without file system events, watch finds changes with full scans, and hands them to update.
+    """
+    tmpdir.join('a.txt').write('a')
+    mocker.patch.object(sift.watch, 'Observer', None)
+    stop_event = threading.Event()
+    def update(index_loc, index_manager, work_plan, **kwargs):
+        stop_event.set()
+        return {os.path.join(indexdir, 'a.txt'): ValueError('failed')}
+    mock_update = mocker.patch.object(sift.update, 'update', side_effect=update)
+    index_manager = mocker.Mock()
+
+    failures = sift.watch.watch(indexdir, index_manager, strategies=STRATEGIES, stop_event=stop_event, commit_every_docs=10)
+
+    args, kwargs = mock_update.call_args
+    assert args[1] is index_manager
+    assert [(change.kind, change.fname) for change in args[2]] == [(sift.status.NEW_FILE, os.path.join(indexdir, 'a.txt'))]
+    assert kwargs['commit_every_docs'] == 10
+    assert list(failures.keys()) == [os.path.join(indexdir, 'a.txt')]